@@ -0,0 +1,174 @@
+import hashlib
+import os
+from typing import Callable, List, Optional, Sequence, Tuple
+import numpy as np
+
+RowVectors = Callable[[np.ndarray], np.ndarray]
+
+
+def _normalize(matrix: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    return matrix / np.where(norms == 0, 1, norms)
+
+
+class IVFIndex:
+    def __init__(self, centroids: np.ndarray, offsets: np.ndarray, rows: np.ndarray,
+                 n_probe: int = 8, key: str = "") -> None:
+        """
+        Initialize the IVFIndex class (inverted file index). The vectors are
+        clustered around `len(centroids)` centroids; a search scores the
+        centroids, then only the vectors of the `n_probe` closest clusters.
+        Raising `n_probe` trades latency for recall.
+
+        :param centroids: Normalized cluster centroids, shape (n_lists, dim)
+        :param offsets: Start of every cluster in `rows`, shape (n_lists + 1,)
+        :param rows: Vector rows grouped by cluster
+        :param n_probe: Number of clusters scanned per query
+        :param key: Identifies the node set the index was built for
+        """
+        self.centroids = centroids
+        self.offsets = offsets
+        self.rows = rows
+        self.n_probe = n_probe
+        self.key = key
+
+    @property
+    def n_lists(self) -> int:
+        return len(self.centroids)
+
+    @staticmethod
+    def node_key(node_ids: Sequence[str]) -> str:
+        return hashlib.sha256("\n".join(node_ids).encode()).hexdigest()
+
+    @staticmethod
+    def _assign(vectors: np.ndarray, centroids: np.ndarray) -> np.ndarray:
+        return np.argmax(vectors @ centroids.T, axis=1)
+
+    @classmethod
+    def train(cls, vectors: RowVectors, n: int, n_lists: int = 0, n_probe: int = 8, iterations: int = 10,
+              sample_per_list: int = 32, chunk_rows: int = 65536, seed: int = 0, key: str = "") -> "IVFIndex":
+        """
+        Cluster the vectors with spherical k-means on a sample, then assign
+        every vector to its closest centroid.
+
+        :param vectors: Returns the normalized vectors of the given rows
+        :param n: Number of vectors
+        :param n_lists: Number of clusters (4 * sqrt(n) if 0)
+        :param n_probe: Number of clusters scanned per query
+        :param iterations: k-means iterations
+        :param sample_per_list: Training vectors per cluster
+        :param chunk_rows: Vectors assigned per step, bounding temporary memory
+        :param seed: Random seed
+        :param key: Identifies the node set the index is built for
+        :return: IVFIndex instance
+        """
+        rng = np.random.default_rng(seed)
+        n_lists = max(1, min(n_lists or int(4 * np.sqrt(n)), n))
+        sample = vectors(np.sort(rng.choice(n, min(n, n_lists * sample_per_list), replace=False)))
+        centroids = sample[rng.choice(len(sample), n_lists, replace=False)]
+        for _ in range(iterations):
+            assignment = cls._assign(sample, centroids)
+            order = np.argsort(assignment, kind="stable")
+            counts = np.bincount(assignment, minlength=n_lists)
+            filled = np.flatnonzero(counts)
+            sums = np.add.reduceat(sample[order], np.concatenate([[0], np.cumsum(counts)[:-1]])[filled])
+            centroids = centroids.copy()
+            centroids[filled] = _normalize(sums)
+
+        assignment = np.empty(n, dtype=np.int64)
+        for start in range(0, n, chunk_rows):
+            rows = np.arange(start, min(start + chunk_rows, n))
+            assignment[start:start + len(rows)] = cls._assign(vectors(rows), centroids)
+        rows = np.argsort(assignment, kind="stable").astype(np.int64)
+        offsets = np.concatenate([[0], np.cumsum(np.bincount(assignment, minlength=n_lists))]).astype(np.int64)
+        return cls(centroids.astype(np.float32), offsets, rows, n_probe=n_probe, key=key)
+
+    def save(self, path: str) -> None:
+        """
+        Atomically write the index to an .npz file.
+
+        :param path: File path
+        """
+        tmp_path = f"{path}.tmp-{os.getpid()}.npz"
+        np.savez(tmp_path, centroids=self.centroids, offsets=self.offsets, rows=self.rows, key=np.array(self.key))
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str, n_probe: int = 8) -> Optional["IVFIndex"]:
+        """
+        Load an index written by `save`.
+
+        :param path: File path
+        :param n_probe: Number of clusters scanned per query
+        :return: IVFIndex instance, or None if there is no such file
+        """
+        if not os.path.exists(path):
+            return None
+        with np.load(path) as data:
+            return cls(data["centroids"], data["offsets"], data["rows"], n_probe=n_probe, key=str(data["key"]))
+
+    def search(self, query: np.ndarray, top_k: int, vectors: RowVectors,
+               mask: Optional[np.ndarray] = None) -> List[Tuple[int, float]]:
+        """
+        Approximate cosine similarity search. With a filter mask, the number
+        of probed clusters is divided by the share of allowed rows, so about
+        as many allowed rows are scored as an unfiltered search scores; when
+        that would scan more rows than the filter allows, the allowed rows are
+        scored exactly instead. More clusters are probed until `top_k` rows remain.
+
+        :param query: Normalized query embedding
+        :param top_k: Number of rows to return
+        :param vectors: Returns the normalized vectors of the given rows
+        :param mask: Boolean mask of the allowed rows
+        :return: List of (row, score), best first
+        """
+        n = len(self.rows)
+        n_probe = self.n_probe
+        if mask is not None:
+            allowed = int(mask.sum())
+            n_probe = int(np.ceil(self.n_probe * n / max(allowed, 1)))
+        if mask is not None and n_probe * n / self.n_lists >= allowed:
+            candidates = np.flatnonzero(mask)
+        else:
+            centroid_scores = self.centroids @ query
+            n_probe = min(n_probe, self.n_lists)
+            while True:
+                lists = np.argpartition(-centroid_scores, n_probe - 1)[:n_probe]
+                candidates = np.concatenate([self.rows[self.offsets[i]:self.offsets[i + 1]] for i in lists])
+                if mask is not None:
+                    candidates = candidates[mask[candidates]]
+                if len(candidates) >= top_k or n_probe == self.n_lists:
+                    break
+                n_probe = min(n_probe * 2, self.n_lists)
+        if len(candidates) == 0:
+            return []
+        scores = vectors(candidates) @ query
+        k = min(top_k, len(candidates))
+        best = np.argpartition(-scores, k - 1)[:k]
+        best = best[np.argsort(-scores[best])]
+        return [(int(candidates[i]), float(scores[i])) for i in best]
+
+
+def build_ivf_index(node_ids: Sequence[str], vectors: RowVectors, path: Optional[str] = None, n_lists: int = 0,
+                    n_probe: int = 8, min_vectors: int = 10000) -> Optional[IVFIndex]:
+    """
+    Load the IVF index persisted at `path` if it was built for these nodes
+    with this `n_lists`, otherwise train one (and persist it when `path` is given).
+
+    :param node_ids: Node IDs in row order
+    :param vectors: Returns the normalized vectors of the given rows
+    :param path: File to persist the index to
+    :param n_lists: Number of clusters (4 * sqrt(n) if 0)
+    :param n_probe: Number of clusters scanned per query
+    :param min_vectors: Below this many vectors an exact scan is used (returns None)
+    :return: IVFIndex instance, or None when the corpus is too small to benefit
+    """
+    if len(node_ids) < min_vectors:
+        return None
+    key = f"{IVFIndex.node_key(node_ids)}:{n_lists}"
+    index = IVFIndex.load(path, n_probe=n_probe) if path else None
+    if index is None or index.key != key:
+        index = IVFIndex.train(vectors, len(node_ids), n_lists=n_lists, n_probe=n_probe, key=key)
+        if path:
+            index.save(path)
+    return index
@@ -0,0 +1,104 @@
+import threading
+from collections import OrderedDict
+from dataclasses import asdict, dataclass, field
+from typing import Any, Dict, List, Optional, Sequence
+from llama_index.core.schema import NodeWithScore
+
+
+@dataclass
+class Source:
+    node_id: str
+    score: Optional[float]
+    page_label: Optional[str] = None
+    file_name: Optional[str] = None
+    text: Optional[str] = None
+
+
+@dataclass
+class Answer:
+    response: str
+    tool: Optional[str] = None
+    sources: List[Source] = field(default_factory=list)
+
+    def __str__(self) -> str:
+        return self.response
+
+    def to_dict(self) -> Dict[str, Any]:
+        return asdict(self)
+
+
+def sources_from_nodes(nodes: Sequence[NodeWithScore], with_text: bool = False) -> List[Source]:
+    """
+    Describe retrieved nodes by their ID, similarity score, page label and file name.
+
+    :param nodes: Retrieved nodes
+    :param with_text: Include the text of the chunks
+    :return: List of sources
+    """
+    return [
+        Source(
+            node_id=n.node.node_id,
+            score=n.score,
+            page_label=n.node.metadata.get("page_label"),
+            file_name=n.node.metadata.get("file_name"),
+            text=n.node.get_content() if with_text else None,
+        )
+        for n in nodes
+    ]
+
+
+def answer_from_response(response: Any, tool_names: Sequence[str] = (), text: Optional[str] = None) -> Answer:
+    """
+    Build the answer of a query engine response. For a router response the
+    selected tool is read from the selector result it carries.
+
+    :param response: Response or streaming response of a query engine
+    :param tool_names: Names of the tools the router chose from, in order
+    :param text: Answer text, for a streaming response whose tokens were already consumed
+    :return: Answer instance
+    """
+    tool = None
+    selection = (getattr(response, "metadata", None) or {}).get("selector_result")
+    if selection is not None and tool_names:
+        tool = ",".join(tool_names[i] for i in selection.inds if i < len(tool_names))
+    if text is None:
+        text = getattr(response, "response", None) or ""
+    return Answer(response=str(text), tool=tool, sources=sources_from_nodes(response.source_nodes))
+
+
+def answer_from_tool_call(response: Any) -> Answer:
+    """
+    Build the answer of `predict_and_call` from the tool outputs it carries,
+    instead of reflecting over the response's attributes.
+
+    :param response: AgentChatResponse returned by `predict_and_call`
+    :return: Answer instance
+    """
+    outputs = getattr(response, "sources", None) or []
+    nodes = [n for output in outputs for n in getattr(output.raw_output, "source_nodes", None) or []]
+    tool = ",".join(output.tool_name for output in outputs) or None
+    return Answer(response=str(response.response or ""), tool=tool, sources=sources_from_nodes(nodes))
+
+
+class ResultCache:
+    def __init__(self, max_entries: int = 1024) -> None:
+        """
+        Initialize the ResultCache class, the most recent answers by request
+        ID, so their sources can be fetched after the answer was returned.
+
+        :param max_entries: Answers kept before the oldest one is dropped
+        """
+        self.max_entries = max_entries
+        self._answers: "OrderedDict[str, Answer]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def put(self, request_id: str, answer: Answer) -> None:
+        with self._lock:
+            self._answers[request_id] = answer
+            self._answers.move_to_end(request_id)
+            while len(self._answers) > self.max_entries:
+                self._answers.popitem(last=False)
+
+    def get(self, request_id: str) -> Optional[Answer]:
+        with self._lock:
+            return self._answers.get(request_id)
@@ -5,20 +5,72 @@ import sys, os
 
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../../')))
 from backend.app.call_tools import *
+from backend.app.config import (
+    RESPONSE_CACHE_ENABLED, RESPONSE_CACHE_THRESHOLD, RESPONSE_CACHE_TTL, RESPONSE_CACHE_MAX_ENTRIES,
+)
+from llama_index.core import Settings
+from backend.app.index_store import IndexStore
+from backend.app.answers import Answer, answer_from_tool_call
+from backend.app.models import callback_manager, get_embed_model, get_llm
+from backend.app.response_cache import SemanticResponseCache
 
 class Chat:
-    def __init__(self, input_files: List[str]):
-        self.vector_query_tool = VectorQueryTool(input_files=input_files)
+    def __init__(self, input_files: List[str], chunk_size: int = 1024):
+        Settings.llm = get_llm()
+        Settings.callback_manager = callback_manager
+        self.vector_query_tool = VectorQueryTool(input_files=input_files, chunk_size=chunk_size)
         self.vector_tool = self.vector_query_tool.get_tool()
         
         self.get_summary = SummaryTool(nodes=self.vector_query_tool.nodes)
         self.summary_tool = self.get_summary.get_tool()
         
         self.response_handler = ResponseHandler()
+
+        self.index_version = IndexStore.compute_key(input_files, {"chunk_size": chunk_size, "embed_model": get_embed_model().model_name})
+        self.response_cache = SemanticResponseCache(
+            get_embed_model(),
+            similarity_threshold=RESPONSE_CACHE_THRESHOLD,
+            ttl=RESPONSE_CACHE_TTL,
+            max_entries=RESPONSE_CACHE_MAX_ENTRIES,
+        ) if RESPONSE_CACHE_ENABLED else None
     
-    def process_query(self, query: str):
+    def process_query(self, query: str) -> Answer:
+        if self.response_cache is not None:
+            cached = self.response_cache.lookup(query, self.index_version)
+            if cached is not None:
+                return cached
         response = self.response_handler.get_response([self.vector_tool, self.summary_tool], query)
-        answer = self.response_handler.inspect_response(response)
+        answer = answer_from_tool_call(response)
+        if self.response_cache is not None:
+            self.response_cache.store(query, answer, self.index_version)
+        return answer
+
+    def stream_query(self, query: str):
+        if self.response_cache is not None:
+            cached = self.response_cache.lookup(query, self.index_version)
+            if cached is not None:
+                yield str(cached)
+                return
+        stream_fns = {
+            "vector_tool": self.vector_query_tool.stream_query,
+            "summary_tool": self.get_summary.stream_query,
+        }
+        tokens = []
+        for token in self.response_handler.stream_response([self.vector_tool, self.summary_tool], stream_fns, query):
+            tokens.append(token)
+            yield token
+        if self.response_cache is not None:
+            self.response_cache.store(query, Answer(response="".join(tokens)), self.index_version)
+
+    async def aprocess_query(self, query: str) -> Answer:
+        if self.response_cache is not None:
+            cached = await self.response_cache.alookup(query, self.index_version)
+            if cached is not None:
+                return cached
+        response = await self.response_handler.aget_response([self.vector_tool, self.summary_tool], query)
+        answer = answer_from_tool_call(response)
+        if self.response_cache is not None:
+            await self.response_cache.astore(query, answer, self.index_version)
         return answer
 
 
@@ -2,41 +2,142 @@ from helpers import get_openai_api_key
 OPENAI_API_KEY = get_openai_api_key()
 
 from helpers import get_openai_api_key
+import os
 from llama_index.core import SimpleDirectoryReader, VectorStoreIndex, SummaryIndex
-from llama_index.core.node_parser import SentenceSplitter
-from llama_index.core.vector_stores import MetadataFilters, FilterCondition
+from llama_index.core.query_engine import RetrieverQueryEngine
 from llama_index.core.tools import FunctionTool, QueryEngineTool
-from llama_index.llms.openai import OpenAI
-from typing import List
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+from backend.app.models import get_embed_model, get_llm
+from backend.app.streaming import response_tokens
+from backend.app.config import (
+    SUMMARY_MODE, SUMMARY_SECTION_SIZE, SUMMARY_CONCURRENCY, SUMMARY_MAX_INPUT_TOKENS, QUERY_ENGINE_POOL_SIZE,
+    INDEX_PERSIST_DIR,
+    RETRIEVAL_MODE, HYBRID_CANDIDATES, RRF_K, BM25_K1, BM25_B,
+    VECTOR_INDEX, IVF_LISTS, IVF_PROBES, IVF_MIN_VECTORS,
+    CONTEXT_BUDGET_ENABLED, CONTEXT_CANDIDATES, CONTEXT_MIN_NODES, CONTEXT_MAX_NODES,
+    CONTEXT_SCORE_GAP, CONTEXT_DEDUP_THRESHOLD, CONTEXT_MMR_LAMBDA, CONTEXT_TOKEN_BUDGET,
+)
+from backend.app.ann import build_ivf_index
+from backend.app.chunking import get_context_postprocessor, get_node_parser
+from backend.app.context_budget import ContextBudgeter
+from backend.app.engine_pool import QueryEnginePool
+from backend.app.instrumentation import span
+from backend.app.hybrid import BM25Index, HybridRetriever
+from backend.app.index_store import IndexStore, SUMMARY_TREE_FILE
+from backend.app.metadata_index import MetadataIndex, MetadataIndexRetriever
+from backend.app.summary_tree import SummaryTree, SummaryTreeQueryEngine
 
 class VectorQueryTool:
-    def __init__(self, input_files: List[str], chunk_size: int = 1024):
+    def __init__(self, input_files: List[str], chunk_size: int = 1024, embed_model=None, similarity_top_k: int = 2):
         self.documents = SimpleDirectoryReader(input_files=input_files).load_data()
-        self.splitter = SentenceSplitter(chunk_size=chunk_size)
+        self.splitter = get_node_parser(chunk_size=chunk_size)
         self.nodes = self.splitter.get_nodes_from_documents(self.documents)
-        self.vector_index = VectorStoreIndex(self.nodes)
-    
+        self.embed_model = get_embed_model(embed_model)
+        self.vector_index = VectorStoreIndex(self.nodes, embed_model=self.embed_model)
+        self.metadata_index = MetadataIndex.from_vector_index(self.vector_index)
+        if VECTOR_INDEX == "ivf":
+            self.metadata_index.ann = build_ivf_index(
+                self.metadata_index.node_ids, self.metadata_index.vectors,
+                n_lists=IVF_LISTS, n_probe=IVF_PROBES, min_vectors=IVF_MIN_VECTORS,
+            )
+        self.bm25_index = BM25Index.from_docstore(self.metadata_index.node_ids, self.vector_index.docstore, k1=BM25_K1, b=BM25_B)
+        self.similarity_top_k = similarity_top_k
+        self.context_postprocessor = get_context_postprocessor()
+        self.context_budgeter = ContextBudgeter(
+            self.metadata_index,
+            min_nodes=CONTEXT_MIN_NODES,
+            max_nodes=CONTEXT_MAX_NODES,
+            score_gap=CONTEXT_SCORE_GAP,
+            dedup_threshold=CONTEXT_DEDUP_THRESHOLD,
+            mmr_lambda=CONTEXT_MMR_LAMBDA,
+            token_budget=CONTEXT_TOKEN_BUDGET,
+        ) if CONTEXT_BUDGET_ENABLED else None
+        self.engine_pool = QueryEnginePool(self.build_query_engine, max_size=QUERY_ENGINE_POOL_SIZE)
+
+    def build_query_engine(self, top_k: int, page_numbers: Tuple[str, ...], streaming: bool = False):
+        postprocessors = [self.context_postprocessor] if self.context_postprocessor is not None else []
+        if self.context_budgeter is not None:
+            # Retrieve more candidates and let the context budget choose among them
+            # (at most `top_k` of them are kept, so the context never grows past what top-k retrieval used)
+            postprocessors.append(self.context_budgeter.for_top_k(top_k))
+            top_k = max(top_k, CONTEXT_CANDIDATES)
+        if RETRIEVAL_MODE == "hybrid":
+            retriever = HybridRetriever(
+                self.metadata_index,
+                self.bm25_index,
+                self.vector_index.docstore,
+                self.embed_model,
+                similarity_top_k=top_k,
+                filters={"page_label": page_numbers},
+                candidate_k=HYBRID_CANDIDATES,
+                rrf_k=RRF_K,
+            )
+        else:
+            retriever = MetadataIndexRetriever(
+                self.metadata_index,
+                self.vector_index.docstore,
+                self.embed_model,
+                similarity_top_k=top_k,
+                filters={"page_label": page_numbers},
+            )
+        return RetrieverQueryEngine.from_args(retriever, streaming=streaming, node_postprocessors=postprocessors)
+
+    def get_query_engine(self, page_numbers: List[str], streaming: bool = False):
+        return self.engine_pool.get(self.similarity_top_k, page_numbers, streaming)
+
     def vector_query(self, query: str, page_numbers: List[str]) -> str:
         """Perform a vector search over an index."""
-        metadata_dicts = [{"key": "page_label", "value": p} for p in page_numbers]
-        query_engine = self.vector_index.as_query_engine(
-            similarity_top_k=2,
-            filters=MetadataFilters.from_dicts(metadata_dicts, condition=FilterCondition.OR)
-        )
-        response = query_engine.query(query)
+        response = self.get_query_engine(page_numbers).query(query)
         return response
+
+    async def avector_query(self, query: str, page_numbers: List[str]) -> str:
+        """Perform a vector search over an index."""
+        response = await self.get_query_engine(page_numbers).aquery(query)
+        return response
+
+    def stream_query(self, query: str, page_numbers: Optional[List[str]] = None) -> Iterator[str]:
+        """Perform a vector search over an index and stream the answer tokens."""
+        response = self.get_query_engine(page_numbers or [], streaming=True).query(query)
+        yield from response_tokens(response)
     
     def get_tool(self):
-        return FunctionTool.from_defaults(name="vector_tool", fn=self.vector_query)
+        return FunctionTool.from_defaults(name="vector_tool", fn=self.vector_query, async_fn=self.avector_query)
 
 
 class SummaryTool:
-    def __init__(self, nodes):
+    def __init__(self, nodes, persist_dir: Optional[str] = None):
+        if SUMMARY_MODE == "tree":
+            # Persisted like the chatbot's tree, so a restart only summarizes the pages that changed
+            files = sorted({node.metadata.get("file_path", "") for node in nodes})
+            self.index_store = IndexStore(
+                persist_dir or IndexStore.default_dir(os.path.join(INDEX_PERSIST_DIR, "tools"), files)
+            )
+            self.summary_tree = SummaryTree.from_dict(
+                self.index_store.read_json(SUMMARY_TREE_FILE),
+                section_size=SUMMARY_SECTION_SIZE,
+                concurrency=SUMMARY_CONCURRENCY,
+                max_input_tokens=SUMMARY_MAX_INPUT_TOKENS,
+            )
+            if self.summary_tree.update(nodes) or self.index_store.read_json(SUMMARY_TREE_FILE) is None:
+                self.index_store.write_json(SUMMARY_TREE_FILE, self.summary_tree.to_dict())
+            self.summary_query_engine = SummaryTreeQueryEngine(tree=self.summary_tree)
+            self.summary_streaming_query_engine = SummaryTreeQueryEngine(tree=self.summary_tree, streaming=True)
+            return
         self.summary_index = SummaryIndex(nodes)
         self.summary_query_engine = self.summary_index.as_query_engine(
             response_mode="tree_summarize",
             use_async=True,
         )
+        self.summary_streaming_query_engine = self.summary_index.as_query_engine(
+            response_mode="tree_summarize",
+            use_async=True,
+            streaming=True,
+        )
+
+    def stream_query(self, input: str) -> Iterator[str]:
+        """Summarize the document and stream the answer tokens."""
+        response = self.summary_streaming_query_engine.query(input)
+        yield from response_tokens(response)
     
     def get_tool(self):
         return QueryEngineTool.from_defaults(
@@ -48,27 +149,32 @@ class SummaryTool:
 
 class ResponseHandler:
     def __init__(self, model="gpt-3.5-turbo", temperature=0):
-        self.llm = OpenAI(model=model, temperature=temperature)
+        self.llm = get_llm(model, temperature)
     
     def get_response(self, tools: List, query: str):
-        response = self.llm.predict_and_call(tools, query, verbose=True)
+        with span("tool"):
+            response = self.llm.predict_and_call(tools, query, verbose=True)
         return response
-    
-    @staticmethod
-    def inspect_response(response):
-        attributes = [attr for attr in dir(response) if not attr.startswith("__")]
-        for attr in attributes:
-            try:
-                value = getattr(response, attr)
-                if not callable(value):
-                    # print(f"{attr}:", "\n", 'XXXXXXXXXXXX', "\n")
-                    # if attr == "response_gen":
-                    #     print('response_gen:', value)
-                    if attr == "response":
-                        # print('Response:', value)
-                        return f'Response: {value}'
-            except AttributeError:
-                print(f"Could not access attribute: {attr}")
+
+    async def aget_response(self, tools: List, query: str):
+        with span("tool"):
+            response = await self.llm.apredict_and_call(tools, query, verbose=True)
+        return response
+
+    def stream_response(self, tools: List, stream_fns: Dict[str, Callable[..., Iterator[str]]], query: str) -> Iterator[str]:
+        """
+        Let the LLM pick a tool like `predict_and_call` does, then stream the
+        selected tool's answer through its entry in `stream_fns`.
+        """
+        if not self.llm.metadata.is_function_calling_model:
+            yield str(self.get_response(tools, query))
+            return
+        chat_response = self.llm.chat_with_tools(tools, query)
+        tool_calls = self.llm.get_tool_calls_from_response(chat_response, error_on_no_tool_call=False)
+        if not tool_calls:
+            yield chat_response.message.content or ""
+            return
+        yield from stream_fns[tool_calls[0].tool_name](**tool_calls[0].tool_kwargs)
 
 
 # if __name__ == "__main__":
@@ -82,6 +188,6 @@ class ResponseHandler:
     
 #     response_handler = ResponseHandler()
 #     response = response_handler.get_response([vector_tool, summary_tool_instance], "Can you please summarize the abstract of the paper.")
-#     answer = response_handler.inspect_response(response)
+#     answer = answer_from_tool_call(response)
 #     print('_________________________________________')
 #     print(answer)
@@ -1,29 +1,92 @@
-from typing import List, Tuple, Any
+import asyncio
+import os
+from typing import List, Tuple, Any, Optional, Iterable, Iterator, Sequence, AsyncIterator, Dict
 from dotenv import load_dotenv
 from helpers import get_openai_api_key
-from llama_index.core import SimpleDirectoryReader, Settings, SummaryIndex, VectorStoreIndex
-from llama_index.core.node_parser import SentenceSplitter
-from llama_index.llms.openai import OpenAI
-from llama_index.embeddings.openai import OpenAIEmbedding
+from llama_index.core import Settings, SummaryIndex, VectorStoreIndex
+from llama_index.core.node_parser import NodeParser
 from llama_index.core.tools import QueryEngineTool
+from llama_index.core.query_engine import RetrieverQueryEngine
 from llama_index.core.query_engine.router_query_engine import RouterQueryEngine
+from llama_index.core.schema import NodeWithScore, QueryBundle
 from llama_index.core.selectors import LLMSingleSelector
+from llama_index.core.base.base_selector import BaseSelector
+from backend.app.config import (
+    LLM_MODEL, INDEX_PERSIST_DIR,
+    RESPONSE_CACHE_ENABLED, RESPONSE_CACHE_THRESHOLD, RESPONSE_CACHE_TTL, RESPONSE_CACHE_MAX_ENTRIES,
+    ROUTER_MODE, ROUTER_MARGIN_THRESHOLD, ROUTER_KEYWORD_BONUS,
+    SUMMARY_MODE, SUMMARY_SECTION_SIZE, SUMMARY_CONCURRENCY, SUMMARY_MAX_INPUT_TOKENS,
+    PARSE_WORKERS, EMBED_BATCH_SIZE, EMBED_CONCURRENCY, BATCH_CONCURRENCY,
+    RETRIEVAL_MODE, HYBRID_CANDIDATES, RRF_K, BM25_K1, BM25_B,
+    VECTOR_STORE, VECTOR_QUANTIZATION, VECTOR_RERANK_FACTOR,
+    VECTOR_INDEX, IVF_LISTS, IVF_PROBES, IVF_MIN_VECTORS,
+    CONTEXT_BUDGET_ENABLED, CONTEXT_CANDIDATES, CONTEXT_MIN_NODES, CONTEXT_MAX_NODES,
+    CONTEXT_SCORE_GAP, CONTEXT_DEDUP_THRESHOLD, CONTEXT_MMR_LAMBDA, CONTEXT_TOKEN_BUDGET,
+)
+from backend.app.fast_selector import FastSelector, SUMMARY_KEYWORDS
+from backend.app.ann import build_ivf_index
+from backend.app.embedding_cache import get_query_embeddings
+from backend.app.hybrid import BM25Index, HybridRetriever
+from backend.app.index_store import IndexStore, SUMMARY_TREE_FILE, BM25_FILE, IVF_FILE
+from backend.app.ingestion import IngestionManifest, PageRecord
+from backend.app.chunking import get_context_postprocessor, get_node_parser, strategy_settings
+from backend.app.context_budget import ContextBudgeter
+from backend.app.answers import Answer, Source, answer_from_response, sources_from_nodes
+from backend.app.models import callback_manager, get_embed_model, get_llm
+from backend.app.response_cache import SemanticResponseCache
+from backend.app.summary_tree import SummaryTree, SummaryTreeQueryEngine
+from backend.app.metadata_index import MetadataIndex, MetadataIndexRetriever
+from backend.app.pipeline import IngestionPipeline
+from backend.app.startup import StartupProgress
+from backend.app.streaming import response_tokens
 
 class LlamaIndexBase:
-    def __init__(self, input_files: List[str]) -> None:
+    def __init__(self, input_files: List[str], persist_dir: Optional[str] = None,
+                 progress: Optional[StartupProgress] = None) -> None:
         """
         Initialize the LlamaIndexBase class.
 
         :param input_files: List of input file paths
+        :param persist_dir: Directory to persist the indices to (derived from the input files if not given)
+        :param progress: Receives the progress of the load, split, embed and index stages
         """
+        self.progress = progress or StartupProgress()
         self.load_environment()
         self.OPENAI_API_KEY = self.get_api_key()
-        self.documents = self.load_documents(input_files)
-        self.nodes = self.split_documents(self.documents)
         self.setup_models()
-        self.summary_index, self.vector_index = self.create_indices(self.nodes)
+        self.pipeline = self.create_pipeline()
+        self.input_files = input_files
+        self.index_store = IndexStore(
+            persist_dir or IndexStore.default_dir(INDEX_PERSIST_DIR, input_files),
+            vector_store=VECTOR_STORE,
+            quantization=VECTOR_QUANTIZATION,
+            rerank_factor=VECTOR_RERANK_FACTOR,
+        )
+        self.settings_key = IndexStore.compute_settings_key(self.index_settings())
+        self.index_key = IndexStore.compute_key(input_files, self.index_settings())
+        if self.index_store.matches(self.index_key):
+            self.progress.skip("load", "split", "embed")
+        self.pages: List[PageRecord] = []
+        self.progress.start("index")
+        if self.index_store.matches_settings(self.settings_key):
+            self.summary_index, self.vector_index = self.create_indices([])
+        else:
+            nodes = self.pipeline.run(input_files, on_page=lambda page: self.pages.append(IngestionManifest.page_record(page)))
+            self.summary_index, self.vector_index = self.create_indices(nodes)
+        if not self.index_store.matches(self.index_key):
+            self.refresh(input_files)
+        else:
+            self.update_derived_indices()
+        self.context_postprocessor = get_context_postprocessor()
+        self.context_budgeter = self.create_context_budgeter()
         self.summary_tool, self.vector_tool = self.create_tools(self.summary_index, self.vector_index)
+        self.streaming_summary_tool, self.streaming_vector_tool = self.create_tools(
+            self.summary_index, self.vector_index, streaming=True
+        )
+        self.selector = self.create_selector()
         self.query_engine = self.create_query_engine([self.summary_tool, self.vector_tool])
+        self.streaming_query_engine = self.create_query_engine([self.streaming_summary_tool, self.streaming_vector_tool])
+        self.progress.finish("index")
 
     def load_environment(self) -> None:
         """
@@ -41,67 +104,336 @@ class LlamaIndexBase:
 
     def load_documents(self, input_files: List[str]) -> List[Any]:
         """
-        Load documents from the specified input files.
+        Load documents from the specified input files, parsing them in parallel.
 
         :param input_files: List of input file paths
         :return: List of loaded documents
         """
-        return SimpleDirectoryReader(input_files=input_files).load_data()
+        return list(self.pipeline.iter_documents(input_files))
 
     def split_documents(self, documents: List[Any]) -> List[Any]:
         """
-        Split documents into nodes using a sentence splitter.
+        Split documents into nodes with the configured chunking strategy.
 
         :param documents: List of documents
         :return: List of nodes
         """
-        splitter = SentenceSplitter(chunk_size=1024)
-        return splitter.get_nodes_from_documents(documents)
+        return list(self.pipeline.iter_nodes(documents))
+
+    def get_splitter(self) -> NodeParser:
+        """
+        Get the node parser of the configured chunking strategy (CHUNK_STRATEGY).
+
+        :return: Node parser
+        """
+        return get_node_parser()
+
+    def create_pipeline(self) -> IngestionPipeline:
+        """
+        Create the ingestion pipeline that parses, splits and embeds input files.
+
+        :return: Ingestion pipeline
+        """
+        return IngestionPipeline(
+            self.get_splitter(),
+            Settings.embed_model,
+            parse_workers=PARSE_WORKERS,
+            embed_batch_size=EMBED_BATCH_SIZE,
+            embed_concurrency=EMBED_CONCURRENCY,
+            progress=self.progress,
+        )
 
     def setup_models(self) -> None:
         """
         Set up the models for LLM and embedding.
         """
-        Settings.llm = OpenAI(model="gpt-3.5-turbo")
-        Settings.embed_model = OpenAIEmbedding(model="text-embedding-ada-002")
+        Settings.llm = get_llm(LLM_MODEL)
+        Settings.embed_model = get_embed_model()
+        Settings.callback_manager = callback_manager
 
-    def create_indices(self, nodes: List[Any]) -> Tuple[SummaryIndex, VectorStoreIndex]:
+    def index_settings(self) -> dict:
         """
-        Create summary and vector indices from nodes.
+        Get the splitter and embedding settings the persisted indices depend on.
 
-        :param nodes: List of nodes
+        :return: Dictionary of settings
+        """
+        return {
+            **strategy_settings(),
+            "embed_model": Settings.embed_model.model_name,
+            "vector_store": VECTOR_STORE,
+            "vector_quantization": VECTOR_QUANTIZATION if VECTOR_STORE == "mmap" else "none",
+        }
+
+    def create_indices(self, nodes: Iterable[Any]) -> Tuple[SummaryIndex, VectorStoreIndex]:
+        """
+        Create summary and vector indices from nodes, loading them from the
+        index store when it was built with the current settings. Changed input
+        files are then applied by `refresh`. The nodes are consumed as a
+        stream, so the pipeline's nodes are indexed batch by batch; `self.nodes`
+        is loaded back from the docstore, without embeddings.
+
+        :param nodes: Embedded nodes (ignored when the indices are loaded)
         :return: Tuple containing summary index and vector index
         """
-        summary_index = SummaryIndex(nodes)
-        vector_index = VectorStoreIndex(nodes)
+        if self.index_store.matches_settings(self.settings_key):
+            self.manifest = self.index_store.load_manifest()
+            self.summary_tree = SummaryTree.from_dict(
+                self.index_store.read_json(SUMMARY_TREE_FILE),
+                section_size=SUMMARY_SECTION_SIZE,
+                concurrency=SUMMARY_CONCURRENCY,
+                max_input_tokens=SUMMARY_MAX_INPUT_TOKENS,
+            )
+            indices = self.index_store.load_indices()
+            self.nodes = self.index_store.load_nodes()
+            return indices
+        summary_index, vector_index = self.index_store.build_indices(nodes)
+        self.nodes = self.index_store.load_nodes()
+        self.summary_tree = SummaryTree(section_size=SUMMARY_SECTION_SIZE, concurrency=SUMMARY_CONCURRENCY,
+                                        max_input_tokens=SUMMARY_MAX_INPUT_TOKENS)
+        self.manifest = IngestionManifest()
+        for path, pages in IngestionManifest.group_by_file(self.pages).items():
+            self.manifest.update_file(path, IndexStore.hash_file(path), pages, self.nodes)
+        self.pages = []
+        self.index_store.persist(self.index_key, self.settings_key, self.manifest)
         return summary_index, vector_index
 
-    def create_tools(self, summary_index: SummaryIndex, vector_index: VectorStoreIndex) -> Tuple[QueryEngineTool, QueryEngineTool]:
+    @staticmethod
+    def drop_embeddings(nodes: List[Any]) -> None:
+        """
+        Drop the embeddings held by the nodes once the vector store has them,
+        so they are not kept twice (as lists of Python floats) in memory.
+
+        :param nodes: List of nodes
+        """
+        for node in nodes:
+            node.embedding = None
+
+    def refresh(self, input_files: List[str]) -> None:
+        """
+        Re-ingest the input files incrementally. Only files whose hash changed
+        are parsed, and only their changed pages are re-split and re-embedded;
+        the nodes of stale pages are deleted from both indices, and the nodes
+        of pages that only moved get the metadata (page label) of their new position.
+
+        :param input_files: List of input file paths
+        """
+        stale_pages = []
+        changed_documents = []
+        moved_pages = []
+        loaded = {}
+        file_hashes = {IngestionManifest.file_key(f): IndexStore.hash_file(f) for f in input_files}
+        changed_files = [f for f in input_files if self.manifest.file_hash(f) != file_hashes[IngestionManifest.file_key(f)]]
+        if changed_files:
+            loaded = IngestionManifest.group_by_file(self.load_documents(changed_files))
+        for path, documents in loaded.items():
+            stale, changed, moved = self.manifest.diff(path, documents)
+            stale_pages.extend(stale)
+            changed_documents.extend(changed)
+            moved_pages.extend(moved)
+        for path in [p for p in self.manifest.files if p not in file_hashes]:
+            stale_pages.extend(self.manifest.remove_file(path))
+
+        for page in stale_pages:
+            self.delete_page(page)
+        self.relabel_pages(moved_pages)
+        new_nodes = list(self.pipeline.embed(self.split_documents(changed_documents)))
+        if new_nodes:
+            self.summary_index.insert_nodes(new_nodes)
+            self.vector_index.insert_nodes(new_nodes)
+            self.drop_embeddings(new_nodes)
+        for path, documents in loaded.items():
+            self.manifest.update_file(path, file_hashes[path], documents, new_nodes)
+
+        self.nodes = self.index_store.load_nodes()
+        self.index_key = IndexStore.compute_key(input_files, self.index_settings())
+        self.index_store.persist(self.index_key, self.settings_key, self.manifest)
+        self.update_derived_indices()
+
+    def delete_page(self, page: Dict[str, Any]) -> None:
+        """
+        Delete the nodes of a stale page from both indices and the docstore.
+        llama-index records a node in the ref doc info of its page once per
+        node of the page inserted in the same batch, which
+        `VectorStoreIndex.delete_ref_doc` fails on, so the vector index is
+        cleared by the node ids of the manifest instead.
+
+        :param page: Manifest entry of the page
+        """
+        self.summary_index.delete_nodes(page["node_ids"])
+        self.vector_index.vector_store.delete(page["ref_doc_id"])
+        for node_id in page["node_ids"]:
+            self.vector_index.index_struct.nodes_dict.pop(node_id, None)
+        self.vector_index.storage_context.index_store.add_index_struct(self.vector_index.index_struct)
+        self.vector_index.docstore.delete_ref_doc(page["ref_doc_id"], raise_error=False)
+
+    def relabel_pages(self, moved_pages: List[Tuple[Dict[str, Any], Any]]) -> None:
+        """
+        Give the nodes of pages that moved within their file (e.g. after a page
+        was inserted before them) the metadata of the page at its new position,
+        without re-embedding them. The metadata and summary indices are rebuilt
+        from the docstore afterwards.
+
+        :param moved_pages: (manifest entry, freshly loaded page document) pairs
+        """
+        docstore = self.vector_index.docstore
+        for page, document in moved_pages:
+            nodes = docstore.get_nodes(page["node_ids"], raise_error=False)
+            nodes = [node for node in nodes if node is not None]
+            for node in nodes:
+                node.metadata.update(document.metadata)
+            docstore.add_documents(nodes, allow_update=True)
+
+    def update_derived_indices(self) -> None:
+        """
+        Bring the structures derived from the nodes up to date: the summary
+        tree (only pages whose text changed, and the sections and documents
+        above them, are re-summarized), the metadata index used for
+        filtered vector search (with its IVF index when VECTOR_INDEX is
+        "ivf") and the BM25 index used for hybrid search.
+        """
+        if SUMMARY_MODE == "tree":
+            if self.summary_tree.update(self.nodes) or self.index_store.read_json(SUMMARY_TREE_FILE) is None:
+                self.index_store.write_json(SUMMARY_TREE_FILE, self.summary_tree.to_dict())
+        metadata_index = MetadataIndex.from_vector_index(self.vector_index)
+        if VECTOR_INDEX == "ivf":
+            metadata_index.ann = build_ivf_index(
+                metadata_index.node_ids,
+                metadata_index.vectors,
+                path=os.path.join(self.index_store.persist_dir, IVF_FILE),
+                n_lists=IVF_LISTS,
+                n_probe=IVF_PROBES,
+                min_vectors=IVF_MIN_VECTORS,
+            )
+        if hasattr(self, "metadata_index"):
+            self.metadata_index.replace_with(metadata_index)
+        else:
+            self.metadata_index = metadata_index
+        bm25_path = os.path.join(self.index_store.persist_dir, BM25_FILE)
+        bm25_index = BM25Index.load(bm25_path)
+        if (bm25_index is None or bm25_index.node_ids != metadata_index.node_ids
+                or (bm25_index.k1, bm25_index.b) != (BM25_K1, BM25_B)):
+            bm25_index = BM25Index.from_docstore(metadata_index.node_ids, self.vector_index.docstore, k1=BM25_K1, b=BM25_B)
+            bm25_index.save(bm25_path)
+        if hasattr(self, "bm25_index"):
+            self.bm25_index.replace_with(bm25_index)
+        else:
+            self.bm25_index = bm25_index
+
+    def create_vector_retriever(self, vector_index: VectorStoreIndex, similarity_top_k: int = 2) -> MetadataIndexRetriever:
+        """
+        Create the retriever of the vector tool: dense search over the
+        metadata index, fused with BM25 keyword search in "hybrid" retrieval mode.
+
+        :param vector_index: Vector index
+        :param similarity_top_k: Number of nodes to retrieve
+        :return: Retriever instance
+        """
+        if RETRIEVAL_MODE == "hybrid":
+            return HybridRetriever(
+                self.metadata_index, self.bm25_index, vector_index.docstore, Settings.embed_model,
+                similarity_top_k=similarity_top_k, candidate_k=HYBRID_CANDIDATES, rrf_k=RRF_K,
+            )
+        return MetadataIndexRetriever(
+            self.metadata_index, vector_index.docstore, Settings.embed_model, similarity_top_k=similarity_top_k
+        )
+
+    def create_context_budgeter(self) -> Optional[ContextBudgeter]:
+        """
+        Create the context-assembly stage run between retrieval and synthesis
+        by the vector tool.
+
+        :return: ContextBudgeter instance, or None if the context budget is disabled
+        """
+        if not CONTEXT_BUDGET_ENABLED:
+            return None
+        return ContextBudgeter(
+            self.metadata_index,
+            min_nodes=CONTEXT_MIN_NODES,
+            max_nodes=CONTEXT_MAX_NODES,
+            score_gap=CONTEXT_SCORE_GAP,
+            dedup_threshold=CONTEXT_DEDUP_THRESHOLD,
+            mmr_lambda=CONTEXT_MMR_LAMBDA,
+            token_budget=CONTEXT_TOKEN_BUDGET,
+            baseline_k=2,  # the vector tool retrieved 2 nodes before the budget
+        )
+
+    def assemble_context(self, nodes: List[NodeWithScore], query_bundle: QueryBundle,
+                         top_k: Optional[int] = None) -> List[NodeWithScore]:
+        """
+        Expand nodes retrieved outside the vector query engine to their
+        context and apply the context budget (batched retrieval does not run
+        the engine's postprocessors).
+
+        :param nodes: Retrieved nodes
+        :param query_bundle: Query, with its embedding
+        :param top_k: Number of nodes the caller asked for explicitly, which skips the budget
+        :return: Nodes to synthesize from
+        """
+        if self.context_postprocessor is not None:
+            nodes = self.context_postprocessor.postprocess_nodes(nodes, query_bundle)
+        if self.context_budgeter is None or top_k is not None:
+            return nodes
+        return self.context_budgeter.postprocess_nodes(nodes, query_bundle)
+
+    def create_tools(self, summary_index: SummaryIndex, vector_index: VectorStoreIndex, streaming: bool = False) -> Tuple[QueryEngineTool, QueryEngineTool]:
         """
         Create tools for querying the summary and vector indices.
 
         :param summary_index: Summary index
         :param vector_index: Vector index
+        :param streaming: Whether the query engines stream the synthesized answer
         :return: Tuple containing summary tool and vector tool
         """
-        summary_query_engine = summary_index.as_query_engine(
-            response_mode="tree_summarize",
-            use_async=True,
+        if SUMMARY_MODE == "tree":
+            summary_query_engine = SummaryTreeQueryEngine(tree=self.summary_tree, streaming=streaming)
+        else:
+            summary_query_engine = summary_index.as_query_engine(
+                response_mode="tree_summarize",
+                use_async=True,
+                streaming=streaming,
+            )
+        # The retrieved nodes are expanded to their context first, then the
+        # context budget chooses among more candidates than are synthesized
+        postprocessors = [p for p in (self.context_postprocessor, self.context_budgeter) if p is not None]
+        top_k = max(2, CONTEXT_CANDIDATES) if self.context_budgeter is not None else 2
+        vector_retriever = self.create_vector_retriever(vector_index, similarity_top_k=top_k)
+        vector_query_engine = RetrieverQueryEngine.from_args(
+            vector_retriever, streaming=streaming, node_postprocessors=postprocessors
         )
-        vector_query_engine = vector_index.as_query_engine()
 
         summary_tool = QueryEngineTool.from_defaults(
             query_engine=summary_query_engine,
+            name="summary_tool",
             description="Useful for summarization questions related to the given paper",
         )
 
         vector_tool = QueryEngineTool.from_defaults(
             query_engine=vector_query_engine,
+            name="vector_tool",
             description="Useful for retrieving specific context from the given paper.",
         )
 
         return summary_tool, vector_tool
 
+    def create_selector(self, summary_tools: Sequence[str] = ("summary_tool",)) -> BaseSelector:
+        """
+        Create the selector that routes queries between the tools. In "fast"
+        router mode, the LLM selector is only used when the local keyword and
+        embedding scores are too close to call.
+
+        :param summary_tools: Names of the tools favoured by summarization keywords
+        :return: Selector instance
+        """
+        if ROUTER_MODE == "llm":
+            return LLMSingleSelector.from_defaults()
+        return FastSelector(
+            Settings.embed_model,
+            fallback=LLMSingleSelector.from_defaults(),
+            keyword_rules={name: SUMMARY_KEYWORDS for name in summary_tools},
+            margin_threshold=ROUTER_MARGIN_THRESHOLD,
+            keyword_bonus=ROUTER_KEYWORD_BONUS,
+        )
+
     def create_query_engine(self, tools: List[QueryEngineTool]) -> RouterQueryEngine:
         """
         Create a query engine using the provided tools.
@@ -110,39 +442,240 @@ class LlamaIndexBase:
         :return: RouterQueryEngine instance
         """
         return RouterQueryEngine(
-            selector=LLMSingleSelector.from_defaults(),
+            selector=self.selector,
             query_engine_tools=tools,
             verbose=True
         )
 
 class LlamaIndexChatbot(LlamaIndexBase):
-    def __init__(self, input_files: List[str]) -> None:
+    def __init__(self, input_files: List[str], persist_dir: Optional[str] = None,
+                 progress: Optional[StartupProgress] = None) -> None:
         """
         Initialize the LlamaIndexChatbot class.
 
         :param input_files: List of input file paths
+        :param persist_dir: Directory to persist the indices to (derived from the input files if not given)
+        :param progress: Receives the progress of the load, split, embed and index stages
+        """
+        super().__init__(input_files, persist_dir, progress)
+        self.response_cache = self.create_response_cache()
+
+    def create_response_cache(self) -> Optional[SemanticResponseCache]:
+        """
+        Create the semantic response cache, unless it is disabled.
+
+        :return: SemanticResponseCache instance or None
         """
-        super().__init__(input_files)
+        if not RESPONSE_CACHE_ENABLED:
+            return None
+        return SemanticResponseCache(
+            Settings.embed_model,
+            similarity_threshold=RESPONSE_CACHE_THRESHOLD,
+            ttl=RESPONSE_CACHE_TTL,
+            max_entries=RESPONSE_CACHE_MAX_ENTRIES,
+        )
 
-    def get_response(self, user_input: str) -> str:
+    def get_query_engine(self, user_input: str, streaming: bool = False) -> RouterQueryEngine:
         """
-        Get a response from the query engine based on user input.
+        Get the query engine that answers the user input.
 
         :param user_input: User input string
-        :return: Response string
+        :param streaming: Whether the engine streams the synthesized answer
+        :return: RouterQueryEngine instance
         """
-        response = self.query_engine.query(user_input)
-        return str(response)
+        return self.streaming_query_engine if streaming else self.query_engine
 
-    def get_metadata(self, user_input: str) -> str:
+    async def aget_query_engine(self, user_input: str, streaming: bool = False) -> RouterQueryEngine:
         """
-        Get metadata from the query engine based on user input.
+        Get the query engine that answers the user input, from async code.
 
         :param user_input: User input string
-        :return: Metadata string
+        :param streaming: Whether the engine streams the synthesized answer
+        :return: RouterQueryEngine instance
+        """
+        return self.get_query_engine(user_input, streaming)
+
+    @staticmethod
+    def tool_names(query_engine: RouterQueryEngine) -> List[str]:
+        # the router keeps the metadata of its tools in the order the selector indexes them
+        return [metadata.name for metadata in getattr(query_engine, "_metadatas", [])]
+
+    def get_response(self, user_input: str) -> Answer:
+        """
+        Get a response from the query engine based on user input, with the
+        selected tool and the source nodes of that same query. Responses are
+        served from the response cache when a similar query was answered
+        against the current index version.
+
+        :param user_input: User input string
+        :return: Answer with the response, tool and sources
+        """
+        if self.response_cache is not None:
+            cached = self.response_cache.lookup(user_input, self.index_key)
+            if cached is not None:
+                return cached
+        query_engine = self.get_query_engine(user_input)
+        answer = answer_from_response(query_engine.query(user_input), self.tool_names(query_engine))
+        if self.response_cache is not None:
+            self.response_cache.store(user_input, answer, self.index_key)
+        return answer
+
+    async def aget_response(self, user_input: str) -> Answer:
+        """
+        Get a response from the query engine without blocking the event loop.
+
+        :param user_input: User input string
+        :return: Answer with the response, tool and sources
+        """
+        if self.response_cache is not None:
+            cached = await self.response_cache.alookup(user_input, self.index_key)
+            if cached is not None:
+                return cached
+        query_engine = await self.aget_query_engine(user_input)
+        answer = answer_from_response(await query_engine.aquery(user_input), self.tool_names(query_engine))
+        if self.response_cache is not None:
+            await self.response_cache.astore(user_input, answer, self.index_key)
+        return answer
+
+    def stream_response(self, user_input: str) -> Iterator[str]:
+        """
+        Stream the response tokens as the synthesizer produces them.
+
+        :param user_input: User input string
+        :return: Iterator over the response tokens
+        """
+        if self.response_cache is not None:
+            cached = self.response_cache.lookup(user_input, self.index_key)
+            if cached is not None:
+                yield str(cached)
+                return
+        query_engine = self.get_query_engine(user_input, streaming=True)
+        response = query_engine.query(user_input)
+        tokens = []
+        for token in response_tokens(response):
+            tokens.append(token)
+            yield token
+        if self.response_cache is not None:
+            answer = answer_from_response(response, self.tool_names(query_engine), text="".join(tokens))
+            self.response_cache.store(user_input, answer, self.index_key)
+
+    def get_sources(self, user_input: str, top_k: Optional[int] = None, with_text: bool = False) -> List[Source]:
+        """
+        Get the sources the vector tool would answer the user input from,
+        with a retrieval-only pass (no router or synthesis LLM call).
+
+        :param user_input: User input string
+        :param top_k: Number of sources (the chunks the context budget keeps if not given)
+        :param with_text: Include the text of the chunks
+        :return: List of sources with node IDs, page labels and similarity scores
+        """
+        query_bundle = QueryBundle(user_input)
+        nodes = self.vector_tool.query_engine.retriever.retrieve_batch([query_bundle], top_k)[0]
+        return sources_from_nodes(self.assemble_context(nodes, query_bundle, top_k), with_text)
+
+    def get_responses(self, user_inputs: List[str], retrieval_only: bool = False,
+                      top_k: Optional[int] = None) -> List[Answer]:
+        """
+        Answer a batch of questions (see `astream_responses`). Not for use
+        inside a running event loop.
+
+        :param user_inputs: Questions
+        :param retrieval_only: Return the top-k chunks of every question without any LLM call
+        :param top_k: Chunks per question in retrieval-only mode
+        :return: Answers in the order of the questions
+        """
+        async def collect() -> List[Answer]:
+            answers: List[Any] = [None] * len(user_inputs)
+            async for positions, answer in self.astream_responses(user_inputs, retrieval_only, top_k):
+                for i in positions:
+                    answers[i] = answer
+            return answers
+        return asyncio.run(collect())
+
+    async def astream_responses(self, user_inputs: List[str], retrieval_only: bool = False,
+                                top_k: Optional[int] = None) -> AsyncIterator[Tuple[List[int], Answer]]:
+        """
+        Answer a batch of questions, yielding every answer as soon as it is
+        ready. Identical questions (ignoring case and whitespace) are answered
+        once.
+
+        :param user_inputs: Questions
+        :param retrieval_only: Return the top-k chunks of every question without any LLM call
+        :param top_k: Chunks per question in retrieval-only mode (the vector tool's top k if not given)
+        :return: Async iterator over (positions of the question in `user_inputs`, answer)
+        """
+        positions: Dict[str, List[int]] = {}
+        for i, user_input in enumerate(user_inputs):
+            positions.setdefault(SemanticResponseCache.normalize(user_input), []).append(i)
+        groups = list(positions.values())
+        queries = [user_inputs[group[0]] for group in groups]
+        async for j, answer in self.abatch(queries, retrieval_only, top_k):
+            yield groups[j], answer
+
+    async def abatch(self, queries: List[str], retrieval_only: bool = False,
+                     top_k: Optional[int] = None) -> AsyncIterator[Tuple[int, Answer]]:
+        """
+        Answer distinct questions with shared work: one batched embedding
+        call for all of them, one matrix product retrieving the chunks of
+        every question routed to the vector tool, then synthesis fanned out
+        with at most BATCH_CONCURRENCY LLM calls in flight.
+
+        :param queries: Distinct questions
+        :param retrieval_only: Return the top-k chunks of every question without any LLM call
+        :param top_k: Chunks per question in retrieval-only mode
+        :return: Async iterator over (index of the question, answer), in completion order
         """
-        response = self.query_engine.query(user_input)
-        return "This will contain metadata"
+        retriever = self.vector_tool.query_engine.retriever
+        bundles = [QueryBundle(query) for query in queries]
+        if retrieval_only:
+            nodes = await asyncio.to_thread(retriever.retrieve_batch, bundles, top_k)
+            for j, batch in enumerate(nodes):
+                batch = self.assemble_context(batch, bundles[j], top_k)
+                yield j, Answer(response="", tool=self.vector_tool.metadata.name, sources=sources_from_nodes(batch, True))
+            return
+
+        embeddings = await asyncio.to_thread(get_query_embeddings, Settings.embed_model, queries)
+        for query_bundle, embedding in zip(bundles, embeddings):
+            query_bundle.embedding = embedding
+        pending = list(range(len(queries)))
+        if self.response_cache is not None:
+            cached = await asyncio.to_thread(
+                lambda: [self.response_cache.lookup(query, self.index_key) for query in queries]
+            )
+            for j, answer in enumerate(cached):
+                if answer is not None:
+                    yield j, answer
+            pending = [j for j in pending if cached[j] is None]
+
+        tools = [self.summary_tool, self.vector_tool]
+        semaphore = asyncio.Semaphore(BATCH_CONCURRENCY)
+
+        async def route(j: int) -> QueryEngineTool:
+            async with semaphore:
+                return tools[(await self.selector.aselect([t.metadata for t in tools], bundles[j])).ind]
+
+        routed = dict(zip(pending, await asyncio.gather(*(route(j) for j in pending))))
+        vector_jobs = [j for j in pending if routed[j] is self.vector_tool]
+        retrieved = dict(zip(vector_jobs, await asyncio.to_thread(
+            retriever.retrieve_batch, [bundles[j] for j in vector_jobs]
+        ))) if vector_jobs else {}
+
+        async def answer(j: int) -> Tuple[int, Answer]:
+            tool = routed[j]
+            async with semaphore:
+                if j in retrieved:
+                    nodes = self.assemble_context(retrieved[j], bundles[j])
+                    response = await tool.query_engine.asynthesize(bundles[j], nodes)
+                else:
+                    response = await tool.query_engine.aquery(bundles[j])
+            result = answer_from_response(response)
+            result.tool = tool.metadata.name
+            if self.response_cache is not None:
+                await self.response_cache.astore(queries[j], result, self.index_key, bundles[j].embedding)
+            return j, result
+
+        for completed in asyncio.as_completed([answer(j) for j in pending]):
+            yield await completed
 
     def get_summarizer_tool(self, user_input: str) -> str:
         """
@@ -0,0 +1,132 @@
+from typing import Any, List, Optional, Sequence
+from llama_index.core.bridge.pydantic import Field
+from llama_index.core.node_parser import HierarchicalNodeParser, NodeParser, SentenceSplitter, SentenceWindowNodeParser
+from llama_index.core.node_parser.relational.hierarchical import get_leaf_nodes
+from llama_index.core.postprocessor.types import BaseNodePostprocessor
+from llama_index.core.schema import BaseNode, NodeRelationship, NodeWithScore, QueryBundle, TextNode
+from backend.app.config import (
+    CHUNK_STRATEGY, CHUNK_SIZE, CHUNK_OVERLAP, SENTENCE_WINDOW_SIZE, HIERARCHY_CHUNK_SIZES, HIERARCHY_CHUNK_OVERLAP,
+)
+
+CHUNK_STRATEGIES = ("sentence", "sentence_window", "hierarchical")
+WINDOW_METADATA_KEY = "window"
+PARENT_METADATA_KEY = "parent_text"
+
+
+class ParentChunkNodeParser(NodeParser):
+    """
+    Split documents into a hierarchy of chunks and return only the leaves,
+    each carrying the text of its parent chunk in its metadata: the leaves
+    are embedded and retrieved, the parents are what the LLM reads.
+    """
+
+    chunk_sizes: List[int] = Field(default_factory=lambda: [1024, 256], description="Chunk sizes, largest first")
+    chunk_overlap: int = Field(default=20, description="Overlap between chunks of the same level")
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "ParentChunkNodeParser"
+
+    def _parse_nodes(self, nodes: Sequence[BaseNode], show_progress: bool = False, **kwargs: Any) -> List[BaseNode]:
+        hierarchy = HierarchicalNodeParser.from_defaults(chunk_sizes=self.chunk_sizes, chunk_overlap=self.chunk_overlap)
+        chunks = hierarchy.get_nodes_from_documents(nodes, show_progress=show_progress)
+        texts = {chunk.node_id: chunk.get_content() for chunk in chunks}
+        leaves = get_leaf_nodes(chunks)
+        for leaf in leaves:
+            parent = leaf.relationships.get(NodeRelationship.PARENT)
+            leaf.metadata[PARENT_METADATA_KEY] = texts.get(parent.node_id) if parent is not None else leaf.get_content()
+            # New lists: the split nodes may share those of their document
+            leaf.excluded_embed_metadata_keys = [*leaf.excluded_embed_metadata_keys, PARENT_METADATA_KEY]
+            leaf.excluded_llm_metadata_keys = [*leaf.excluded_llm_metadata_keys, PARENT_METADATA_KEY]
+            # Parents are not indexed, so drop the references to them
+            leaf.relationships.pop(NodeRelationship.PARENT, None)
+            leaf.relationships.pop(NodeRelationship.CHILD, None)
+        return leaves
+
+
+class ContextWindowPostprocessor(BaseNodePostprocessor):
+    """
+    Replace the text of every retrieved node with the larger context stored
+    in its metadata (the sentence window or the parent chunk). Nodes whose
+    context was already taken by a better ranked node are dropped.
+    """
+
+    metadata_key: str = Field(description="Metadata key holding the context")
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "ContextWindowPostprocessor"
+
+    def _postprocess_nodes(self, nodes: List[NodeWithScore],
+                           query_bundle: Optional[QueryBundle] = None) -> List[NodeWithScore]:
+        seen = set()
+        expanded = []
+        for node in nodes:
+            context = node.node.metadata.get(self.metadata_key)
+            if context is None or not isinstance(node.node, TextNode):
+                expanded.append(node)
+                continue
+            if context in seen:
+                continue
+            seen.add(context)
+            # Copy, so the retrieved node itself keeps its own text
+            replaced = node.node.copy()
+            replaced.text = context
+            expanded.append(NodeWithScore(node=replaced, score=node.score))
+        return expanded
+
+
+def get_node_parser(strategy: str = CHUNK_STRATEGY, chunk_size: int = CHUNK_SIZE, chunk_overlap: int = CHUNK_OVERLAP,
+                    window_size: int = SENTENCE_WINDOW_SIZE, chunk_sizes: Sequence[int] = HIERARCHY_CHUNK_SIZES,
+                    hierarchy_overlap: int = HIERARCHY_CHUNK_OVERLAP) -> NodeParser:
+    """
+    Get the node parser of a chunking strategy: "sentence" chunks of
+    `chunk_size` tokens, "sentence_window" nodes of one sentence with the
+    `window_size` sentences around it, or "hierarchical" leaf chunks of the
+    smallest of `chunk_sizes` with their parent chunk.
+
+    :param strategy: Chunking strategy
+    :param chunk_size: Chunk size of the "sentence" strategy
+    :param chunk_overlap: Chunk overlap of the "sentence" strategy
+    :param window_size: Sentences on each side of the "sentence_window" nodes
+    :param chunk_sizes: Chunk sizes of the "hierarchical" strategy, largest first
+    :param hierarchy_overlap: Chunk overlap of the "hierarchical" strategy
+    :return: Node parser
+    """
+    if strategy == "sentence_window":
+        return SentenceWindowNodeParser.from_defaults(window_size=window_size, window_metadata_key=WINDOW_METADATA_KEY)
+    if strategy == "hierarchical":
+        return ParentChunkNodeParser(chunk_sizes=list(chunk_sizes), chunk_overlap=hierarchy_overlap)
+    return SentenceSplitter(chunk_size=chunk_size, chunk_overlap=chunk_overlap)
+
+
+def get_context_postprocessor(strategy: str = CHUNK_STRATEGY) -> Optional[ContextWindowPostprocessor]:
+    """
+    Get the postprocessor that expands retrieved nodes to the context the
+    chunking strategy stored with them.
+
+    :param strategy: Chunking strategy
+    :return: ContextWindowPostprocessor instance, or None for the "sentence" strategy
+    """
+    if strategy == "sentence_window":
+        return ContextWindowPostprocessor(metadata_key=WINDOW_METADATA_KEY)
+    if strategy == "hierarchical":
+        return ContextWindowPostprocessor(metadata_key=PARENT_METADATA_KEY)
+    return None
+
+
+def strategy_settings(strategy: str = CHUNK_STRATEGY) -> dict:
+    """
+    Get the settings of a chunking strategy the persisted indices depend on.
+    The "sentence" strategy keeps the settings it had before strategies were
+    configurable, so existing indices stay valid.
+
+    :param strategy: Chunking strategy
+    :return: Dictionary of settings
+    """
+    if strategy == "sentence_window":
+        return {"chunk_strategy": strategy, "window_size": SENTENCE_WINDOW_SIZE}
+    if strategy == "hierarchical":
+        return {"chunk_strategy": strategy, "chunk_sizes": list(HIERARCHY_CHUNK_SIZES),
+                "hierarchy_overlap": HIERARCHY_CHUNK_OVERLAP}
+    return {"chunk_size": CHUNK_SIZE, "chunk_overlap": CHUNK_OVERLAP}
@@ -0,0 +1,75 @@
+import asyncio
+from contextlib import asynccontextmanager
+from typing import AsyncIterator
+
+
+class QueueFullError(Exception):
+    def __init__(self, retry_after: int) -> None:
+        """
+        Raised when a query cannot be admitted because the queue is full.
+
+        :param retry_after: Seconds the client should wait before retrying
+        """
+        super().__init__(f"Query queue is full, retry after {retry_after}s")
+        self.retry_after = retry_after
+
+
+class QueryLimiter:
+    def __init__(self, max_concurrency: int, max_queued: int, queue_timeout: float, retry_after: int) -> None:
+        """
+        Initialize the QueryLimiter class. At most `max_concurrency` queries run
+        at once, up to `max_queued` more wait for a slot, and anything beyond
+        that is rejected right away so the caller can answer with a 429.
+
+        :param max_concurrency: Maximum number of queries running at once
+        :param max_queued: Maximum number of queries waiting for a slot
+        :param queue_timeout: Maximum seconds a query waits for a slot
+        :param retry_after: Seconds clients are told to wait when rejected
+        """
+        self.max_concurrency = max_concurrency
+        self.max_queued = max_queued
+        self.queue_timeout = queue_timeout
+        self.retry_after = retry_after
+        self.active = 0
+        self.waiting = 0
+        self.rejected = 0
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+
+    async def acquire(self) -> None:
+        """
+        Wait for a query slot. Every successful call must be paired with `release`.
+
+        :raises QueueFullError: If the queue is full or the wait timed out
+        """
+        if self.active + self.waiting >= self.max_concurrency + self.max_queued:
+            self.rejected += 1
+            raise QueueFullError(self.retry_after)
+        self.waiting += 1
+        try:
+            await asyncio.wait_for(self._semaphore.acquire(), timeout=self.queue_timeout)
+        except asyncio.TimeoutError:
+            self.rejected += 1
+            raise QueueFullError(self.retry_after)
+        finally:
+            self.waiting -= 1
+        self.active += 1
+
+    def release(self) -> None:
+        """
+        Give a query slot back.
+        """
+        self.active -= 1
+        self._semaphore.release()
+
+    @asynccontextmanager
+    async def slot(self) -> AsyncIterator[None]:
+        """
+        Wait for a query slot and hold it for the duration of the block.
+
+        :raises QueueFullError: If the queue is full or the wait timed out
+        """
+        await self.acquire()
+        try:
+            yield
+        finally:
+            self.release()
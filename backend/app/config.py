@@ -0,0 +1,116 @@
+"""
+Backend configuration, read from environment variables (or a .env file).
+"""
+import os
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Models
+LLM_MODEL = os.getenv("LLM_MODEL", "gpt-3.5-turbo")
+EMBED_MODEL = os.getenv("EMBED_MODEL", "text-embedding-ada-002")
+
+# Model provider
+MODEL_PROVIDER = os.getenv("MODEL_PROVIDER", "openai")
+LOCAL_LLM_LATENCY_MS = float(os.getenv("LOCAL_LLM_LATENCY_MS", "50"))
+LOCAL_LLM_TOKENS_PER_S = float(os.getenv("LOCAL_LLM_TOKENS_PER_S", "200"))
+LOCAL_LLM_MAX_TOKENS = int(os.getenv("LOCAL_LLM_MAX_TOKENS", "64"))
+LOCAL_EMBED_DIM = int(os.getenv("LOCAL_EMBED_DIM", "256"))
+LOCAL_EMBED_LATENCY_MS = float(os.getenv("LOCAL_EMBED_LATENCY_MS", "0"))
+
+# Splitting
+CHUNK_STRATEGY = os.getenv("CHUNK_STRATEGY", "sentence")  # "sentence", "sentence_window" or "hierarchical"
+CHUNK_SIZE = int(os.getenv("CHUNK_SIZE", "1024"))
+CHUNK_OVERLAP = int(os.getenv("CHUNK_OVERLAP", "200"))
+SENTENCE_WINDOW_SIZE = int(os.getenv("SENTENCE_WINDOW_SIZE", "3"))
+HIERARCHY_CHUNK_SIZES = [int(size) for size in os.getenv("HIERARCHY_CHUNK_SIZES", "1024,256").split(",")]
+HIERARCHY_CHUNK_OVERLAP = int(os.getenv("HIERARCHY_CHUNK_OVERLAP", "20"))
+
+# Persisted indices
+INDEX_PERSIST_DIR = os.getenv("INDEX_PERSIST_DIR", "storage")
+
+# Embedding cache
+EMBED_CACHE_PATH = os.getenv("EMBED_CACHE_PATH", os.path.join(INDEX_PERSIST_DIR, "embeddings.sqlite3"))
+EMBED_CACHE_MAX_ENTRIES = int(os.getenv("EMBED_CACHE_MAX_ENTRIES", "100000"))
+
+# HTTP connection pools
+HTTP_MAX_CONNECTIONS = int(os.getenv("HTTP_MAX_CONNECTIONS", "100"))
+HTTP_MAX_KEEPALIVE = int(os.getenv("HTTP_MAX_KEEPALIVE", "20"))
+HTTP_KEEPALIVE_EXPIRY = float(os.getenv("HTTP_KEEPALIVE_EXPIRY", "60"))
+HTTP2 = os.getenv("HTTP2", "true").lower() == "true"
+
+# Query embedding batching
+QUERY_EMBED_BATCHING = os.getenv("QUERY_EMBED_BATCHING", "true").lower() == "true"
+QUERY_EMBED_WINDOW_MS = float(os.getenv("QUERY_EMBED_WINDOW_MS", "2"))
+QUERY_EMBED_MAX_BATCH = int(os.getenv("QUERY_EMBED_MAX_BATCH", "64"))
+
+# Query concurrency
+MAX_CONCURRENT_QUERIES = int(os.getenv("MAX_CONCURRENT_QUERIES", "32"))
+MAX_QUEUED_QUERIES = int(os.getenv("MAX_QUEUED_QUERIES", "256"))
+QUERY_QUEUE_TIMEOUT = float(os.getenv("QUERY_QUEUE_TIMEOUT", "30"))
+RETRY_AFTER_SECONDS = int(os.getenv("RETRY_AFTER_SECONDS", "5"))
+
+# Response cache
+RESPONSE_CACHE_ENABLED = os.getenv("RESPONSE_CACHE_ENABLED", "true").lower() == "true"
+RESPONSE_CACHE_THRESHOLD = float(os.getenv("RESPONSE_CACHE_THRESHOLD", "0.95"))
+RESPONSE_CACHE_TTL = float(os.getenv("RESPONSE_CACHE_TTL", "3600"))
+RESPONSE_CACHE_MAX_ENTRIES = int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", "1024"))
+# Recent answers kept by request ID for GET /metadata/{request_id}
+RESULT_CACHE_MAX_ENTRIES = int(os.getenv("RESULT_CACHE_MAX_ENTRIES", "1024"))
+
+# Batch queries
+BATCH_MAX_QUESTIONS = int(os.getenv("BATCH_MAX_QUESTIONS", "1000"))
+BATCH_CONCURRENCY = int(os.getenv("BATCH_CONCURRENCY", "8"))
+
+# Router
+ROUTER_MODE = os.getenv("ROUTER_MODE", "fast")  # "fast" or "llm"
+ROUTER_MARGIN_THRESHOLD = float(os.getenv("ROUTER_MARGIN_THRESHOLD", "0.03"))
+ROUTER_KEYWORD_BONUS = float(os.getenv("ROUTER_KEYWORD_BONUS", "0.1"))
+
+# Summaries
+SUMMARY_MODE = os.getenv("SUMMARY_MODE", "tree")  # "tree" or "tree_summarize"
+SUMMARY_SECTION_SIZE = int(os.getenv("SUMMARY_SECTION_SIZE", "4"))
+SUMMARY_CONCURRENCY = int(os.getenv("SUMMARY_CONCURRENCY", "8"))
+SUMMARY_MAX_INPUT_TOKENS = int(os.getenv("SUMMARY_MAX_INPUT_TOKENS", "3000"))
+
+# Query engine pool
+QUERY_ENGINE_POOL_SIZE = int(os.getenv("QUERY_ENGINE_POOL_SIZE", "64"))
+
+# Ingestion pipeline
+PARSE_WORKERS = int(os.getenv("PARSE_WORKERS", str(os.cpu_count() or 1)))
+EMBED_BATCH_SIZE = int(os.getenv("EMBED_BATCH_SIZE", "100"))
+EMBED_CONCURRENCY = int(os.getenv("EMBED_CONCURRENCY", "4"))
+
+# Multi-document corpus
+CORPUS_FILES = os.getenv("CORPUS_FILES", "transformers.pdf")
+CORPUS_MAX_LOADED = int(os.getenv("CORPUS_MAX_LOADED", "8"))
+CORPUS_TOOL_TOP_K = int(os.getenv("CORPUS_TOOL_TOP_K", "3"))
+CORPUS_DESCRIPTION_CHARS = int(os.getenv("CORPUS_DESCRIPTION_CHARS", "600"))
+
+# Hybrid retrieval
+RETRIEVAL_MODE = os.getenv("RETRIEVAL_MODE", "hybrid")
+HYBRID_CANDIDATES = int(os.getenv("HYBRID_CANDIDATES", "10"))
+RRF_K = int(os.getenv("RRF_K", "60"))
+BM25_K1 = float(os.getenv("BM25_K1", "1.2"))
+BM25_B = float(os.getenv("BM25_B", "0.75"))
+
+# Context budget
+CONTEXT_BUDGET_ENABLED = os.getenv("CONTEXT_BUDGET_ENABLED", "true").lower() == "true"
+CONTEXT_CANDIDATES = int(os.getenv("CONTEXT_CANDIDATES", "6"))
+CONTEXT_MIN_NODES = int(os.getenv("CONTEXT_MIN_NODES", "1"))
+CONTEXT_MAX_NODES = int(os.getenv("CONTEXT_MAX_NODES", "4"))
+CONTEXT_SCORE_GAP = float(os.getenv("CONTEXT_SCORE_GAP", "0.5"))
+CONTEXT_DEDUP_THRESHOLD = float(os.getenv("CONTEXT_DEDUP_THRESHOLD", "0.95"))
+CONTEXT_MMR_LAMBDA = float(os.getenv("CONTEXT_MMR_LAMBDA", "0.7"))
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "3000"))
+
+# Vector store
+VECTOR_STORE = os.getenv("VECTOR_STORE", "simple")
+VECTOR_QUANTIZATION = os.getenv("VECTOR_QUANTIZATION", "none")
+VECTOR_RERANK_FACTOR = int(os.getenv("VECTOR_RERANK_FACTOR", "4"))
+
+# Approximate nearest-neighbour index
+VECTOR_INDEX = os.getenv("VECTOR_INDEX", "exact")
+IVF_LISTS = int(os.getenv("IVF_LISTS", "0"))
+IVF_PROBES = int(os.getenv("IVF_PROBES", "8"))
+IVF_MIN_VECTORS = int(os.getenv("IVF_MIN_VECTORS", "10000"))
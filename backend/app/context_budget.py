@@ -0,0 +1,198 @@
+import logging
+import threading
+from typing import Any, Callable, Dict, List, Optional
+import numpy as np
+from llama_index.core import Settings
+from llama_index.core.bridge.pydantic import Field, PrivateAttr
+from llama_index.core.postprocessor.types import BaseNodePostprocessor
+from llama_index.core.schema import MetadataMode, NodeWithScore, QueryBundle, TextNode
+from backend.app.instrumentation import CONTEXT_TOKENS, count
+from backend.app.metadata_index import MetadataIndex
+
+logger = logging.getLogger(__name__)
+
+
+class ContextBudgeter(BaseNodePostprocessor):
+    """
+    Assemble the synthesis context from the retrieved candidates: drop near
+    duplicates, choose how many nodes to keep from the gaps between their
+    similarities, order them by maximal marginal relevance (MMR) and fit
+    them into a token budget, truncating the last one if needed. It never
+    keeps more nodes, or more tokens, than the caller's top-k retrieval
+    (`baseline_k`) would have passed to synthesis.
+    """
+
+    min_nodes: int = Field(default=1, description="Nodes always kept (when retrieved)")
+    max_nodes: int = Field(default=4, description="Maximum number of nodes kept (capped by baseline_k)")
+    baseline_k: int = Field(default=2, description="Nodes synthesis used without the budget (the caller's top-k)")
+    score_gap: float = Field(
+        default=0.5, description="Cut after the first score drop of at least this share of the candidates' score spread"
+    )
+    dedup_threshold: float = Field(default=0.95, description="Cosine similarity above which a node duplicates a kept one")
+    mmr_lambda: float = Field(default=0.7, description="Relevance weight of MMR (1 is pure relevance)")
+    token_budget: int = Field(default=3000, description="Maximum context tokens")
+    min_truncated_tokens: int = Field(default=64, description="Smallest truncated node worth keeping")
+    _metadata_index: MetadataIndex = PrivateAttr()
+    _tokenizer: Optional[Callable[[str], List[Any]]] = PrivateAttr(default=None)
+    _token_counts: Dict[str, int] = PrivateAttr()
+    _counters: Dict[str, int] = PrivateAttr()
+    _lock: threading.Lock = PrivateAttr()
+
+    def __init__(self, metadata_index: MetadataIndex, tokenizer: Optional[Callable[[str], List[Any]]] = None,
+                 **kwargs: Any) -> None:
+        """
+        Initialize the ContextBudgeter class.
+
+        :param metadata_index: Metadata index holding the normalized node embeddings
+        :param tokenizer: Tokenizer used to count context tokens (Settings.tokenizer if not given)
+        """
+        super().__init__(**kwargs)
+        self._metadata_index = metadata_index
+        self._tokenizer = tokenizer
+        self._token_counts = {}
+        self._counters = {"requests": 0, "retrieved_nodes": 0, "kept_nodes": 0, "duplicates": 0, "truncated": 0,
+                          "candidate_tokens": 0, "baseline_tokens": 0, "kept_tokens": 0}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "ContextBudgeter"
+
+    def for_top_k(self, top_k: int) -> "ContextBudgeter":
+        """
+        Get a budgeter for a caller retrieving `top_k` nodes, sharing the
+        counters and token counts of this one.
+
+        :param top_k: Number of nodes the caller passed to synthesis before the budget
+        :return: ContextBudgeter instance
+        """
+        budgeter = self.copy(update={"baseline_k": top_k})
+        budgeter._metadata_index, budgeter._tokenizer = self._metadata_index, self._tokenizer
+        budgeter._token_counts, budgeter._counters, budgeter._lock = self._token_counts, self._counters, self._lock
+        return budgeter
+
+    def _tokens(self, text: str) -> int:
+        return len((self._tokenizer or Settings.tokenizer)(text))
+
+    def _node_tokens(self, node: NodeWithScore) -> int:
+        node_id = node.node.node_id
+        if node_id not in self._token_counts:
+            self._token_counts[node_id] = self._tokens(node.node.get_content(metadata_mode=MetadataMode.LLM))
+        return self._token_counts[node_id]
+
+    def _select(self, vectors: np.ndarray, relevance: np.ndarray) -> List[int]:
+        """
+        Drop near duplicates, then pick the adaptive number of nodes by MMR.
+        That number is `min(max_nodes, baseline_k)`, unless the sorted
+        similarities drop by at least `score_gap` of their spread before it.
+
+        :param vectors: Normalized node embeddings, in retrieval order
+        :param relevance: Cosine similarity of every node to the query
+        :return: Positions of the kept nodes, in MMR order
+        """
+        similarity = vectors @ vectors.T
+        unique: List[int] = []
+        for i in range(len(vectors)):
+            if not unique or similarity[i, unique].max() < self.dedup_threshold:
+                unique.append(i)
+        with self._lock:
+            self._counters["duplicates"] += len(vectors) - len(unique)
+        limit = min(self.max_nodes, self.baseline_k, len(unique))
+        scores = np.sort(relevance[unique])[::-1]
+        k = limit
+        spread = scores[0] - scores[-1]
+        if spread > 0:
+            for j in range(limit - 1):
+                if scores[j] - scores[j + 1] >= self.score_gap * spread:
+                    k = j + 1
+                    break
+        k = max(k, min(self.min_nodes, limit))
+        chosen: List[int] = []
+        remaining = list(unique)
+        while len(chosen) < k:
+            redundancy = similarity[np.ix_(remaining, chosen)].max(axis=1) if chosen else np.zeros(len(remaining))
+            mmr = self.mmr_lambda * relevance[remaining] - (1 - self.mmr_lambda) * redundancy
+            chosen.append(remaining.pop(int(np.argmax(mmr))))
+        return chosen
+
+    def _fit(self, nodes: List[NodeWithScore], budget: int) -> List[NodeWithScore]:
+        """
+        Keep nodes in order while they fit the token budget; the first node
+        that does not fit is truncated to the remaining budget when that
+        leaves at least `min_truncated_tokens`.
+
+        :param nodes: Nodes in order of preference
+        :param budget: Maximum tokens
+        :return: Nodes within the budget
+        """
+        fitted: List[NodeWithScore] = []
+        remaining = budget
+        for node in nodes:
+            tokens = self._node_tokens(node)
+            if tokens <= remaining:
+                fitted.append(node)
+                remaining -= tokens
+                continue
+            if remaining >= self.min_truncated_tokens or not fitted:
+                text = node.node.get_content()
+                # the tokenizer cannot decode, so cut by the same share of characters, at a word boundary
+                cut = text[:int(len(text) * remaining / tokens)].rsplit(" ", 1)[0]
+                truncated = node.node.copy()
+                if isinstance(truncated, TextNode):
+                    truncated.text = cut
+                    fitted.append(NodeWithScore(node=truncated, score=node.score))
+                    with self._lock:
+                        self._counters["truncated"] += 1
+            break
+        return fitted
+
+    def _postprocess_nodes(self, nodes: List[NodeWithScore],
+                           query_bundle: Optional[QueryBundle] = None) -> List[NodeWithScore]:
+        if not nodes:
+            return nodes
+        positions = self._metadata_index.positions
+        # a bare query string (e.g. RetrieverQueryEngine.retrieve(str)) carries no embedding: only fit the budget
+        if isinstance(query_bundle, QueryBundle) and query_bundle.embedding is not None and all(
+            n.node.node_id in positions for n in nodes
+        ):
+            vectors = self._metadata_index.vectors(np.array([positions[n.node.node_id] for n in nodes]))
+            query = np.asarray(query_bundle.embedding, dtype=np.float32)
+            query = query / (np.linalg.norm(query) or 1)
+            chosen = self._select(np.asarray(vectors, dtype=np.float32), np.asarray(vectors, dtype=np.float32) @ query)
+            kept = [nodes[i] for i in chosen]
+        else:
+            kept = nodes[:self.baseline_k]
+        # never more context than the top-k retrieval would have passed to synthesis
+        baseline_tokens = sum(self._node_tokens(n) for n in nodes[:self.baseline_k])
+        kept = self._fit(kept, min(self.token_budget, baseline_tokens))
+        candidate_tokens = sum(self._node_tokens(n) for n in nodes)
+        kept_tokens = sum(self._tokens(n.node.get_content(metadata_mode=MetadataMode.LLM)) for n in kept)
+        with self._lock:
+            self._counters["requests"] += 1
+            self._counters["retrieved_nodes"] += len(nodes)
+            self._counters["kept_nodes"] += len(kept)
+            self._counters["candidate_tokens"] += candidate_tokens
+            self._counters["baseline_tokens"] += baseline_tokens
+            self._counters["kept_tokens"] += kept_tokens
+        CONTEXT_TOKENS.inc(candidate_tokens, kind="candidates")
+        CONTEXT_TOKENS.inc(baseline_tokens, kind="baseline")
+        CONTEXT_TOKENS.inc(kept_tokens, kind="kept")
+        # saved relative to what synthesis read before the budget, not to the extra candidates
+        count("context_tokens_saved", baseline_tokens - kept_tokens)
+        logger.debug("Context: kept %d of %d nodes, %d tokens (top-%d baseline %d)",
+                     len(kept), len(nodes), kept_tokens, self.baseline_k, baseline_tokens)
+        return kept
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Get the context assembly counters.
+
+        :return: Dictionary with the nodes retrieved and kept, the tokens of the candidates, of the top-k
+                 baseline and kept, and the tokens saved relative to the baseline
+        """
+        with self._lock:
+            counters = dict(self._counters)
+        baseline = counters["baseline_tokens"]
+        counters["tokens_saved"] = baseline - counters["kept_tokens"]
+        counters["tokens_saved_ratio"] = counters["tokens_saved"] / baseline if baseline else 0.0
+        return counters
@@ -0,0 +1,432 @@
+import asyncio
+import glob
+import hashlib
+import logging
+import os
+import re
+import threading
+import weakref
+from collections import OrderedDict
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional, Tuple
+import numpy as np
+from pypdf import PdfReader
+from llama_index.core import Settings
+from llama_index.core.base.embeddings.base import BaseEmbedding
+from llama_index.core.bridge.pydantic import Field
+from llama_index.core.query_engine import CustomQueryEngine
+from llama_index.core.query_engine.router_query_engine import RouterQueryEngine
+from llama_index.core.schema import QueryBundle
+from llama_index.core.tools import QueryEngineTool
+from backend.app.answers import Answer, Source, sources_from_nodes
+from backend.app.chatbot import LlamaIndexBase, LlamaIndexChatbot
+from backend.app.config import (
+    CORPUS_MAX_LOADED, CORPUS_TOOL_TOP_K, CORPUS_DESCRIPTION_CHARS, INDEX_PERSIST_DIR, BATCH_CONCURRENCY,
+)
+from backend.app.embedding_cache import get_query_embeddings
+from backend.app.index_store import IndexStore
+from backend.app.ingestion import IngestionManifest
+from backend.app.startup import StartupProgress
+
+logger = logging.getLogger(__name__)
+
+CATALOG_FILE = "catalog.json"
+
+
+def resolve_corpus_files(spec: str) -> List[str]:
+    """
+    Resolve the corpus specification into input files.
+
+    :param spec: Comma-separated file paths, glob patterns or directories (searched for PDFs)
+    :return: List of input file paths, without duplicates
+    """
+    files: Dict[str, None] = {}
+    for part in (p.strip() for p in spec.split(",")):
+        if not part:
+            continue
+        if os.path.isdir(part):
+            matches = sorted(glob.glob(os.path.join(part, "**", "*.pdf"), recursive=True))
+        else:
+            matches = sorted(glob.glob(part)) or [part]
+        files.update(dict.fromkeys(matches))
+    return list(files)
+
+
+def describe_file(path: str, max_chars: int = 600) -> str:
+    """
+    Describe a document by its first page, without parsing the rest of it.
+
+    :param path: File path
+    :param max_chars: Maximum length of the description
+    :return: Description string
+    """
+    if path.lower().endswith(".pdf"):
+        reader = PdfReader(path)
+        text = reader.pages[0].extract_text() if reader.pages else ""
+    else:
+        with open(path, errors="ignore") as f:
+            text = f.read(max_chars * 2)
+    return " ".join(text.split())[:max_chars]
+
+
+class DocumentIndex(LlamaIndexBase):
+    def setup_models(self) -> None:
+        """
+        Keep the models the corpus chatbot already set up.
+        """
+
+
+class LazyToolEngine(CustomQueryEngine):
+    corpus: Any = Field(description="Corpus manager materializing the document")
+    path: str = Field(description="Document the tool answers from")
+    kind: str = Field(description="Either 'summary' or 'vector'")
+    streaming: bool = Field(default=False)
+
+    def engine(self) -> Any:
+        document = self.corpus.get(self.path)
+        prefix = "streaming_" if self.streaming else ""
+        return getattr(document, f"{prefix}{self.kind}_tool").query_engine
+
+    async def aengine(self) -> Any:
+        # The first query to a document builds its indices in a worker thread, not on the event loop
+        document = await self.corpus.aget(self.path)
+        prefix = "streaming_" if self.streaming else ""
+        return getattr(document, f"{prefix}{self.kind}_tool").query_engine
+
+    def custom_query(self, query_str: str) -> Any:
+        return self.engine().query(query_str)
+
+    async def acustom_query(self, query_str: str) -> Any:
+        return await (await self.aengine()).aquery(query_str)
+
+
+class CorpusManager:
+    def __init__(self, input_files: List[str], factory: Callable[[str], LlamaIndexBase], embed_model: BaseEmbedding,
+                 catalog_dir: str, max_loaded: int = 8, tool_top_k: int = 3, description_chars: int = 600) -> None:
+        """
+        Initialize the CorpusManager class. Every document gets a description
+        (from its first page, cached in a catalog by file hash) and an
+        embedding of it. Per-document indices are only materialized by
+        `factory` when one of their tools is queried, and at most
+        `max_loaded` of them are kept in memory, least recently used first out.
+
+        :param input_files: List of input file paths
+        :param factory: Builds (or loads) the indices and tools of one document
+        :param embed_model: Embedding model for queries and descriptions
+        :param catalog_dir: Directory of the description catalog
+        :param max_loaded: Maximum number of materialized documents
+        :param tool_top_k: Number of documents whose tools are offered per query
+        :param description_chars: Maximum length of a document description
+        """
+        self.factory = factory
+        self.embed_model = embed_model
+        self.max_loaded = max_loaded
+        self.tool_top_k = tool_top_k
+        self.store = IndexStore(catalog_dir)
+        self.paths = [IngestionManifest.file_key(f) for f in input_files]
+        self.catalog = self.load_catalog(description_chars)
+        self.names = self.tool_suffixes(self.paths)
+        descriptions = [self.catalog[p]["description"] or os.path.basename(p) for p in self.paths]
+        matrix = np.asarray(self.embed_model.get_text_embedding_batch(descriptions), dtype=np.float32)
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        self.matrix = matrix / np.where(norms == 0, 1, norms)
+        self.loads = 0
+        self.hits = 0
+        self.evictions = 0
+        self._loaded: "OrderedDict[str, LlamaIndexBase]" = OrderedDict()
+        self._build_locks: Dict[str, threading.Lock] = {}
+        # asyncio locks belong to one event loop, so they are kept per loop
+        self._async_build_locks: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, Dict[str, asyncio.Lock]]" = (
+            weakref.WeakKeyDictionary()
+        )
+        self._tools: Dict[Tuple[str, bool], Tuple[QueryEngineTool, QueryEngineTool]] = {}
+        self._lock = threading.Lock()
+
+    def load_catalog(self, description_chars: int) -> Dict[str, Dict[str, str]]:
+        """
+        Load the document descriptions, describing new and changed files.
+
+        :param description_chars: Maximum length of a document description
+        :return: Catalog entry per file
+        """
+        stored = (self.store.read_json(CATALOG_FILE) or {}).get("files", {})
+        catalog = {}
+        for path in self.paths:
+            file_hash = IndexStore.hash_file(path)
+            entry = stored.get(path)
+            if entry is None or entry["hash"] != file_hash:
+                entry = {"hash": file_hash, "description": describe_file(path, description_chars)}
+            catalog[path] = entry
+        if catalog != stored:
+            self.store.write_json(CATALOG_FILE, {"files": catalog})
+        return catalog
+
+    @staticmethod
+    def tool_suffixes(paths: List[str]) -> Dict[str, str]:
+        suffixes: Dict[str, str] = {}
+        for path in paths:
+            slug = re.sub(r"\W+", "_", os.path.splitext(os.path.basename(path))[0]).strip("_").lower()[:40] or "document"
+            suffix, i = slug, 1
+            while suffix in suffixes.values():
+                i += 1
+                suffix = f"{slug}_{i}"
+            suffixes[path] = suffix
+        return suffixes
+
+    @property
+    def version(self) -> str:
+        """
+        Get a version of the corpus content, changing whenever a file does.
+
+        :return: Version string
+        """
+        hashes = "\n".join(f"{p}:{self.catalog[p]['hash']}" for p in sorted(self.paths))
+        return hashlib.sha256(hashes.encode()).hexdigest()
+
+    def tool_name(self, path: str, kind: str) -> str:
+        return f"{kind}_tool_{self.names[path]}"
+
+    def retrieve(self, query_embedding: List[float], top_k: Optional[int] = None) -> List[str]:
+        """
+        Get the documents whose description is most similar to the query.
+
+        :param query_embedding: Query embedding
+        :param top_k: Number of documents (defaults to `tool_top_k`)
+        :return: Document paths, most similar first
+        """
+        top_k = min(top_k or self.tool_top_k, len(self.paths))
+        query = np.asarray(query_embedding, dtype=np.float32)
+        scores = self.matrix @ (query / (np.linalg.norm(query) or 1))
+        best = np.argpartition(-scores, top_k - 1)[:top_k]
+        return [self.paths[i] for i in best[np.argsort(-scores[best])]]
+
+    def get(self, path: str) -> LlamaIndexBase:
+        """
+        Get the materialized indices of a document, building or loading them on first use.
+
+        :param path: Document path
+        :return: Materialized document
+        """
+        with self._lock:
+            document = self._loaded.get(path)
+            if document is not None:
+                self.hits += 1
+                self._loaded.move_to_end(path)
+                return document
+            build_lock = self._build_locks.setdefault(path, threading.Lock())
+        with build_lock:
+            with self._lock:
+                document = self._loaded.get(path)
+                if document is not None:
+                    self._loaded.move_to_end(path)
+                    return document
+            logger.info("Materializing corpus document %s", path)
+            document = self.factory(path)
+            with self._lock:
+                self.loads += 1
+                self._loaded[path] = document
+                while len(self._loaded) > self.max_loaded:
+                    evicted, _ = self._loaded.popitem(last=False)
+                    self.evictions += 1
+                    logger.info("Evicted corpus document %s", evicted)
+        return document
+
+    async def aget(self, path: str) -> LlamaIndexBase:
+        """
+        Get the materialized indices of a document without blocking the event
+        loop: a document that is not loaded yet is built or loaded in a worker
+        thread, and concurrent requests for it wait on an asyncio lock.
+
+        :param path: Document path
+        :return: Materialized document
+        """
+        with self._lock:
+            document = self._loaded.get(path)
+            if document is not None:
+                self.hits += 1
+                self._loaded.move_to_end(path)
+                return document
+            locks = self._async_build_locks.setdefault(asyncio.get_running_loop(), {})
+            build_lock = locks.setdefault(path, asyncio.Lock())
+        async with build_lock:
+            return await asyncio.to_thread(self.get, path)
+
+    def tools(self, path: str, streaming: bool = False) -> Tuple[QueryEngineTool, QueryEngineTool]:
+        """
+        Get the summary and vector tools of a document. The tools only
+        materialize the document when they are queried.
+
+        :param path: Document path
+        :param streaming: Whether the tools stream the synthesized answer
+        :return: Tuple containing summary tool and vector tool
+        """
+        key = (path, streaming)
+        if key not in self._tools:
+            name = os.path.basename(path)
+            summary_tool = QueryEngineTool.from_defaults(
+                query_engine=LazyToolEngine(corpus=self, path=path, kind="summary", streaming=streaming),
+                name=self.tool_name(path, "summary"),
+                description=f"Useful for summarization questions related to {name}",
+            )
+            vector_tool = QueryEngineTool.from_defaults(
+                query_engine=LazyToolEngine(corpus=self, path=path, kind="vector", streaming=streaming),
+                name=self.tool_name(path, "vector"),
+                description=f"Useful for retrieving specific context from {name}: {self.catalog[path]['description']}",
+            )
+            self._tools[key] = (summary_tool, vector_tool)
+        return self._tools[key]
+
+    def query_tools(self, query_embedding: List[float], streaming: bool = False) -> List[QueryEngineTool]:
+        """
+        Get the tools of the documents most relevant to the query.
+
+        :param query_embedding: Query embedding
+        :param streaming: Whether the tools stream the synthesized answer
+        :return: List of query engine tools
+        """
+        return [tool for path in self.retrieve(query_embedding) for tool in self.tools(path, streaming)]
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "documents": len(self.paths),
+            "loaded": len(self._loaded),
+            "loads": self.loads,
+            "hits": self.hits,
+            "evictions": self.evictions,
+        }
+
+
+class CorpusChatbot(LlamaIndexChatbot):
+    def __init__(self, input_files: List[str], max_loaded: int = CORPUS_MAX_LOADED, tool_top_k: int = CORPUS_TOOL_TOP_K,
+                 progress: Optional[StartupProgress] = None) -> None:
+        """
+        Initialize the CorpusChatbot class. Unlike LlamaIndexChatbot it does
+        not index the input files up front: each query is routed between the
+        tools of the `tool_top_k` documents most relevant to it, and a
+        document's indices are built or loaded when its tool is selected.
+
+        :param input_files: List of input file paths
+        :param max_loaded: Maximum number of documents kept in memory
+        :param tool_top_k: Number of documents whose tools are offered per query
+        :param progress: Receives the progress of the index stage (documents are only loaded on demand)
+        """
+        self.progress = progress or StartupProgress()
+        self.progress.skip("load", "split", "embed")
+        self.progress.start("index")
+        self.load_environment()
+        self.OPENAI_API_KEY = self.get_api_key()
+        self.setup_models()
+        self.input_files = input_files
+        self.corpus = CorpusManager(
+            input_files,
+            self.create_document_index,
+            Settings.embed_model,
+            os.path.join(INDEX_PERSIST_DIR, "corpus"),
+            max_loaded=max_loaded,
+            tool_top_k=tool_top_k,
+            description_chars=CORPUS_DESCRIPTION_CHARS,
+        )
+        self.index_key = self.corpus.version
+        self.selector = self.create_selector([self.corpus.tool_name(p, "summary") for p in self.corpus.paths])
+        self.response_cache = self.create_response_cache()
+        self.progress.advance("index", len(self.corpus.paths))
+        self.progress.finish("index")
+
+    def create_document_index(self, path: str) -> LlamaIndexBase:
+        """
+        Build or load the indices and tools of one document.
+
+        :param path: Document path
+        :return: Materialized document
+        """
+        return DocumentIndex(input_files=[path])
+
+    def get_query_engine(self, user_input: str, streaming: bool = False) -> RouterQueryEngine:
+        """
+        Get a query engine routing between the tools of the documents most relevant to the user input.
+
+        :param user_input: User input string
+        :param streaming: Whether the engine streams the synthesized answer
+        :return: RouterQueryEngine instance
+        """
+        query_embedding = Settings.embed_model.get_query_embedding(user_input)
+        return self.create_query_engine(self.corpus.query_tools(query_embedding, streaming))
+
+    async def aget_query_engine(self, user_input: str, streaming: bool = False) -> RouterQueryEngine:
+        """
+        Get a query engine routing between the tools of the documents most
+        relevant to the user input, embedding it without blocking the event loop.
+
+        :param user_input: User input string
+        :param streaming: Whether the engine streams the synthesized answer
+        :return: RouterQueryEngine instance
+        """
+        query_embedding = await Settings.embed_model.aget_query_embedding(user_input)
+        return self.create_query_engine(self.corpus.query_tools(query_embedding, streaming))
+
+    def get_document(self, user_input: str) -> LlamaIndexBase:
+        """
+        Get the materialized document most relevant to the user input.
+
+        :param user_input: User input string
+        :return: Materialized document
+        """
+        query_embedding = Settings.embed_model.get_query_embedding(user_input)
+        return self.corpus.get(self.corpus.retrieve(query_embedding, top_k=1)[0])
+
+    def get_summarizer_tool(self, user_input: str) -> str:
+        """
+        Get a response from the summarizer tool of the most relevant document.
+
+        :param user_input: User input string
+        :return: Response string
+        """
+        return str(self.get_document(user_input).summary_tool.query_engine.query(user_input))
+
+    def get_vector_tool(self, user_input: str) -> str:
+        """
+        Get a response from the vector tool of the most relevant document.
+
+        :param user_input: User input string
+        :return: Response string
+        """
+        return str(self.get_document(user_input).vector_tool.query_engine.query(user_input))
+
+    def get_sources(self, user_input: str, top_k: Optional[int] = None, with_text: bool = False) -> List[Source]:
+        """
+        Get the sources the vector tool of the most relevant document would
+        answer the user input from, with a retrieval-only pass.
+
+        :param user_input: User input string
+        :param top_k: Number of sources (the chunks the context budget keeps if not given)
+        :param with_text: Include the text of the chunks
+        :return: List of sources with node IDs, file names, page labels and similarity scores
+        """
+        query_bundle = QueryBundle(user_input, embedding=Settings.embed_model.get_query_embedding(user_input))
+        document = self.corpus.get(self.corpus.retrieve(query_bundle.embedding, top_k=1)[0])
+        nodes = document.vector_tool.query_engine.retriever.retrieve_batch([query_bundle], top_k)[0]
+        return sources_from_nodes(document.assemble_context(nodes, query_bundle, top_k), with_text)
+
+    async def abatch(self, queries: List[str], retrieval_only: bool = False,
+                     top_k: Optional[int] = None) -> AsyncIterator[Tuple[int, Answer]]:
+        """
+        Answer distinct questions concurrently, at most BATCH_CONCURRENCY at
+        a time. The questions are embedded in one batched call up front;
+        retrieval and synthesis run per question, since each may be routed
+        to a different document.
+
+        :param queries: Distinct questions
+        :param retrieval_only: Return the top-k chunks of every question without any LLM call
+        :param top_k: Chunks per question in retrieval-only mode
+        :return: Async iterator over (index of the question, answer), in completion order
+        """
+        await asyncio.to_thread(get_query_embeddings, Settings.embed_model, queries)
+        semaphore = asyncio.Semaphore(BATCH_CONCURRENCY)
+
+        async def answer(j: int) -> Tuple[int, Answer]:
+            async with semaphore:
+                if retrieval_only:
+                    return j, Answer(response="", sources=await asyncio.to_thread(self.get_sources, queries[j], top_k, True))
+                return j, await self.aget_response(queries[j])
+
+        for completed in asyncio.as_completed([answer(j) for j in range(len(queries))]):
+            yield await completed
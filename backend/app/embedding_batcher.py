@@ -0,0 +1,179 @@
+import asyncio
+import queue
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Dict, List, Tuple
+from llama_index.core.base.embeddings.base import BaseEmbedding, Embedding
+from llama_index.core.bridge.pydantic import PrivateAttr
+
+
+def embed_query_batch(model: BaseEmbedding, queries: List[str]) -> List[Embedding]:
+    """
+    Embed a batch of queries in one call when the model embeds queries and
+    texts alike (e.g. OpenAI models without a separate query mode),
+    otherwise one call per query.
+
+    :param model: Embedding model
+    :param queries: Queries to embed
+    :return: Embeddings in the same order
+    """
+    if isinstance(model, BatchingEmbedding):
+        return model.embed_queries(queries)
+    query_engine = getattr(model, "_query_engine", None)
+    if len(queries) > 1 and query_engine is not None and query_engine == getattr(model, "_text_engine", None):
+        return model._get_text_embeddings(queries)
+    return [model._get_query_embedding(q) for q in queries]
+
+
+class BatchingEmbedding(BaseEmbedding):
+    """
+    Embedding model wrapper that micro-batches concurrent query embeddings.
+    Text embeddings (ingestion) are already batched and pass straight through.
+    """
+
+    _inner: BaseEmbedding = PrivateAttr()
+    _window: float = PrivateAttr()
+    _max_batch_size: int = PrivateAttr()
+    _queue: "queue.Queue[Tuple[str, str]]" = PrivateAttr()
+    _inflight: Dict[str, Future] = PrivateAttr()
+    _lock: threading.Lock = PrivateAttr()
+    _executor: ThreadPoolExecutor = PrivateAttr()
+    _worker: threading.Thread = PrivateAttr()
+    _counters: Dict[str, int] = PrivateAttr()
+    _active: int = PrivateAttr(default=0)
+
+    def __init__(self, inner: BaseEmbedding, window_ms: float = 2.0, max_batch_size: int = 64,
+                 concurrency: int = 4, **kwargs: Any) -> None:
+        """
+        Initialize the BatchingEmbedding class. While a batch is in flight,
+        query embedding requests are collected for `window_ms` after the first
+        one arrives (or until `max_batch_size` are waiting) and sent as one
+        call; when the model is idle, what is queued is sent right away, so a
+        lone query pays no window. Identical queries in flight at the same time
+        share a single future.
+
+        :param inner: Embedding model to call
+        :param window_ms: Milliseconds to wait for more queries before sending a batch while another one is in flight
+        :param max_batch_size: Maximum number of queries per call
+        :param concurrency: Maximum number of batches in flight
+        """
+        super().__init__(model_name=inner.model_name, embed_batch_size=inner.embed_batch_size, **kwargs)
+        self._inner = inner
+        self._window = window_ms / 1000
+        self._max_batch_size = max(1, max_batch_size)
+        self._queue = queue.Queue()
+        self._inflight = {}
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=max(1, concurrency), thread_name_prefix="embed-batch")
+        self._worker = threading.Thread(target=self._collect, name="embed-batcher", daemon=True)
+        self._worker.start()
+        self._counters = {"requests": 0, "coalesced": 0, "batches": 0, "batched_queries": 0}
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "BatchingEmbedding"
+
+    @property
+    def inner(self) -> BaseEmbedding:
+        return self._inner
+
+    @staticmethod
+    def coalesce_key(query: str) -> str:
+        return " ".join(query.split())
+
+    def submit(self, query: str) -> Future:
+        """
+        Queue a query for the next batch, or join the identical query already in flight.
+
+        :param query: Query to embed
+        :return: Future resolving to the embedding
+        """
+        key = self.coalesce_key(query)
+        with self._lock:
+            self._counters["requests"] += 1
+            future = self._inflight.get(key)
+            if future is not None:
+                self._counters["coalesced"] += 1
+                return future
+            future = self._inflight[key] = Future()
+        self._queue.put((key, query))
+        return future
+
+    def _collect(self) -> None:
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + (self._window if self._active else 0.0)
+            while len(batch) < self._max_batch_size:
+                try:
+                    batch.append(self._queue.get(timeout=max(0.0, deadline - time.monotonic())))
+                except queue.Empty:
+                    break
+            with self._lock:
+                self._active += 1
+            self._executor.submit(self._run_batch, batch)
+
+    def _embed_queries(self, queries: List[str]) -> List[Embedding]:
+        return embed_query_batch(self._inner, queries)
+
+    def embed_queries(self, queries: List[str]) -> List[Embedding]:
+        """
+        Embed a known list of queries directly, `max_batch_size` per call with
+        up to `concurrency` calls in flight, instead of going through the
+        collection window.
+
+        :param queries: Queries to embed
+        :return: Embeddings in the same order
+        """
+        chunks = [queries[i:i + self._max_batch_size] for i in range(0, len(queries), self._max_batch_size)]
+        with self._lock:
+            self._counters["requests"] += len(queries)
+            self._counters["batches"] += len(chunks)
+            self._counters["batched_queries"] += len(queries)
+        return [e for embeddings in self._executor.map(self._embed_queries, chunks) for e in embeddings]
+
+    def _run_batch(self, batch: List[Tuple[str, str]]) -> None:
+        with self._lock:
+            self._counters["batches"] += 1
+            self._counters["batched_queries"] += len(batch)
+        try:
+            embeddings, error = self._embed_queries([query for _, query in batch]), None
+        except Exception as e:
+            embeddings, error = [], e
+        with self._lock:
+            self._active -= 1
+            futures = [self._inflight.pop(key) for key, _ in batch]
+        for i, future in enumerate(futures):
+            if error is not None:
+                future.set_exception(error)
+            else:
+                future.set_result(embeddings[i])
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Get the batching counters.
+
+        :return: Dictionary with requests, coalesced requests, batches and the average batch size
+        """
+        with self._lock:
+            counters = dict(self._counters)
+        counters["avg_batch_size"] = counters["batched_queries"] / counters["batches"] if counters["batches"] else 0.0
+        return counters
+
+    def _get_query_embedding(self, query: str) -> Embedding:
+        return self.submit(query).result()
+
+    async def _aget_query_embedding(self, query: str) -> Embedding:
+        return await asyncio.wrap_future(self.submit(query))
+
+    def _get_text_embedding(self, text: str) -> Embedding:
+        return self._inner._get_text_embedding(text)
+
+    async def _aget_text_embedding(self, text: str) -> Embedding:
+        return await self._inner._aget_text_embedding(text)
+
+    def _get_text_embeddings(self, texts: List[str]) -> List[Embedding]:
+        return self._inner._get_text_embeddings(texts)
+
+    async def _aget_text_embeddings(self, texts: List[str]) -> List[Embedding]:
+        return await self._inner._aget_text_embeddings(texts)
@@ -0,0 +1,278 @@
+import asyncio
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, List, Optional
+import numpy as np
+from llama_index.core.base.embeddings.base import BaseEmbedding, Embedding
+from llama_index.core.bridge.pydantic import PrivateAttr
+from llama_index.core.callbacks.schema import CBEventType, EventPayload
+from backend.app.embedding_batcher import BatchingEmbedding, embed_query_batch
+
+
+class EmbeddingCache:
+    def __init__(self, path: str, max_entries: int = 100_000, touch_flush_interval: float = 30.0,
+                 touch_flush_size: int = 1000) -> None:
+        """
+        Initialize the EmbeddingCache class. Embeddings are stored as float32
+        blobs in a SQLite file, so they are shared across processes and restarts.
+        Access times of cache hits are kept in memory and written in one
+        transaction every `touch_flush_interval` seconds or `touch_flush_size`
+        hits (and before evictions), so a hit costs no write. The number of
+        rows is tracked in memory, so a store does not count the table.
+
+        :param path: Path of the SQLite file
+        :param max_entries: Maximum number of cached embeddings before the least recently used ones are evicted
+        :param touch_flush_interval: Maximum seconds between writes of the access times
+        :param touch_flush_size: Maximum number of access times kept in memory
+        """
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.path = path
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.touch_flush_interval = touch_flush_interval
+        self.touch_flush_size = touch_flush_size
+        self._touched: Dict[str, float] = {}
+        self._last_flush = time.monotonic()
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings "
+            "(key TEXT PRIMARY KEY, vector BLOB NOT NULL, last_access REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS embeddings_last_access ON embeddings (last_access)")
+        self._conn.commit()
+        self._size = self._count()
+
+    def _count(self) -> int:
+        (count,) = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()
+        return count
+
+    @staticmethod
+    def make_key(model_name: str, kind: str, text: str) -> str:
+        """
+        Build the cache key from the model name and the hash of the normalized text.
+
+        :param model_name: Embedding model identifier (class, model name and dimensions)
+        :param kind: "text" or "query", since some models embed them differently
+        :param text: Text to embed
+        :return: Cache key
+        """
+        normalized = " ".join(text.split())
+        return f"{model_name}:{kind}:{hashlib.sha256(normalized.encode()).hexdigest()}"
+
+    def get_many(self, keys: List[str]) -> Dict[str, Embedding]:
+        """
+        Look up several embeddings at once.
+
+        :param keys: Cache keys
+        :return: Dictionary of the keys found and their embeddings
+        """
+        found: Dict[str, Embedding] = {}
+        unique_keys = list(dict.fromkeys(keys))
+        with self._lock:
+            for start in range(0, len(unique_keys), 500):
+                batch = unique_keys[start:start + 500]
+                rows = self._conn.execute(
+                    f"SELECT key, vector FROM embeddings WHERE key IN ({','.join('?' * len(batch))})", batch
+                ).fetchall()
+                for key, blob in rows:
+                    found[key] = np.frombuffer(blob, dtype=np.float32).tolist()
+            if found:
+                now = time.time()
+                self._touched.update((k, now) for k in found)
+                if (len(self._touched) >= self.touch_flush_size
+                        or time.monotonic() - self._last_flush >= self.touch_flush_interval):
+                    self._flush_touched()
+                    self._conn.commit()
+            self.hits += sum(1 for k in keys if k in found)
+            self.misses += sum(1 for k in keys if k not in found)
+        return found
+
+    def _flush_touched(self) -> None:
+        if self._touched:
+            self._conn.executemany(
+                "UPDATE embeddings SET last_access = ? WHERE key = ?", [(t, k) for k, t in self._touched.items()]
+            )
+            self._touched.clear()
+        self._last_flush = time.monotonic()
+
+    def flush(self) -> None:
+        """
+        Write the access times of recent cache hits.
+        """
+        with self._lock:
+            self._flush_touched()
+            self._conn.commit()
+
+    def put_many(self, items: Dict[str, Embedding]) -> None:
+        """
+        Store several embeddings and evict the least recently used entries if
+        the cache grew past its size bound.
+
+        :param items: Dictionary of cache keys and embeddings
+        """
+        if not items:
+            return
+        now = time.time()
+        rows = [(k, np.asarray(v, dtype=np.float32).tobytes(), now) for k, v in items.items()]
+        with self._lock:
+            before = self._conn.total_changes
+            self._conn.executemany("INSERT OR IGNORE INTO embeddings VALUES (?, ?, ?)", rows)
+            inserted = self._conn.total_changes - before
+            if inserted < len(rows):
+                # some keys were already stored (e.g. by another process): refresh their access time
+                self._conn.executemany(
+                    "UPDATE embeddings SET last_access = ? WHERE key = ?", [(now, k) for k, _, _ in rows]
+                )
+            self._size += inserted
+            if self._size > self.max_entries:
+                # other processes may have added or evicted rows since, so count once before evicting
+                self._size = self._count()
+            if self._size > self.max_entries:
+                self._flush_touched()
+                overflow = self._size - self.max_entries
+                self._conn.execute(
+                    "DELETE FROM embeddings WHERE key IN "
+                    "(SELECT key FROM embeddings ORDER BY last_access LIMIT ?)",
+                    (overflow,),
+                )
+                self.evictions += overflow
+                self._size -= overflow
+            self._conn.commit()
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Get the cache counters.
+
+        :return: Dictionary with hits, misses, evictions, hit rate and size
+        """
+        with self._lock:
+            size = self._size
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "size": size,
+            "max_entries": self.max_entries,
+        }
+
+
+class CachedEmbedding(BaseEmbedding):
+    """Embedding model wrapper that only calls the wrapped model on cache misses."""
+
+    _inner: BaseEmbedding = PrivateAttr()
+    _cache: EmbeddingCache = PrivateAttr()
+    _model_id: str = PrivateAttr()
+
+    def __init__(self, inner: BaseEmbedding, cache: EmbeddingCache, **kwargs: Any) -> None:
+        """
+        Initialize the CachedEmbedding class.
+
+        :param inner: Embedding model to call on cache misses
+        :param cache: Embedding cache
+        """
+        super().__init__(model_name=inner.model_name, embed_batch_size=inner.embed_batch_size, **kwargs)
+        self._inner = inner
+        self._cache = cache
+        model = inner.inner if isinstance(inner, BatchingEmbedding) else inner
+        dimensions = getattr(model, "dimensions", None) or getattr(model, "embed_dim", None)
+        self._model_id = "/".join(str(p) for p in (model.class_name(), model.model_name, dimensions) if p)
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "CachedEmbedding"
+
+    @property
+    def inner(self) -> BaseEmbedding:
+        return self._inner
+
+    @property
+    def cache(self) -> EmbeddingCache:
+        return self._cache
+
+    def _lookup(self, kind: str, texts: List[str]) -> tuple:
+        keys = [EmbeddingCache.make_key(self._model_id, kind, t) for t in texts]
+        found = self._cache.get_many(keys)
+        missing = list(dict.fromkeys((k, t) for k, t in zip(keys, texts) if k not in found))
+        return keys, found, missing
+
+    def _get_query_embedding(self, query: str) -> Embedding:
+        keys, found, missing = self._lookup("query", [query])
+        if missing:
+            found[keys[0]] = self._inner._get_query_embedding(query)
+            self._cache.put_many({keys[0]: found[keys[0]]})
+        return found[keys[0]]
+
+    async def _aget_query_embedding(self, query: str) -> Embedding:
+        # SQLite reads and writes block, so they run off the event loop
+        keys, found, missing = await asyncio.to_thread(self._lookup, "query", [query])
+        if missing:
+            found[keys[0]] = await self._inner._aget_query_embedding(query)
+            await asyncio.to_thread(self._cache.put_many, {keys[0]: found[keys[0]]})
+        return found[keys[0]]
+
+    def get_query_embedding_batch(self, queries: List[str]) -> List[Embedding]:
+        """
+        Embed many queries at once: cached ones are read in one lookup and the
+        distinct misses are embedded in batched calls.
+
+        :param queries: Queries to embed
+        :return: Embeddings in the same order
+        """
+        with self.callback_manager.event(CBEventType.EMBEDDING, payload={EventPayload.SERIALIZED: {}}) as event:
+            keys, found, missing = self._lookup("query", queries)
+            if missing:
+                embeddings = embed_query_batch(self._inner, [t for _, t in missing])
+                new = {k: e for (k, _), e in zip(missing, embeddings)}
+                self._cache.put_many(new)
+                found.update(new)
+            result = [found[k] for k in keys]
+            event.on_end(payload={EventPayload.CHUNKS: queries, EventPayload.EMBEDDINGS: result})
+        return result
+
+    def _get_text_embedding(self, text: str) -> Embedding:
+        return self._get_text_embeddings([text])[0]
+
+    async def _aget_text_embedding(self, text: str) -> Embedding:
+        return (await self._aget_text_embeddings([text]))[0]
+
+    def _get_text_embeddings(self, texts: List[str]) -> List[Embedding]:
+        keys, found, missing = self._lookup("text", texts)
+        if missing:
+            embeddings = self._inner._get_text_embeddings([t for _, t in missing])
+            new = {k: e for (k, _), e in zip(missing, embeddings)}
+            self._cache.put_many(new)
+            found.update(new)
+        return [found[k] for k in keys]
+
+    async def _aget_text_embeddings(self, texts: List[str]) -> List[Embedding]:
+        keys, found, missing = await asyncio.to_thread(self._lookup, "text", texts)
+        if missing:
+            embeddings = await self._inner._aget_text_embeddings([t for _, t in missing])
+            new = {k: e for (k, _), e in zip(missing, embeddings)}
+            await asyncio.to_thread(self._cache.put_many, new)
+            found.update(new)
+        return [found[k] for k in keys]
+
+
+def get_query_embeddings(embed_model: BaseEmbedding, queries: List[str]) -> List[Embedding]:
+    """
+    Embed many queries with as few model calls as the model allows.
+
+    :param embed_model: Embedding model (cached or not)
+    :param queries: Queries to embed
+    :return: Embeddings in the same order
+    """
+    if isinstance(embed_model, CachedEmbedding):
+        return embed_model.get_query_embedding_batch(queries)
+    return embed_query_batch(embed_model, queries)
@@ -0,0 +1,76 @@
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Iterable, Tuple
+
+PoolKey = Tuple[int, Tuple[str, ...], bool]
+
+
+class QueryEnginePool:
+    def __init__(self, factory: Callable[[int, Tuple[str, ...], bool], Any], max_size: int = 64) -> None:
+        """
+        Initialize the QueryEnginePool class. Query engines are built by
+        `factory` once per (top_k, page filter set, streaming) combination and
+        reused afterwards; the least recently used ones are dropped beyond
+        `max_size`.
+
+        :param factory: Builds a query engine from top_k, the sorted page labels and the streaming flag
+        :param max_size: Maximum number of pooled query engines
+        """
+        self.factory = factory
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._engines: "OrderedDict[PoolKey, Any]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(top_k: int, page_numbers: Iterable[Any], streaming: bool = False) -> PoolKey:
+        """
+        Normalize a filter combination: page labels are stripped, deduplicated and sorted.
+
+        :param top_k: Number of nodes to retrieve
+        :param page_numbers: Page labels to filter by
+        :param streaming: Whether the engine streams its answer
+        :return: Pool key
+        """
+        return top_k, tuple(sorted({str(p).strip() for p in page_numbers or []})), streaming
+
+    def get(self, top_k: int, page_numbers: Iterable[Any], streaming: bool = False) -> Any:
+        """
+        Get a warm query engine for the filter combination, building it on first use.
+
+        :param top_k: Number of nodes to retrieve
+        :param page_numbers: Page labels to filter by
+        :param streaming: Whether the engine streams its answer
+        :return: Query engine
+        """
+        key = self.key(top_k, page_numbers, streaming)
+        with self._lock:
+            engine = self._engines.get(key)
+            if engine is not None:
+                self.hits += 1
+                self._engines.move_to_end(key)
+                return engine
+            self.misses += 1
+        engine = self.factory(*key)
+        with self._lock:
+            self._engines[key] = engine
+            while len(self._engines) > self.max_size:
+                self._engines.popitem(last=False)
+        return engine
+
+    def clear(self) -> None:
+        """
+        Drop every pooled engine, e.g. after the index was rebuilt.
+        """
+        with self._lock:
+            self._engines.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "size": len(self._engines),
+        }
@@ -0,0 +1,113 @@
+import logging
+from typing import Dict, List, Optional, Sequence
+import numpy as np
+from llama_index.core.base.base_selector import BaseSelector, SelectorResult, SingleSelection
+from llama_index.core.base.embeddings.base import BaseEmbedding
+from llama_index.core.prompts.mixin import PromptDictType
+from llama_index.core.schema import QueryBundle
+from llama_index.core.tools.types import ToolMetadata
+from backend.app.instrumentation import span
+
+logger = logging.getLogger(__name__)
+
+SUMMARY_KEYWORDS = (
+    "summar", "overview", "tl;dr", "tldr", "gist", "main idea", "main point",
+    "key point", "key takeaway", "in short", "outline", "what is the paper about",
+    "what is this paper about", "what is the document about",
+)
+
+
+class FastSelector(BaseSelector):
+    def __init__(self, embed_model: BaseEmbedding, fallback: BaseSelector,
+                 keyword_rules: Optional[Dict[str, Sequence[str]]] = None,
+                 margin_threshold: float = 0.03, keyword_bonus: float = 0.1) -> None:
+        """
+        Initialize the FastSelector class. Each choice is scored by the cosine
+        similarity between the query embedding and the embedding of its
+        description, plus a bonus when the query contains one of the choice's
+        keywords. The fallback selector (an LLM selector) is only asked when
+        the best choice does not beat the runner-up by `margin_threshold`.
+
+        :param embed_model: Embedding model for the query and the choice descriptions
+        :param fallback: Selector used when the local decision is not confident
+        :param keyword_rules: Keywords per tool name that favour that tool
+        :param margin_threshold: Minimum score margin for a local decision
+        :param keyword_bonus: Score added to a tool whose keywords appear in the query
+        """
+        self.embed_model = embed_model
+        self.fallback = fallback
+        self.keyword_rules = {name: [k.lower() for k in keywords] for name, keywords in (keyword_rules or {}).items()}
+        self.margin_threshold = margin_threshold
+        self.keyword_bonus = keyword_bonus
+        self.local_decisions = 0
+        self.llm_fallbacks = 0
+        self._description_embeddings: Dict[str, np.ndarray] = {}
+
+    def _get_prompts(self) -> PromptDictType:
+        return {}
+
+    def _update_prompts(self, prompts: PromptDictType) -> None:
+        pass
+
+    @staticmethod
+    def _unit(embedding: List[float]) -> np.ndarray:
+        vector = np.asarray(embedding, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def _description_matrix(self, choices: Sequence[ToolMetadata]) -> np.ndarray:
+        missing = [c.description for c in choices if c.description not in self._description_embeddings]
+        if missing:
+            for description, embedding in zip(missing, self.embed_model.get_text_embedding_batch(missing)):
+                self._description_embeddings[description] = self._unit(embedding)
+        return np.stack([self._description_embeddings[c.description] for c in choices])
+
+    def _score(self, choices: Sequence[ToolMetadata], query: QueryBundle) -> np.ndarray:
+        scores = self._description_matrix(choices) @ self._unit(query.embedding)
+        query_str = query.query_str.lower()
+        for i, choice in enumerate(choices):
+            if any(keyword in query_str for keyword in self.keyword_rules.get(choice.name, ())):
+                scores[i] += self.keyword_bonus
+        return scores
+
+    def _decide(self, choices: Sequence[ToolMetadata], query: QueryBundle) -> Optional[SelectorResult]:
+        scores = self._score(choices, query)
+        order = np.argsort(-scores)
+        margin = float(scores[order[0]] - scores[order[1]]) if len(choices) > 1 else float("inf")
+        if margin < self.margin_threshold:
+            self.llm_fallbacks += 1
+            logger.info("Router fallback to LLM: query=%r scores=%s margin=%.4f", query.query_str, np.round(scores, 4).tolist(), margin)
+            return None
+        self.local_decisions += 1
+        best = int(order[0])
+        logger.info("Router local choice %d (%s): query=%r scores=%s margin=%.4f",
+                    best, choices[best].name, query.query_str, np.round(scores, 4).tolist(), margin)
+        return SelectorResult(selections=[SingleSelection(
+            index=best, reason=f"Local router: score {scores[best]:.3f}, margin {margin:.3f}"
+        )])
+
+    def _select(self, choices: Sequence[ToolMetadata], query: QueryBundle) -> SelectorResult:
+        with span("route"):
+            if query.embedding is None:
+                # kept on the bundle, so the retriever of the selected engine reuses it
+                query.embedding = self.embed_model.get_query_embedding(query.query_str)
+            return self._decide(choices, query) or self.fallback.select(choices, query)
+
+    async def _aselect(self, choices: Sequence[ToolMetadata], query: QueryBundle) -> SelectorResult:
+        with span("route"):
+            if query.embedding is None:
+                query.embedding = await self.embed_model.aget_query_embedding(query.query_str)
+            return self._decide(choices, query) or await self.fallback.aselect(choices, query)
+
+    def stats(self) -> Dict[str, float]:
+        """
+        Get the selection counters.
+
+        :return: Dictionary with local decisions, LLM fallbacks and the share of LLM calls avoided
+        """
+        total = self.local_decisions + self.llm_fallbacks
+        return {
+            "local_decisions": self.local_decisions,
+            "llm_fallbacks": self.llm_fallbacks,
+            "llm_calls_avoided": self.local_decisions / total if total else 0.0,
+        }
@@ -12,11 +12,12 @@ from llama_index.core.vector_stores import MetadataFilters
 from typing import List
 from llama_index.core.vector_stores import FilterCondition
 from llama_index.core.tools import FunctionTool
-from llama_index.llms.openai import OpenAI
 
 
 from llama_index.core import SummaryIndex
 from llama_index.core.tools import QueryEngineTool
+from backend.app.models import get_embed_model, get_llm
+from backend.app.engine_pool import QueryEnginePool
 
 
 documents = SimpleDirectoryReader(input_files=["transformers.pdf"]).load_data()
@@ -25,7 +26,23 @@ splitter = SentenceSplitter(chunk_size=1024)
 nodes = splitter.get_nodes_from_documents(documents)
 
 
-vector_index = VectorStoreIndex(nodes)
+vector_index = VectorStoreIndex(nodes, embed_model=get_embed_model())
+
+def build_query_engine(top_k: int, page_numbers, streaming: bool = False):
+    metadata_dicts = [
+        {"key": "page_label", "value": p} for p in page_numbers
+    ]
+    
+    return vector_index.as_query_engine(
+        similarity_top_k=top_k,
+        filters=MetadataFilters.from_dicts(
+            metadata_dicts,
+            condition=FilterCondition.OR
+        ),
+        streaming=streaming,
+    )
+
+engine_pool = QueryEnginePool(build_query_engine)
 
 def vector_query(
     query: str, 
@@ -39,17 +56,7 @@ def vector_query(
     
     """
 
-    metadata_dicts = [
-        {"key": "page_label", "value": p} for p in page_numbers
-    ]
-    
-    query_engine = vector_index.as_query_engine(
-        similarity_top_k=2,
-        filters=MetadataFilters.from_dicts(
-            metadata_dicts,
-            condition=FilterCondition.OR
-        )
-    )
+    query_engine = engine_pool.get(2, page_numbers)
     response = query_engine.query(query)
     return response
 
@@ -58,7 +65,7 @@ vector_query_tool = FunctionTool.from_defaults(
     fn=vector_query
 )
 
-llm = OpenAI(model="gpt-3.5-turbo", temperature=0)
+llm = get_llm("gpt-3.5-turbo", temperature=0)
 
 summary_index = SummaryIndex(nodes)
 summary_query_engine = summary_index.as_query_engine(
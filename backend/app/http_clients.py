@@ -0,0 +1,192 @@
+"""
+Process-wide HTTP clients shared by every LLM and embedding client, so
+connections (and their TLS sessions) are pooled and kept alive across
+requests instead of being opened per model object.
+"""
+import asyncio
+import importlib.util
+import threading
+import time
+import weakref
+from typing import Any, Dict, Optional
+import httpx
+from backend.app.config import HTTP_MAX_CONNECTIONS, HTTP_MAX_KEEPALIVE, HTTP_KEEPALIVE_EXPIRY, HTTP2
+
+HTTP2_AVAILABLE = importlib.util.find_spec("h2") is not None
+
+
+class PoolMetrics:
+    def __init__(self, name: str) -> None:
+        """
+        Initialize the PoolMetrics class, the counters of one connection pool.
+        They are fed by httpcore trace events: a request that connects opens a
+        new connection, any other reuses a pooled one. The pool wait is the
+        time until the request headers are sent, minus the time spent connecting.
+
+        :param name: Pool name
+        """
+        self.name = name
+        self.requests = 0
+        self.new_connections = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+        self.pools: "weakref.WeakSet[Any]" = weakref.WeakSet()
+        self._lock = threading.Lock()
+
+    def record(self, connected: bool, wait: float) -> None:
+        with self._lock:
+            self.requests += 1
+            self.new_connections += connected
+            self.wait_total += wait
+            self.wait_max = max(self.wait_max, wait)
+
+    def report(self) -> Dict[str, Any]:
+        """
+        Get the pool counters.
+
+        :return: Dictionary with open and idle connections, requests, new connections, reuse ratio and wait times
+        """
+        connections = [c for pool in list(self.pools) for c in pool.connections]
+        with self._lock:
+            requests, new_connections = self.requests, self.new_connections
+            wait_total, wait_max = self.wait_total, self.wait_max
+        return {
+            "open_connections": len(connections),
+            "idle_connections": sum(1 for c in connections if c.is_idle()),
+            "requests": requests,
+            "new_connections": new_connections,
+            "reuse_ratio": 1 - new_connections / requests if requests else 0.0,
+            "avg_wait_ms": wait_total / requests * 1000 if requests else 0.0,
+            "max_wait_ms": wait_max * 1000,
+            "http2": HTTP2 and HTTP2_AVAILABLE,
+        }
+
+
+class _RequestTrace:
+    def __init__(self, metrics: PoolMetrics) -> None:
+        self.metrics = metrics
+        self.start = time.perf_counter()
+        self.connect_start: Optional[float] = None
+        self.connect_time = 0.0
+        self.connected = False
+        self.recorded = False
+
+    def event(self, name: str) -> None:
+        now = time.perf_counter()
+        if name == "connection.connect_tcp.started":
+            self.connected = True
+            self.connect_start = now
+        elif name in ("connection.connect_tcp.complete", "connection.start_tls.complete") and self.connect_start:
+            self.connect_time = now - self.connect_start
+        elif name.endswith("send_request_headers.started") and not self.recorded:
+            self.recorded = True
+            self.metrics.record(self.connected, max(0.0, now - self.start - self.connect_time))
+
+
+class InstrumentedTransport(httpx.HTTPTransport):
+    def __init__(self, metrics: PoolMetrics, **kwargs: Any) -> None:
+        """
+        Initialize the InstrumentedTransport class, an HTTP transport that
+        reports its requests to `metrics`.
+
+        :param metrics: Counters of this pool
+        """
+        super().__init__(**kwargs)
+        self.metrics = metrics
+        metrics.pools.add(self._pool)
+
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        trace = _RequestTrace(self.metrics)
+        request.extensions["trace"] = lambda name, info: trace.event(name)
+        return super().handle_request(request)
+
+
+class AsyncInstrumentedTransport(httpx.AsyncHTTPTransport):
+    def __init__(self, metrics: PoolMetrics, **kwargs: Any) -> None:
+        """
+        Initialize the AsyncInstrumentedTransport class, the async counterpart
+        of InstrumentedTransport.
+
+        :param metrics: Counters of this pool
+        """
+        super().__init__(**kwargs)
+        self.metrics = metrics
+        metrics.pools.add(self._pool)
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        trace = _RequestTrace(self.metrics)
+
+        async def on_event(name: str, info: Dict[str, Any]) -> None:
+            trace.event(name)
+
+        request.extensions["trace"] = on_event
+        return await super().handle_async_request(request)
+
+
+_lock = threading.Lock()
+_metrics: Dict[str, PoolMetrics] = {}
+_clients: Dict[str, httpx.Client] = {}
+_async_clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, Dict[str, httpx.AsyncClient]]" = (
+    weakref.WeakKeyDictionary()
+)
+
+
+def _transport_kwargs() -> Dict[str, Any]:
+    return {
+        "limits": httpx.Limits(
+            max_connections=HTTP_MAX_CONNECTIONS,
+            max_keepalive_connections=HTTP_MAX_KEEPALIVE,
+            keepalive_expiry=HTTP_KEEPALIVE_EXPIRY,
+        ),
+        "http2": HTTP2 and HTTP2_AVAILABLE,
+    }
+
+
+def _pool_metrics(name: str) -> PoolMetrics:
+    if name not in _metrics:
+        _metrics[name] = PoolMetrics(name)
+    return _metrics[name]
+
+
+def get_http_client(name: str = "openai") -> httpx.Client:
+    """
+    Get the process-wide synchronous HTTP client of a pool. It is thread-safe
+    and shared by every model object using the pool.
+
+    :param name: Pool name
+    :return: httpx.Client instance
+    """
+    with _lock:
+        if name not in _clients:
+            transport = InstrumentedTransport(_pool_metrics(name), **_transport_kwargs())
+            _clients[name] = httpx.Client(transport=transport, follow_redirects=True)
+        return _clients[name]
+
+
+def get_async_http_client(name: str = "openai") -> httpx.AsyncClient:
+    """
+    Get the asynchronous HTTP client of a pool for the running event loop.
+    Async connections belong to the loop that opened them, so there is one
+    client per pool and event loop.
+
+    :param name: Pool name
+    :return: httpx.AsyncClient instance
+    """
+    loop = asyncio.get_running_loop()
+    with _lock:
+        clients = _async_clients.setdefault(loop, {})
+        if name not in clients:
+            transport = AsyncInstrumentedTransport(_pool_metrics(name), **_transport_kwargs())
+            clients[name] = httpx.AsyncClient(transport=transport, follow_redirects=True)
+        return clients[name]
+
+
+def http_pool_stats() -> Dict[str, Dict[str, Any]]:
+    """
+    Get the counters of every connection pool.
+
+    :return: Dictionary of pool names and their counters
+    """
+    with _lock:
+        metrics = list(_metrics.values())
+    return {m.name: m.report() for m in metrics}
@@ -0,0 +1,223 @@
+import os
+import re
+from collections import Counter
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+import numpy as np
+from llama_index.core.base.embeddings.base import BaseEmbedding
+from llama_index.core.schema import MetadataMode, NodeWithScore, QueryBundle
+from backend.app.metadata_index import MetadataIndex, MetadataIndexRetriever
+
+TOKEN_PATTERN = re.compile(r"\w+")
+
+
+def tokenize(text: str) -> List[str]:
+    return TOKEN_PATTERN.findall(text.lower())
+
+
+def reciprocal_rank_fusion(rankings: Sequence[List[Tuple[str, float]]], k: int = 60) -> List[Tuple[str, float]]:
+    """
+    Fuse rankings by reciprocal rank: every list contributes 1 / (k + rank) to each of its items.
+
+    :param rankings: Lists of (node ID, score), best first
+    :param k: Damping constant; larger values flatten the contribution of the top ranks
+    :return: List of (node ID, fused score), best first
+    """
+    fused: Dict[str, float] = {}
+    for ranking in rankings:
+        for rank, (node_id, _) in enumerate(ranking, start=1):
+            fused[node_id] = fused.get(node_id, 0.0) + 1.0 / (k + rank)
+    return sorted(fused.items(), key=lambda item: item[1], reverse=True)
+
+
+class BM25Index:
+    def __init__(self, node_ids: List[str], texts: List[str], k1: float = 1.2, b: float = 0.75) -> None:
+        """
+        Initialize the BM25Index class. The postings of every term are stored
+        as one CSR layout (offsets into flat row and weight arrays), and the
+        BM25 weight of each posting is precomputed, so a query only sums the
+        weights of its terms into a score vector.
+
+        :param node_ids: Node IDs, one per text (rows must line up with the MetadataIndex used for filters)
+        :param texts: Node texts
+        :param k1: Term frequency saturation
+        :param b: Document length normalization
+        """
+        self.node_ids = list(node_ids)
+        self.k1, self.b = k1, b
+        counts = [Counter(tokenize(text)) for text in texts]
+        lengths = np.array([sum(c.values()) for c in counts], dtype=np.float32)
+        avg_length = float(lengths.mean()) if len(lengths) and lengths.mean() > 0 else 1.0
+        postings: Dict[str, List[Tuple[int, int]]] = {}
+        for row, term_counts in enumerate(counts):
+            for term, tf in term_counts.items():
+                postings.setdefault(term, []).append((row, tf))
+
+        n = len(self.node_ids)
+        self.vocab: Dict[str, int] = {}
+        offsets = [0]
+        rows: List[np.ndarray] = []
+        weights: List[np.ndarray] = []
+        for term, entries in postings.items():
+            self.vocab[term] = len(self.vocab)
+            term_rows = np.array([r for r, _ in entries], dtype=np.int32)
+            tf = np.array([t for _, t in entries], dtype=np.float32)
+            idf = np.log(1 + (n - len(entries) + 0.5) / (len(entries) + 0.5))
+            norm = k1 * (1 - b + b * lengths[term_rows] / avg_length)
+            rows.append(term_rows)
+            weights.append((idf * tf * (k1 + 1) / (tf + norm)).astype(np.float32))
+            offsets.append(offsets[-1] + len(entries))
+        self.offsets = np.array(offsets, dtype=np.int64)
+        self.rows = np.concatenate(rows) if rows else np.zeros(0, dtype=np.int32)
+        self.weights = np.concatenate(weights) if weights else np.zeros(0, dtype=np.float32)
+
+    @classmethod
+    def from_docstore(cls, node_ids: List[str], docstore: Any, **kwargs: Any) -> "BM25Index":
+        """
+        Build the index from the text of the nodes in a docstore.
+
+        :param node_ids: Node IDs, in MetadataIndex row order
+        :param docstore: Docstore holding the nodes
+        :return: BM25Index instance
+        """
+        nodes = docstore.get_nodes(node_ids)
+        return cls(node_ids, [node.get_content(metadata_mode=MetadataMode.NONE) for node in nodes], **kwargs)
+
+    def save(self, path: str) -> None:
+        """
+        Atomically write the index, with the k1 and b it was built with, to an .npz file.
+
+        :param path: File path
+        """
+        terms = sorted(self.vocab, key=self.vocab.get)
+        tmp_path = f"{path}.tmp-{os.getpid()}.npz"
+        np.savez(tmp_path, node_ids=np.array(self.node_ids, dtype=str), terms=np.array(terms, dtype=str),
+                 offsets=self.offsets, rows=self.rows, weights=self.weights,
+                 params=np.array([self.k1, self.b], dtype=np.float64))
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str) -> Optional["BM25Index"]:
+        """
+        Load an index written by `save`. Indices saved before k1 and b were
+        stored have both set to None, so they never match the configured ones.
+
+        :param path: File path
+        :return: BM25Index instance, or None if there is no such file
+        """
+        if not os.path.exists(path):
+            return None
+        with np.load(path) as data:
+            index = cls.__new__(cls)
+            index.node_ids = data["node_ids"].tolist()
+            index.vocab = {term: i for i, term in enumerate(data["terms"].tolist())}
+            index.offsets, index.rows, index.weights = data["offsets"], data["rows"], data["weights"]
+            index.k1, index.b = data["params"].tolist() if "params" in data else (None, None)
+        return index
+
+    def replace_with(self, other: "BM25Index") -> None:
+        """
+        Take over the contents of another index, so retrievers holding this
+        instance see the rebuilt data.
+
+        :param other: Freshly built index
+        """
+        self.node_ids, self.vocab, self.offsets, self.rows, self.weights, self.k1, self.b = (
+            other.node_ids, other.vocab, other.offsets, other.rows, other.weights, other.k1, other.b
+        )
+
+    def search(self, query: str, top_k: int, mask: Optional[np.ndarray] = None) -> List[Tuple[str, float]]:
+        """
+        Score the nodes containing any of the query terms.
+
+        :param query: Query string
+        :param top_k: Number of nodes to return
+        :param mask: Boolean mask of the allowed nodes (see MetadataIndex.candidates)
+        :return: List of (node ID, score), best first
+        """
+        terms = [self.vocab[t] for t in set(tokenize(query)) if t in self.vocab]
+        if not terms:
+            return []
+        scores = np.zeros(len(self.node_ids), dtype=np.float32)
+        for term in terms:
+            start, end = self.offsets[term], self.offsets[term + 1]
+            scores[self.rows[start:end]] += self.weights[start:end]
+        if mask is not None:
+            scores *= mask
+        hits = np.flatnonzero(scores)
+        if len(hits) == 0:
+            return []
+        k = min(top_k, len(hits))
+        best = hits[np.argpartition(-scores[hits], k - 1)[:k]]
+        best = best[np.argsort(-scores[best])]
+        return [(self.node_ids[i], float(scores[i])) for i in best]
+
+
+class HybridRetriever(MetadataIndexRetriever):
+    def __init__(self, metadata_index: MetadataIndex, bm25_index: BM25Index, docstore: Any, embed_model: BaseEmbedding,
+                 similarity_top_k: int = 2, filters: Optional[Dict[str, Iterable[Any]]] = None,
+                 candidate_k: int = 10, rrf_k: int = 60, **kwargs: Any) -> None:
+        """
+        Initialize the HybridRetriever class. The dense (MetadataIndex) and
+        sparse (BM25) searches each return `candidate_k` nodes matching the
+        filters, and the two rankings are merged by reciprocal rank fusion.
+        The nodes keep the fused order but are scored by their cosine
+        similarity to the query, as with dense retrieval.
+
+        :param metadata_index: Metadata index for the dense search and the filters
+        :param bm25_index: BM25 index over the same nodes, in the same row order
+        :param docstore: Docstore holding the nodes
+        :param embed_model: Embedding model for the query
+        :param similarity_top_k: Number of nodes to retrieve
+        :param filters: Allowed values per metadata key, e.g. {"page_label": ["1", "2"]}
+        :param candidate_k: Number of candidates taken from each search before fusion
+        :param rrf_k: Reciprocal rank fusion constant
+        """
+        super().__init__(metadata_index, docstore, embed_model, similarity_top_k, filters, **kwargs)
+        self.bm25_index = bm25_index
+        self.candidate_k = candidate_k
+        self.rrf_k = rrf_k
+
+    def _similarities(self, hits: List[Tuple[str, float]], query_embedding: List[float]) -> List[Tuple[str, float]]:
+        """
+        Replace the fused scores, which only rank, by the cosine similarity of
+        every node to the query (also for nodes found by BM25 alone).
+
+        :param hits: Fused (node ID, score), best first
+        :param query_embedding: Query embedding
+        :return: List of (node ID, similarity) in the fused order
+        """
+        if not hits:
+            return hits
+        rows = np.array([self.metadata_index.positions[node_id] for node_id, _ in hits])
+        query = np.asarray(query_embedding, dtype=np.float32)
+        scores = np.asarray(self.metadata_index.vectors(rows), dtype=np.float32) @ (query / (np.linalg.norm(query) or 1))
+        return [(node_id, float(score)) for (node_id, _), score in zip(hits, scores)]
+
+    def _fuse(self, query_bundle: QueryBundle) -> List[Tuple[str, float]]:
+        k = max(self.candidate_k, self.similarity_top_k)
+        dense = self.metadata_index.search(query_bundle.embedding, k, self.filters)
+        sparse = self.bm25_index.search(query_bundle.query_str, k, self.metadata_index.candidates(self.filters))
+        fused = reciprocal_rank_fusion([dense, sparse], self.rrf_k)[:self.similarity_top_k]
+        return self._similarities(fused, query_bundle.embedding)
+
+    def _retrieve(self, query_bundle: QueryBundle) -> List[NodeWithScore]:
+        if query_bundle.embedding is None:
+            query_bundle.embedding = self.embed_model.get_query_embedding(query_bundle.query_str)
+        return self._to_nodes(self._fuse(query_bundle))
+
+    def _search_batch(self, query_bundles: List[QueryBundle], top_k: int) -> List[List[Tuple[str, float]]]:
+        k = max(self.candidate_k, top_k)
+        mask = self.metadata_index.candidates(self.filters)
+        dense = self.metadata_index.search_batch([q.embedding for q in query_bundles], k, self.filters)
+        return [
+            self._similarities(
+                reciprocal_rank_fusion([hits, self.bm25_index.search(q.query_str, k, mask)], self.rrf_k)[:top_k],
+                q.embedding,
+            )
+            for q, hits in zip(query_bundles, dense)
+        ]
+
+    async def _aretrieve(self, query_bundle: QueryBundle) -> List[NodeWithScore]:
+        if query_bundle.embedding is None:
+            query_bundle.embedding = await self.embed_model.aget_query_embedding(query_bundle.query_str)
+        return self._to_nodes(self._fuse(query_bundle))
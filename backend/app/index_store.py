@@ -0,0 +1,261 @@
+import glob
+import hashlib
+import json
+import os
+import shutil
+import uuid
+from itertools import islice
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+from llama_index.core import StorageContext, SummaryIndex, VectorStoreIndex, load_index_from_storage
+from llama_index.core.vector_stores.types import VectorStore
+from backend.app.ingestion import IngestionManifest
+from backend.app.mmap_store import MmapVectorStore
+
+INDEX_FORMAT_VERSION = 2
+SUMMARY_INDEX_ID = "summary"
+VECTOR_INDEX_ID = "vector"
+META_FILE = "meta.json"
+SUMMARY_TREE_FILE = "summary_tree.json"
+BM25_FILE = "bm25.npz"
+IVF_FILE = "ivf.npz"
+
+
+class IndexStore:
+    def __init__(self, persist_dir: str, vector_store: str = "simple", quantization: str = "none",
+                 rerank_factor: int = 4) -> None:
+        """
+        Initialize the IndexStore class.
+
+        :param persist_dir: Directory the indices are persisted to
+        :param vector_store: "simple" (in-memory, JSON) or "mmap" (memory-mapped float32 file)
+        :param quantization: "none" or "int8" (mmap vector store only)
+        :param rerank_factor: Candidates re-scored at full precision per result with int8 quantization
+        """
+        self.persist_dir = persist_dir
+        self.vector_store = vector_store
+        self.quantization = quantization
+        self.rerank_factor = rerank_factor
+        self._storage_context: Optional[StorageContext] = None
+
+    @staticmethod
+    def default_dir(root: str, input_files: List[str]) -> str:
+        """
+        Get the persist directory for a set of input files, so that bots over
+        different files never overwrite each other's indices.
+
+        :param root: Root directory holding all persisted indices
+        :param input_files: List of input file paths
+        :return: Persist directory path
+        """
+        names = "\n".join(sorted(os.path.abspath(f) for f in input_files))
+        return os.path.join(root, hashlib.sha256(names.encode()).hexdigest()[:16])
+
+    @staticmethod
+    def hash_file(path: str) -> str:
+        """
+        Compute the SHA-256 content hash of a file.
+
+        :param path: File path
+        :return: Hex digest
+        """
+        digest = hashlib.sha256()
+        with open(path, "rb") as f:
+            for block in iter(lambda: f.read(1 << 20), b""):
+                digest.update(block)
+        return digest.hexdigest()
+
+    @staticmethod
+    def compute_settings_key(settings: Dict[str, Any]) -> str:
+        """
+        Compute the key of the splitter and embedding settings. Indices built
+        with other settings cannot be updated incrementally and are rebuilt.
+
+        :param settings: Splitter and embedding settings
+        :return: Settings key
+        """
+        payload = {"version": INDEX_FORMAT_VERSION, "settings": settings}
+        return hashlib.sha256(json.dumps(payload, sort_keys=True).encode()).hexdigest()
+
+    @classmethod
+    def compute_key(cls, input_files: List[str], settings: Dict[str, Any]) -> str:
+        """
+        Compute the index key from the input file contents plus the splitter
+        and embedding settings. Any change to either invalidates the index.
+
+        :param input_files: List of input file paths
+        :param settings: Splitter and embedding settings
+        :return: Index key
+        """
+        payload = {
+            "settings": cls.compute_settings_key(settings),
+            "files": sorted(cls.hash_file(f) for f in input_files),
+        }
+        return hashlib.sha256(json.dumps(payload, sort_keys=True).encode()).hexdigest()
+
+    def read_meta(self) -> Dict[str, Any]:
+        """
+        Read the metadata stored next to the persisted indices.
+
+        :return: Metadata dictionary (empty if nothing is persisted)
+        """
+        try:
+            with open(os.path.join(self.persist_dir, META_FILE)) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def read_json(self, name: str) -> Optional[Dict[str, Any]]:
+        """
+        Read a JSON file stored next to the persisted indices.
+
+        :param name: File name
+        :return: Parsed content, or None if the file does not exist
+        """
+        try:
+            with open(os.path.join(self.persist_dir, name)) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def write_json(self, name: str, data: Dict[str, Any]) -> None:
+        """
+        Atomically write a JSON file next to the persisted indices. Note that
+        `persist` replaces the whole directory, so write these afterwards.
+
+        :param name: File name
+        :param data: Content to write
+        """
+        os.makedirs(self.persist_dir, exist_ok=True)
+        path = os.path.join(self.persist_dir, name)
+        with open(f"{path}.tmp-{os.getpid()}", "w") as f:
+            json.dump(data, f)
+        os.replace(f"{path}.tmp-{os.getpid()}", path)
+
+    def matches(self, key: str) -> bool:
+        """
+        Check whether the persisted indices were built for the given key.
+
+        :param key: Index key
+        :return: True if the persisted indices can be reused
+        """
+        return self.read_meta().get("key") == key
+
+    def matches_settings(self, settings_key: str) -> bool:
+        """
+        Check whether the persisted indices were built with the given settings,
+        so they can be refreshed incrementally.
+
+        :param settings_key: Settings key
+        :return: True if the persisted indices can be refreshed
+        """
+        return self.read_meta().get("settings_key") == settings_key
+
+    def load_manifest(self) -> IngestionManifest:
+        """
+        Load the ingestion manifest persisted with the indices.
+
+        :return: IngestionManifest instance (empty if nothing is persisted)
+        """
+        return IngestionManifest.from_dict(self.read_meta().get("manifest", {}))
+
+    @property
+    def storage_context(self) -> StorageContext:
+        """
+        Storage context backed by the persist directory (loaded once).
+        """
+        if self._storage_context is None:
+            # resolve the version once, so a concurrent `persist` cannot swap it between two files
+            version_dir = os.path.realpath(self.persist_dir)
+            self._storage_context = StorageContext.from_defaults(
+                persist_dir=version_dir, vector_store=self.create_vector_store(version_dir)
+            )
+        return self._storage_context
+
+    def create_vector_store(self, persist_dir: Optional[str] = None) -> Optional[VectorStore]:
+        """
+        Create the configured vector store, loading it from `persist_dir` if given.
+
+        :param persist_dir: Directory to load the vector store from
+        :return: Vector store, or None for the default SimpleVectorStore
+        """
+        if self.vector_store != "mmap":
+            return None
+        kwargs = {"quantization": self.quantization, "rerank_factor": self.rerank_factor}
+        if persist_dir is None:
+            return MmapVectorStore(**kwargs)
+        return MmapVectorStore.from_persist_dir(persist_dir, **kwargs)
+
+    def load_nodes(self) -> List[Any]:
+        """
+        Load the persisted nodes from the docstore.
+
+        :return: List of nodes
+        """
+        return list(self.storage_context.docstore.docs.values())
+
+    def load_indices(self) -> Tuple[SummaryIndex, VectorStoreIndex]:
+        """
+        Load the persisted summary and vector indices.
+
+        :return: Tuple containing summary index and vector index
+        """
+        summary_index = load_index_from_storage(self.storage_context, index_id=SUMMARY_INDEX_ID)
+        vector_index = load_index_from_storage(self.storage_context, index_id=VECTOR_INDEX_ID)
+        return summary_index, vector_index
+
+    def build_indices(self, nodes: Iterable[Any], batch_size: int = 1000) -> Tuple[SummaryIndex, VectorStoreIndex]:
+        """
+        Build summary and vector indices over a shared storage context. Nodes
+        are inserted in batches as they arrive, and their embeddings are
+        dropped once the vector store has them, so only one batch is held
+        in memory besides the indices.
+
+        :param nodes: Embedded nodes (e.g. straight from the ingestion pipeline)
+        :param batch_size: Nodes inserted at once
+        :return: Tuple containing summary index and vector index
+        """
+        storage_context = StorageContext.from_defaults(vector_store=self.create_vector_store())
+        summary_index = SummaryIndex([], storage_context=storage_context)
+        summary_index.set_index_id(SUMMARY_INDEX_ID)
+        vector_index = VectorStoreIndex([], storage_context=storage_context)
+        vector_index.set_index_id(VECTOR_INDEX_ID)
+        nodes = iter(nodes)
+        while batch := list(islice(nodes, batch_size)):
+            vector_index.insert_nodes(batch)
+            for node in batch:
+                node.embedding = None
+            # after the vector index, so the docstore keeps the nodes without their embeddings
+            summary_index.insert_nodes(batch)
+        self._storage_context = storage_context
+        return summary_index, vector_index
+
+    def persist(self, key: str, settings_key: str, manifest: IngestionManifest) -> None:
+        """
+        Persist the current storage context under the given key. Every
+        persist writes a new version directory next to `persist_dir`, which
+        is a symlink to the current version; the symlink is replaced
+        atomically, so a concurrently starting worker sees either the old
+        or the new index, never a half-written or missing one. The previous
+        version is kept for workers still loading it; older ones are removed.
+
+        :param key: Index key
+        :param settings_key: Settings key
+        :param manifest: Ingestion manifest of the indexed files
+        """
+        version_dir = f"{self.persist_dir}.v-{uuid.uuid4().hex[:12]}"
+        self.storage_context.persist(persist_dir=version_dir)
+        with open(os.path.join(version_dir, META_FILE), "w") as f:
+            json.dump({"key": key, "settings_key": settings_key, "manifest": manifest.to_dict()}, f)
+        previous = os.path.realpath(self.persist_dir)
+        if os.path.isdir(self.persist_dir) and not os.path.islink(self.persist_dir):
+            # persisted by an older version as a plain directory: move it aside once
+            previous = f"{self.persist_dir}.v-legacy-{os.getpid()}"
+            os.replace(self.persist_dir, previous)
+        link = f"{self.persist_dir}.link-{os.getpid()}"
+        if os.path.lexists(link):
+            os.remove(link)
+        os.symlink(os.path.basename(version_dir), link)
+        os.replace(link, self.persist_dir)
+        for stale in glob.glob(f"{glob.escape(self.persist_dir)}.v-*"):
+            if os.path.realpath(stale) not in (os.path.realpath(version_dir), previous):
+                shutil.rmtree(stale, ignore_errors=True)
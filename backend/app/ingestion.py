@@ -0,0 +1,161 @@
+import hashlib
+import os
+from collections import defaultdict
+from typing import Any, Dict, List, NamedTuple, Optional, Tuple
+
+
+class PageRecord(NamedTuple):
+    """What the manifest needs of a page document, without keeping its text in memory."""
+
+    doc_id: str
+    metadata: Dict[str, Any]
+    hash: str
+
+
+class IngestionManifest:
+    def __init__(self, files: Optional[Dict[str, Dict[str, Any]]] = None) -> None:
+        """
+        Initialize the IngestionManifest class. For every ingested file it
+        records the file hash and, per page, the page content hash together
+        with the document and node IDs the page produced.
+
+        :param files: Manifest entries keyed by absolute file path
+        """
+        self.files: Dict[str, Dict[str, Any]] = files or {}
+
+    @staticmethod
+    def file_key(path: str) -> str:
+        return os.path.abspath(path)
+
+    @staticmethod
+    def page_hash(document: Any) -> str:
+        """
+        Hash the text of a page (metadata such as the creation date is ignored).
+
+        :param document: Page document or PageRecord
+        :return: Hex digest
+        """
+        if isinstance(document, PageRecord):
+            return document.hash
+        return hashlib.sha256(document.get_content().encode()).hexdigest()
+
+    @staticmethod
+    def page_record(document: Any) -> PageRecord:
+        """
+        Keep what `update_file` needs of a page document.
+
+        :param document: Page document
+        :return: PageRecord instance
+        """
+        return PageRecord(document.doc_id, document.metadata, IngestionManifest.page_hash(document))
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"files": self.files}
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "IngestionManifest":
+        return cls(data.get("files"))
+
+    def file_hash(self, path: str) -> Optional[str]:
+        """
+        Get the recorded content hash of a file.
+
+        :param path: File path
+        :return: Hex digest, or None if the file was never ingested
+        """
+        return self.files.get(self.file_key(path), {}).get("hash")
+
+    @staticmethod
+    def group_by_file(documents: List[Any]) -> Dict[str, List[Any]]:
+        """
+        Group page documents by the file they were loaded from, keeping page order.
+
+        :param documents: List of page documents
+        :return: Dictionary of absolute file path and page documents
+        """
+        grouped: Dict[str, List[Any]] = defaultdict(list)
+        for document in documents:
+            grouped[IngestionManifest.file_key(document.metadata["file_path"])].append(document)
+        return grouped
+
+    @staticmethod
+    def _take(entries: List[Dict[str, Any]], page_label: Any) -> Dict[str, Any]:
+        """
+        Take the entry of an unchanged page, preferring one at the same page label.
+
+        :param entries: Unmatched entries with the page's content hash
+        :param page_label: Label of the page in the freshly loaded file
+        :return: The matched entry (removed from `entries`)
+        """
+        for i, entry in enumerate(entries):
+            if entry.get("page_label") == page_label:
+                return entries.pop(i)
+        return entries.pop()
+
+    def diff(self, path: str, documents: List[Any]) -> Tuple[List[Dict[str, Any]], List[Any], List[Tuple[Dict[str, Any], Any]]]:
+        """
+        Compare the freshly loaded pages of a file against the manifest. Pages
+        are matched by content hash, so inserting or removing a page does not
+        re-ingest the pages after it; those pages are reported as moved, since
+        their page label (and the metadata of their nodes) must be updated.
+
+        :param path: File path
+        :param documents: Freshly loaded page documents of the file
+        :return: Tuple of stale page entries (to delete), changed page documents (to ingest)
+                 and moved pages as (entry, document) pairs (to relabel)
+        """
+        unmatched: Dict[str, List[Dict[str, Any]]] = defaultdict(list)
+        for page in self.files.get(self.file_key(path), {}).get("pages", []):
+            unmatched[page["hash"]].append(page)
+        changed, moved = [], []
+        for document in documents:
+            entries = unmatched.get(self.page_hash(document))
+            if not entries:
+                changed.append(document)
+                continue
+            entry = self._take(entries, document.metadata.get("page_label"))
+            if entry.get("page_label") != document.metadata.get("page_label"):
+                moved.append((entry, document))
+        stale = [page for pages in unmatched.values() for page in pages]
+        return stale, changed, moved
+
+    def update_file(self, path: str, file_hash: str, documents: List[Any], nodes: List[Any]) -> None:
+        """
+        Record the pages of a file. Pages whose hash is already recorded keep
+        their previous nodes (which stay in the indices) under their current
+        page label; the others are recorded with the nodes produced from them.
+
+        :param path: File path
+        :param file_hash: Content hash of the file
+        :param documents: All page documents (or PageRecords) of the file
+        :param nodes: Nodes produced from the changed pages
+        """
+        previous: Dict[str, List[Dict[str, Any]]] = defaultdict(list)
+        for page in self.files.get(self.file_key(path), {}).get("pages", []):
+            previous[page["hash"]].append(page)
+        node_ids: Dict[str, List[str]] = defaultdict(list)
+        for node in nodes:
+            node_ids[node.ref_doc_id].append(node.node_id)
+        pages = []
+        for document in documents:
+            page_hash = self.page_hash(document)
+            page_label = document.metadata.get("page_label")
+            if document.doc_id not in node_ids and previous.get(page_hash):
+                pages.append({**self._take(previous[page_hash], page_label), "page_label": page_label})
+            else:
+                pages.append({
+                    "page_label": page_label,
+                    "hash": page_hash,
+                    "ref_doc_id": document.doc_id,
+                    "node_ids": node_ids[document.doc_id],
+                })
+        self.files[self.file_key(path)] = {"hash": file_hash, "pages": pages}
+
+    def remove_file(self, path: str) -> List[Dict[str, Any]]:
+        """
+        Forget a file.
+
+        :param path: File path
+        :return: The page entries the file had (to delete)
+        """
+        return self.files.pop(self.file_key(path), {}).get("pages", [])
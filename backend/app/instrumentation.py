@@ -0,0 +1,337 @@
+"""
+Low-overhead instrumentation: stage spans with latency histograms, LLM
+token counters and cache statistics, rendered in the Prometheus text
+format, plus a per-request trace that collects the spans of one request.
+"""
+import bisect
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+from llama_index.core import Settings
+from llama_index.core.callbacks.base_handler import BaseCallbackHandler
+from llama_index.core.callbacks.schema import CBEventType, EventPayload
+
+LabelValues = Tuple[str, ...]
+Sample = Tuple[str, Dict[str, str], float]
+
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def _escape_label(value: Any) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(labels: Dict[str, str]) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape_label(v)}"' for k, v in labels.items()) + "}"
+
+
+class Counter:
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> None:
+        """
+        Initialize the Counter class, a monotonically increasing value per label set.
+
+        :param name: Metric name
+        :param documentation: Help text
+        :param labelnames: Label names
+        """
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.values: Dict[LabelValues, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0, **labels: str) -> None:
+        key = tuple(str(labels[n]) for n in self.labelnames)
+        with self._lock:
+            self.values[key] = self.values.get(key, 0.0) + amount
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            values = list(self.values.items())
+        for key, value in values:
+            lines.append(f"{self.name}{_format_labels(dict(zip(self.labelnames, key)))} {value}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS) -> None:
+        """
+        Initialize the Histogram class, cumulative bucket counts, sum and count
+        per label set.
+
+        :param name: Metric name
+        :param documentation: Help text
+        :param labelnames: Label names
+        :param buckets: Upper bounds of the buckets, ascending
+        """
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self.values: Dict[LabelValues, List[float]] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels: str) -> None:
+        key = tuple(str(labels[n]) for n in self.labelnames)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            counts = self.values.get(key)
+            if counts is None:
+                # One count per bucket, then +Inf, sum
+                counts = self.values[key] = [0.0] * (len(self.buckets) + 2)
+            counts[index] += 1
+            counts[-1] += value
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            values = [(key, list(counts)) for key, counts in self.values.items()]
+        for key, counts in values:
+            labels = dict(zip(self.labelnames, key))
+            cumulative = 0.0
+            for bound, count in zip(self.buckets + (float("inf"),), counts[:-1]):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                lines.append(f"{self.name}_bucket{_format_labels({**labels, 'le': le})} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(labels)} {counts[-1]}")
+            lines.append(f"{self.name}_count{_format_labels(labels)} {cumulative}")
+        return lines
+
+
+class MetricsRegistry:
+    def __init__(self) -> None:
+        """
+        Initialize the MetricsRegistry class. Besides counters and histograms,
+        collectors (functions returning the current statistics of a component)
+        are read at scrape time and rendered as gauges.
+        """
+        self.metrics: List[Any] = []
+        self.collectors: Dict[str, Tuple[str, Callable[[], Dict[str, Any]]]] = {}
+        self._lock = threading.Lock()
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        metric = Counter(name, documentation, labelnames)
+        self.metrics.append(metric)
+        return metric
+
+    def histogram(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                  buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+        metric = Histogram(name, documentation, labelnames, buckets)
+        self.metrics.append(metric)
+        return metric
+
+    def register_collector(self, name: str, documentation: str, collect: Callable[[], Dict[str, Any]]) -> None:
+        """
+        Expose the numeric fields of a statistics dictionary as gauges named
+        `rag_<name>_<field>`. Nested dictionaries (e.g. one per pool) become a
+        `key` label. Registering a name again replaces the collector.
+
+        :param name: Component name
+        :param documentation: Help text
+        :param collect: Returns the component's statistics
+        """
+        with self._lock:
+            self.collectors[name] = (documentation, collect)
+
+    @staticmethod
+    def _gauge_samples(name: str, stats: Dict[str, Any], labels: Dict[str, str]) -> Iterator[Sample]:
+        for field, value in stats.items():
+            if isinstance(value, dict):
+                yield from MetricsRegistry._gauge_samples(name, value, {**labels, "key": str(field)})
+            elif isinstance(value, (int, float)):
+                yield f"rag_{name}_{field}", labels, float(value)
+
+    def render(self) -> str:
+        """
+        Render every metric in the Prometheus text exposition format.
+
+        :return: Exposition text
+        """
+        lines: List[str] = []
+        for metric in self.metrics:
+            lines.extend(metric.render())
+        with self._lock:
+            collectors = list(self.collectors.items())
+        gauges: Dict[str, Tuple[str, List[Sample]]] = {}
+        for name, (documentation, collect) in collectors:
+            try:
+                stats = collect()
+            except Exception:
+                continue
+            for sample in self._gauge_samples(name, stats, {}):
+                gauges.setdefault(sample[0], (documentation, []))[1].append(sample)
+        for metric_name, (documentation, samples) in gauges.items():
+            lines.append(f"# HELP {metric_name} {documentation}")
+            lines.append(f"# TYPE {metric_name} gauge")
+            lines.extend(f"{metric_name}{_format_labels(labels)} {value}" for _, labels, value in samples)
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = MetricsRegistry()
+STAGE_SECONDS = REGISTRY.histogram(
+    "rag_stage_duration_seconds", "Latency of the ingestion and query stages", ["stage"]
+)
+LLM_TOKENS = REGISTRY.counter("rag_llm_tokens_total", "LLM tokens by kind (prompt or completion)", ["kind"])
+LLM_CALLS = REGISTRY.counter("rag_llm_calls_total", "LLM calls")
+CONTEXT_TOKENS = REGISTRY.counter(
+    "rag_context_tokens_total",
+    "Context tokens by kind (candidates retrieved, baseline of the top-k retrieval, kept for synthesis)",
+    ["kind"],
+)
+HTTP_REQUEST_SECONDS = REGISTRY.histogram(
+    "rag_http_request_duration_seconds", "Latency of the HTTP requests", ["method", "path", "status"]
+)
+
+
+class Trace:
+    def __init__(self, trace_id: str) -> None:
+        """
+        Initialize the Trace class, the spans recorded while serving one request.
+
+        :param trace_id: Trace ID returned to the client
+        """
+        self.trace_id = trace_id
+        self.spans: List[Tuple[str, float]] = []
+        self.counters: Dict[str, float] = {}
+
+    def server_timing(self) -> str:
+        """
+        Summarize the spans as a Server-Timing header value (total milliseconds per stage).
+
+        :return: Header value
+        """
+        totals: Dict[str, float] = {}
+        for stage, seconds in self.spans:
+            totals[stage] = totals.get(stage, 0.0) + seconds
+        return ", ".join(f"{stage};dur={seconds * 1000:.1f}" for stage, seconds in totals.items())
+
+
+current_trace: ContextVar[Optional[Trace]] = ContextVar("current_trace", default=None)
+
+
+def new_trace() -> Trace:
+    """
+    Start the trace of a request in the current context. The trace ID is
+    always generated here, since it also keys the stored answer of the request.
+
+    :return: Trace instance
+    """
+    trace = Trace(uuid.uuid4().hex)
+    current_trace.set(trace)
+    return trace
+
+
+def record_span(stage: str, seconds: float) -> None:
+    """
+    Record the duration of a stage in its histogram and the current trace.
+
+    :param stage: Stage name
+    :param seconds: Duration
+    """
+    STAGE_SECONDS.observe(seconds, stage=stage)
+    trace = current_trace.get()
+    if trace is not None:
+        trace.spans.append((stage, seconds))
+
+
+def count(name: str, value: float) -> None:
+    """
+    Add `value` to a counter of the current trace (e.g. context tokens saved).
+
+    :param name: Counter name
+    :param value: Amount to add
+    """
+    trace = current_trace.get()
+    if trace is not None:
+        trace.counters[name] = trace.counters.get(name, 0.0) + value
+
+
+@contextmanager
+def span(stage: str) -> Iterator[None]:
+    """
+    Time the enclosed block as one span of `stage`.
+
+    :param stage: Stage name
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_span(stage, time.perf_counter() - start)
+
+
+class MetricsCallbackHandler(BaseCallbackHandler):
+    """llama-index callback handler that turns query events into spans and counts LLM tokens."""
+
+    STAGES = {
+        CBEventType.QUERY: "query",
+        CBEventType.RETRIEVE: "retrieve",
+        CBEventType.SYNTHESIZE: "synthesize",
+        CBEventType.LLM: "llm",
+        CBEventType.EMBEDDING: "embedding",
+        CBEventType.FUNCTION_CALL: "tool",
+    }
+
+    def __init__(self) -> None:
+        super().__init__(event_starts_to_ignore=[], event_ends_to_ignore=[])
+        self._starts: Dict[str, float] = {}
+
+    def on_event_start(self, event_type: CBEventType, payload: Optional[Dict[str, Any]] = None,
+                       event_id: str = "", parent_id: str = "", **kwargs: Any) -> str:
+        if event_type in self.STAGES:
+            self._starts[event_id] = time.perf_counter()
+        return event_id
+
+    def on_event_end(self, event_type: CBEventType, payload: Optional[Dict[str, Any]] = None,
+                     event_id: str = "", **kwargs: Any) -> None:
+        start = self._starts.pop(event_id, None)
+        if start is None:
+            return
+        record_span(self.STAGES[event_type], time.perf_counter() - start)
+        if event_type == CBEventType.LLM and payload is not None:
+            LLM_CALLS.inc()
+            prompt_tokens, completion_tokens = self._token_counts(payload)
+            LLM_TOKENS.inc(prompt_tokens, kind="prompt")
+            LLM_TOKENS.inc(completion_tokens, kind="completion")
+
+    @staticmethod
+    def _token_counts(payload: Dict[str, Any]) -> Tuple[int, int]:
+        """
+        Get the token counts of an LLM call: the ones reported by the model
+        when present, otherwise counted with the configured tokenizer.
+
+        :param payload: Payload of the LLM end event
+        :return: Tuple of prompt and completion tokens
+        """
+        response = payload.get(EventPayload.COMPLETION) or payload.get(EventPayload.RESPONSE)
+        usage = getattr(response, "additional_kwargs", None) or {}
+        if not usage and hasattr(response, "message"):
+            usage = response.message.additional_kwargs
+        if "prompt_tokens" in usage and "completion_tokens" in usage:
+            return int(usage["prompt_tokens"]), int(usage["completion_tokens"])
+        tokenizer = Settings.tokenizer
+        prompt = payload.get(EventPayload.PROMPT)
+        if prompt is None:
+            prompt = "\n".join(str(m.content or "") for m in payload.get(EventPayload.MESSAGES) or [])
+        completion = getattr(response, "text", None)
+        if completion is None:
+            message = getattr(response, "message", None)
+            completion = str(getattr(message, "content", "") or "")
+        return len(tokenizer(str(prompt))), len(tokenizer(completion))
+
+    def start_trace(self, trace_id: Optional[str] = None) -> None:
+        pass
+
+    def end_trace(self, trace_id: Optional[str] = None,
+                  trace_map: Optional[Dict[str, List[str]]] = None) -> None:
+        pass
+
+
+metrics_handler = MetricsCallbackHandler()
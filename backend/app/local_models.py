@@ -0,0 +1,259 @@
+"""
+Deterministic local stand-ins for the OpenAI LLM and embedding model
+(MODEL_PROVIDER=local), so the backend's own throughput and latency can be
+measured without network access or API quota.
+"""
+import asyncio
+import hashlib
+import json
+import re
+import time
+from typing import Any, AsyncGenerator, Generator, List, Optional, Sequence, Union
+import numpy as np
+from llama_index.core.base.embeddings.base import BaseEmbedding, Embedding
+from llama_index.core.base.llms.types import (
+    ChatMessage,
+    ChatResponse,
+    ChatResponseAsyncGen,
+    CompletionResponse,
+    CompletionResponseAsyncGen,
+    CompletionResponseGen,
+    LLMMetadata,
+    MessageRole,
+)
+from llama_index.core.bridge.pydantic import Field, PrivateAttr
+from llama_index.core.llms.callbacks import llm_chat_callback, llm_completion_callback
+from llama_index.core.llms.custom import CustomLLM
+from llama_index.core.llms.function_calling import FunctionCallingLLM
+from llama_index.core.llms.llm import ToolSelection
+from llama_index.core.base.llms.generic_utils import completion_response_to_chat_response
+
+WORD_PATTERN = re.compile(r"\w+")
+CHOICE_PATTERN = re.compile(r"^\((\d+)\) (.*)$", re.MULTILINE)
+QUESTION_PATTERN = re.compile(r"question: '(.*)'", re.DOTALL)
+
+
+def _words(text: str) -> List[str]:
+    return WORD_PATTERN.findall(text.lower())
+
+
+def _seed(text: str) -> int:
+    return int.from_bytes(hashlib.blake2b(text.encode(), digest_size=8).digest(), "little")
+
+
+def _overlap(query: str, text: str) -> int:
+    return len(set(_words(query)) & set(_words(text)))
+
+
+class LocalEmbedding(BaseEmbedding):
+    """Hashed bag-of-words embeddings: identical texts get identical vectors, shared words raise similarity."""
+
+    embed_dim: int = Field(default=256, description="Embedding dimensions")
+    latency_ms: float = Field(default=0.0, description="Simulated latency of every call")
+    # Queries and texts are embedded alike, so query batches can use the text endpoint.
+    _query_engine: str = PrivateAttr(default="local")
+    _text_engine: str = PrivateAttr(default="local")
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "LocalEmbedding"
+
+    def _vector(self, text: str) -> Embedding:
+        vector = np.zeros(self.embed_dim, dtype=np.float32)
+        for word in _words(text):
+            h = _seed(word)
+            vector[h % self.embed_dim] += 1.0 if (h >> 32) & 1 else -1.0
+        norm = np.linalg.norm(vector)
+        return (vector / norm if norm else vector).tolist()
+
+    def _get_query_embedding(self, query: str) -> Embedding:
+        return self._get_text_embeddings([query])[0]
+
+    async def _aget_query_embedding(self, query: str) -> Embedding:
+        return (await self._aget_text_embeddings([query]))[0]
+
+    def _get_text_embedding(self, text: str) -> Embedding:
+        return self._get_text_embeddings([text])[0]
+
+    async def _aget_text_embedding(self, text: str) -> Embedding:
+        return (await self._aget_text_embeddings([text]))[0]
+
+    def _get_text_embeddings(self, texts: List[str]) -> List[Embedding]:
+        time.sleep(self.latency_ms / 1000)
+        return [self._vector(t) for t in texts]
+
+    async def _aget_text_embeddings(self, texts: List[str]) -> List[Embedding]:
+        await asyncio.sleep(self.latency_ms / 1000)
+        return [self._vector(t) for t in texts]
+
+
+class LocalLLM(CustomLLM, FunctionCallingLLM):
+    """
+    Deterministic LLM stand-in. Answers are a stretch of words taken from the
+    prompt (so they depend on the retrieved context), generated after
+    `latency_ms` at `tokens_per_second`. Router selection prompts and tool
+    calls are answered by word overlap with the choice or tool descriptions.
+    """
+
+    model: str = Field(default="local", description="Model name")
+    latency_ms: float = Field(default=50.0, description="Time to the first token")
+    tokens_per_second: float = Field(default=200.0, description="Generation rate (0 for instant)")
+    max_tokens: int = Field(default=64, description="Tokens per answer")
+    context_window: int = Field(default=16384, description="Context window reported to the prompt helper")
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "LocalLLM"
+
+    @property
+    def metadata(self) -> LLMMetadata:
+        return LLMMetadata(
+            context_window=self.context_window,
+            num_output=self.max_tokens,
+            is_chat_model=False,
+            is_function_calling_model=True,
+            model_name=self.model,
+        )
+
+    def _answer_tokens(self, prompt: str) -> List[str]:
+        """
+        Build the answer to a prompt, split into tokens (words with their
+        trailing space).
+
+        :param prompt: Formatted prompt
+        :return: List of tokens
+        """
+        if "choice that is most relevant to the question" in prompt:
+            return [self._select(prompt)]
+        words = prompt.split()
+        if not words:
+            return []
+        start = _seed(prompt) % max(1, len(words) - self.max_tokens + 1)
+        return [w + " " for w in words[start:start + self.max_tokens]]
+
+    @staticmethod
+    def _select(prompt: str) -> str:
+        """
+        Answer a single-selection router prompt with the choice whose description
+        shares the most words with the question.
+
+        :param prompt: Selection prompt
+        :return: JSON answer in the selector's output format
+        """
+        question = QUESTION_PATTERN.search(prompt)
+        choices = CHOICE_PATTERN.findall(prompt)
+        query = question.group(1) if question else prompt
+        best = max(choices, key=lambda c: _overlap(query, c[1]), default=("1", ""))
+        return json.dumps([{"choice": int(best[0]), "reason": "Most words in common with the question."}])
+
+    def _token_delay(self) -> float:
+        return 1 / self.tokens_per_second if self.tokens_per_second > 0 else 0.0
+
+    @staticmethod
+    def _response(prompt: str, tokens: List[str]) -> CompletionResponse:
+        # usage reported like the OpenAI integration does, so token counters see it
+        usage = {"prompt_tokens": len(prompt.split()), "completion_tokens": len(tokens)}
+        return CompletionResponse(text="".join(tokens).strip(), additional_kwargs=usage)
+
+    @llm_completion_callback()
+    def complete(self, prompt: str, formatted: bool = False, **kwargs: Any) -> CompletionResponse:
+        tokens = self._answer_tokens(prompt)
+        time.sleep(self.latency_ms / 1000 + len(tokens) * self._token_delay())
+        return self._response(prompt, tokens)
+
+    @llm_completion_callback()
+    def stream_complete(self, prompt: str, formatted: bool = False, **kwargs: Any) -> CompletionResponseGen:
+        tokens = self._answer_tokens(prompt)
+
+        def gen() -> Generator[CompletionResponse, None, None]:
+            time.sleep(self.latency_ms / 1000)
+            text = ""
+            for token in tokens:
+                time.sleep(self._token_delay())
+                text += token
+                yield CompletionResponse(text=text, delta=token)
+
+        return gen()
+
+    @llm_completion_callback()
+    async def acomplete(self, prompt: str, formatted: bool = False, **kwargs: Any) -> CompletionResponse:
+        tokens = self._answer_tokens(prompt)
+        await asyncio.sleep(self.latency_ms / 1000 + len(tokens) * self._token_delay())
+        return self._response(prompt, tokens)
+
+    @llm_completion_callback()
+    async def astream_complete(self, prompt: str, formatted: bool = False,
+                               **kwargs: Any) -> CompletionResponseAsyncGen:
+        tokens = self._answer_tokens(prompt)
+
+        async def gen() -> AsyncGenerator[CompletionResponse, None]:
+            await asyncio.sleep(self.latency_ms / 1000)
+            text = ""
+            for token in tokens:
+                await asyncio.sleep(self._token_delay())
+                text += token
+                yield CompletionResponse(text=text, delta=token)
+
+        return gen()
+
+    @llm_chat_callback()
+    async def achat(self, messages: Sequence[ChatMessage], **kwargs: Any) -> ChatResponse:
+        prompt = self.messages_to_prompt(messages)
+        return completion_response_to_chat_response(await self.acomplete(prompt, formatted=True, **kwargs))
+
+    @llm_chat_callback()
+    async def astream_chat(self, messages: Sequence[ChatMessage], **kwargs: Any) -> ChatResponseAsyncGen:
+        completions = await self.astream_complete(self.messages_to_prompt(messages), formatted=True, **kwargs)
+
+        async def gen() -> AsyncGenerator[ChatResponse, None]:
+            async for completion in completions:
+                yield ChatResponse(
+                    message=ChatMessage(role=MessageRole.ASSISTANT, content=completion.text),
+                    delta=completion.delta,
+                )
+
+        return gen()
+
+    def _select_tool(self, tools: List[Any], user_msg: Optional[Union[str, ChatMessage]]) -> ChatResponse:
+        """
+        Call the tool whose name and description share the most words with the
+        message, filling its required string arguments with the message (and
+        required lists with an empty list).
+
+        :param tools: Tools to choose from
+        :param user_msg: User message
+        :return: ChatResponse carrying the tool call
+        """
+        message = user_msg.content if isinstance(user_msg, ChatMessage) else (user_msg or "")
+        tool = max(tools, key=lambda t: _overlap(message, f"{t.metadata.name} {t.metadata.description}"))
+        schema = tool.metadata.get_parameters_dict()
+        defaults = {"string": message, "array": []}
+        kwargs = {
+            name: defaults[spec.get("type")]
+            for name, spec in schema.get("properties", {}).items()
+            if name in schema.get("required", []) and spec.get("type") in defaults
+        }
+        selection = ToolSelection(tool_id=f"call_{_seed(message) % 10**8}", tool_name=tool.metadata.name,
+                                  tool_kwargs=kwargs)
+        return ChatResponse(
+            message=ChatMessage(role=MessageRole.ASSISTANT, content="", additional_kwargs={"tool_calls": [selection]})
+        )
+
+    def chat_with_tools(self, tools: List[Any], user_msg: Optional[Union[str, ChatMessage]] = None,
+                        chat_history: Optional[List[ChatMessage]] = None, verbose: bool = False,
+                        allow_parallel_tool_calls: bool = False, **kwargs: Any) -> ChatResponse:
+        time.sleep(self.latency_ms / 1000)
+        return self._select_tool(tools, user_msg)
+
+    async def achat_with_tools(self, tools: List[Any], user_msg: Optional[Union[str, ChatMessage]] = None,
+                               chat_history: Optional[List[ChatMessage]] = None, verbose: bool = False,
+                               allow_parallel_tool_calls: bool = False, **kwargs: Any) -> ChatResponse:
+        await asyncio.sleep(self.latency_ms / 1000)
+        return self._select_tool(tools, user_msg)
+
+    def get_tool_calls_from_response(self, response: ChatResponse, error_on_no_tool_call: bool = True,
+                                     **kwargs: Any) -> List[ToolSelection]:
+        tool_calls = response.message.additional_kwargs.get("tool_calls", [])
+        if not tool_calls and error_on_no_tool_call:
+            raise ValueError("Expected at least one tool call")
+        return tool_calls
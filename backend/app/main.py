@@ -1,4 +1,9 @@
-from fastapi import FastAPI
+import time
+from contextlib import asynccontextmanager
+from dataclasses import asdict
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional
+from fastapi import FastAPI, HTTPException, Request, Response
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
 from pydantic import BaseModel
 from backend.app.chatbot import LlamaIndexChatbot
 import sys
@@ -6,46 +11,276 @@ import os
 
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../../')))
 
-app = FastAPI()
-chatbot = LlamaIndexChatbot(input_files=["transformers.pdf"])
+from backend.app.concurrency import QueryLimiter, QueueFullError
+from backend.app.streaming import ClosingStreamingResponse, ndjson_results, ndjson_stream
+from backend.app.corpus import CorpusChatbot, resolve_corpus_files
+from backend.app.startup import StartupProgress
+from backend.app.http_clients import http_pool_stats
+from backend.app.instrumentation import REGISTRY, HTTP_REQUEST_SECONDS, current_trace, new_trace
+from backend.app.answers import Answer, ResultCache, Source
+from backend.app.config import (
+    MAX_CONCURRENT_QUERIES, MAX_QUEUED_QUERIES, QUERY_QUEUE_TIMEOUT, RETRY_AFTER_SECONDS, CORPUS_FILES,
+    RESULT_CACHE_MAX_ENTRIES, BATCH_MAX_QUESTIONS,
+)
+
+limiter = QueryLimiter(MAX_CONCURRENT_QUERIES, MAX_QUEUED_QUERIES, QUERY_QUEUE_TIMEOUT, RETRY_AFTER_SECONDS)
+results = ResultCache(RESULT_CACHE_MAX_ENTRIES)
+input_files = resolve_corpus_files(CORPUS_FILES)
+progress = StartupProgress()
+
+def create_chatbot(progress: StartupProgress) -> LlamaIndexChatbot:
+    """
+    Build or load the chatbot over the configured corpus.
+
+    :param progress: Receives the progress of the load, split, embed and index stages
+    :return: Chatbot instance
+    """
+    if len(input_files) > 1:
+        return CorpusChatbot(input_files, progress=progress)
+    return LlamaIndexChatbot(input_files=input_files, progress=progress)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI) -> AsyncIterator[None]:
+    """
+    Start building the chatbot in the background, so the server binds its
+    port and answers health probes right away.
+    """
+    progress.run_in_background(create_chatbot)
+    yield
+
+app = FastAPI(lifespan=lifespan)
+
+def chatbot_stats(attribute: str) -> Callable[[], Dict[str, Any]]:
+    """
+    Build a metrics collector reading the statistics of one chatbot component.
+
+    :param attribute: Attribute of the chatbot holding the component
+    :return: Collector returning the component's statistics (empty until the chatbot is ready)
+    """
+    def collect() -> Dict[str, Any]:
+        component = getattr(progress.result, attribute, None) if progress.ready else None
+        return component.stats() if hasattr(component, "stats") else {}
+    return collect
+
+REGISTRY.register_collector("response_cache", "Response cache counters", chatbot_stats("response_cache"))
+REGISTRY.register_collector("router", "Router selection counters", chatbot_stats("selector"))
+REGISTRY.register_collector("corpus", "Corpus manager counters", chatbot_stats("corpus"))
+REGISTRY.register_collector("context", "Context budget counters", chatbot_stats("context_budgeter"))
+REGISTRY.register_collector("http_pool", "Shared HTTP connection pool counters", http_pool_stats)
+
+@app.middleware("http")
+async def trace_requests(request: Request, call_next: Callable[[Request], Awaitable[Response]]) -> Response:
+    """
+    Give every request a server-generated trace ID (it is also the request
+    ID under which /metadata/{request_id} returns the answer, so a client
+    must not choose it), return it in the X-Trace-ID header with the
+    per-stage timings in Server-Timing and the context tokens the budget
+    saved in X-Context-Tokens-Saved, and observe the request latency. A
+    client's X-Request-ID is only echoed back, for its own correlation.
+    """
+    trace = new_trace()
+    start = time.perf_counter()
+    response = await call_next(request)
+    route = request.scope.get("route")
+    HTTP_REQUEST_SECONDS.observe(
+        time.perf_counter() - start,
+        method=request.method, path=getattr(route, "path", "unmatched"), status=str(response.status_code),
+    )
+    response.headers["X-Trace-ID"] = trace.trace_id
+    if "x-request-id" in request.headers:
+        response.headers["X-Request-ID"] = request.headers["x-request-id"]
+    if trace.spans:
+        response.headers["Server-Timing"] = trace.server_timing()
+    if "context_tokens_saved" in trace.counters:
+        response.headers["X-Context-Tokens-Saved"] = str(int(trace.counters["context_tokens_saved"]))
+    return response
+
+def get_chatbot() -> LlamaIndexChatbot:
+    """
+    Get the chatbot, or answer 503 while it is still warming up.
+
+    :return: Chatbot instance
+    """
+    if not progress.ready:
+        raise HTTPException(
+            status_code=503,
+            detail=f"Chatbot is not ready ({progress.state})",
+            headers={"Retry-After": str(RETRY_AFTER_SECONDS)},
+        )
+    return progress.result
 
 class ChatRequest(BaseModel):
     user_input: str
 
+class BatchRequest(BaseModel):
+    user_inputs: List[str]
+    retrieval_only: bool = False
+    top_k: Optional[int] = None
+
+class SourceInfo(BaseModel):
+    node_id: str
+    score: Optional[float] = None
+    page_label: Optional[str] = None
+    file_name: Optional[str] = None
+    text: Optional[str] = None
+
 class ChatResponse(BaseModel):
     bot_response: str
+    tool: Optional[str] = None
+    sources: List[SourceInfo] = []
+    request_id: str
 
 class DocMetadata(BaseModel):
-    doc_metadata: str
+    sources: List[SourceInfo]
+    request_id: Optional[str] = None
+
+def source_infos(sources: List[Source]) -> List[SourceInfo]:
+    return [SourceInfo(**asdict(source)) for source in sources]
 
 @app.get("/")
+@app.get("/health/live")
 def healthy_check() -> dict:
     """
-    Health check endpoint.
+    Liveness endpoint: the process is up and serving, whether or not the
+    chatbot is ready yet.
 
     :return: Dictionary indicating the health status
     """
-    return {'status': 'healthy'}
+    return {'status': 'healthy', 'ready': progress.ready}
+
+@app.get("/health/ready")
+def readiness_check() -> JSONResponse:
+    """
+    Readiness endpoint: 200 once the chatbot can answer, 503 before that
+    (or if warm-up failed), with the progress of each startup stage.
+
+    :return: JSONResponse with the warm-up state and per-stage progress
+    """
+    return JSONResponse(progress.report(), status_code=200 if progress.ready else 503)
+
+@app.get("/stats/http")
+def http_stats() -> dict:
+    """
+    Counters of the shared HTTP connection pools used by the LLM and
+    embedding clients.
+
+    :return: Dictionary of pool names and their counters
+    """
+    return http_pool_stats()
+
+@app.get("/metrics", response_class=PlainTextResponse)
+def metrics() -> PlainTextResponse:
+    """
+    Prometheus scrape endpoint: stage latency histograms, LLM token counters
+    and the cache, router and connection pool statistics.
+
+    :return: Metrics in the Prometheus text exposition format
+    """
+    return PlainTextResponse(REGISTRY.render(), media_type="text/plain; version=0.0.4")
 
 @app.post("/chat", response_model=ChatResponse)
-def chat(request: ChatRequest) -> ChatResponse:
+async def chat(request: ChatRequest) -> ChatResponse:
     """
-    Chat endpoint to get a response from the chatbot.
+    Chat endpoint to get a response from the chatbot. Queries beyond the
+    concurrency limit are queued; once the queue is full the endpoint
+    answers 429 with a Retry-After header. Until the chatbot is ready it
+    answers 503.
+
+    The response carries the selected tool and the source nodes (IDs, page
+    labels and similarity scores) of the same query, and the request ID
+    under which GET /metadata/{request_id} returns those sources later.
 
     :param request: ChatRequest containing the user input
-    :return: ChatResponse containing the bot's response
+    :return: ChatResponse containing the bot's response and its sources
     """
-    response = chatbot.get_response(request.user_input)
-    return ChatResponse(bot_response=response)
+    chatbot = get_chatbot()
+    try:
+        async with limiter.slot():
+            answer: Answer = await chatbot.aget_response(request.user_input)
+    except QueueFullError as e:
+        raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": str(e.retry_after)})
+    request_id = current_trace.get().trace_id
+    results.put(request_id, answer)
+    return ChatResponse(
+        bot_response=answer.response,
+        tool=answer.tool,
+        sources=source_infos(answer.sources),
+        request_id=request_id,
+    )
 
+@app.post("/chat/stream")
+async def chat_stream(request: ChatRequest) -> StreamingResponse:
+    """
+    Chat endpoint that streams the bot's response as newline-delimited JSON:
+    one {"token": ...} line per token, then {"done": true}.
 
-# @app.post("/metadata", response_model=DocMetadata)
-# def chat(request: ChatRequest) -> DocMetadata:
-#     """
-#     Chat endpoint to get a metadata of the document(s).
+    :param request: ChatRequest containing the user input
+    :return: StreamingResponse of NDJSON lines
+    """
+    chatbot = get_chatbot()
+    try:
+        await limiter.acquire()
+    except QueueFullError as e:
+        raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": str(e.retry_after)})
+    tokens = chatbot.stream_response(request.user_input)
+    return ClosingStreamingResponse(ndjson_stream(tokens), on_close=limiter.release, media_type="application/x-ndjson")
 
-#     :param request: DocMetadata containing the user input
-#     :return: DocMetadata containing the document's metadata
-#     """
-#     response = chatbot.get_metadata(request.user_input)
-#     return DocMetadata(bot_response=response)
\ No newline at end of file
+@app.post("/chat/batch")
+async def chat_batch(request: BatchRequest) -> StreamingResponse:
+    """
+    Answer a batch of questions in one call, streamed as newline-delimited
+    JSON in completion order: one {"index", "user_input", "bot_response",
+    "tool", "sources"} line per question, then {"done": true}. Identical
+    questions are answered once, all questions are embedded and retrieved
+    together, and synthesis runs BATCH_CONCURRENCY at a time. With
+    `retrieval_only` the lines carry the top-k chunks and no LLM is called.
+    The batch holds one query slot of the limiter.
+
+    :param request: BatchRequest with the questions
+    :return: StreamingResponse of NDJSON lines
+    """
+    if len(request.user_inputs) > BATCH_MAX_QUESTIONS:
+        raise HTTPException(status_code=413, detail=f"At most {BATCH_MAX_QUESTIONS} questions per batch")
+    chatbot = get_chatbot()
+    try:
+        await limiter.acquire()
+    except QueueFullError as e:
+        raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": str(e.retry_after)})
+
+    async def batch_lines() -> AsyncIterator[dict]:
+        async for positions, answer in chatbot.astream_responses(
+            request.user_inputs, request.retrieval_only, request.top_k
+        ):
+            for i in positions:
+                yield {"index": i, "user_input": request.user_inputs[i], "bot_response": answer.response,
+                       "tool": answer.tool, "sources": [asdict(source) for source in answer.sources]}
+
+    return ClosingStreamingResponse(
+        ndjson_results(batch_lines()), on_close=limiter.release, media_type="application/x-ndjson"
+    )
+
+@app.get("/metadata/{request_id}", response_model=DocMetadata)
+def answer_metadata(request_id: str) -> DocMetadata:
+    """
+    Sources of an answer /chat already returned, from the recent results
+    (no query is run).
+
+    :param request_id: Request ID returned by /chat
+    :return: DocMetadata containing the answer's sources
+    """
+    answer = results.get(request_id)
+    if answer is None:
+        raise HTTPException(status_code=404, detail=f"No recent answer with request ID {request_id}")
+    return DocMetadata(sources=source_infos(answer.sources), request_id=request_id)
+
+@app.post("/metadata", response_model=DocMetadata)
+def metadata(request: ChatRequest) -> DocMetadata:
+    """
+    Sources of the document(s) relevant to the user input, from a
+    retrieval-only pass: no router or synthesis LLM call.
+
+    :param request: ChatRequest containing the user input
+    :return: DocMetadata containing the sources
+    """
+    sources = get_chatbot().get_sources(request.user_input)
+    return DocMetadata(sources=source_infos(sources))
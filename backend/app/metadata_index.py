@@ -0,0 +1,249 @@
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+import numpy as np
+from llama_index.core import Settings
+from llama_index.core.base.base_retriever import BaseRetriever
+from llama_index.core.base.embeddings.base import BaseEmbedding
+from llama_index.core.callbacks.schema import CBEventType, EventPayload
+from llama_index.core.schema import NodeWithScore, QueryBundle
+from backend.app.ann import IVFIndex
+from backend.app.embedding_cache import get_query_embeddings
+from backend.app.mmap_store import MmapVectorStore
+
+DEFAULT_INDEXED_KEYS = ("page_label", "file_name")
+
+
+class MetadataIndex:
+    def __init__(self, node_ids: List[str], embeddings: Optional[np.ndarray], metadata: List[Dict[str, Any]],
+                 keys: Sequence[str] = DEFAULT_INDEXED_KEYS, vector_store: Optional[MmapVectorStore] = None) -> None:
+        """
+        Initialize the MetadataIndex class. It keeps the node embeddings as one
+        normalized float32 matrix and, for every indexed metadata key, a bitmap
+        of the nodes per value. A filtered search intersects the bitmaps and
+        scores only the candidate rows. With a memory-mapped vector store the
+        embeddings are not copied: rows are the store's rows and scoring is
+        delegated to it.
+
+        :param node_ids: Node IDs, one per embedding row
+        :param embeddings: Node embeddings, shape (n, dim); None when `vector_store` is given
+        :param metadata: Node metadata, one per embedding row
+        :param keys: Metadata keys to build inverted indices for
+        :param vector_store: Memory-mapped vector store holding the embeddings, in row order
+        """
+        self.node_ids = list(node_ids)
+        self.positions = {node_id: i for i, node_id in enumerate(self.node_ids)}
+        self.vector_store = vector_store
+        self.ann: Optional[IVFIndex] = None
+        self.embeddings = None
+        if vector_store is None:
+            matrix = np.asarray(embeddings, dtype=np.float32).reshape(len(self.node_ids), -1)
+            norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+            self.embeddings = matrix / np.where(norms == 0, 1, norms)
+        self.postings: Dict[str, Dict[str, np.ndarray]] = {}
+        for key in keys:
+            values: Dict[str, List[int]] = {}
+            for i, meta in enumerate(metadata):
+                if key in meta:
+                    values.setdefault(str(meta[key]), []).append(i)
+            self.postings[key] = {}
+            for value, rows in values.items():
+                bitmap = np.zeros(len(self.node_ids), dtype=bool)
+                bitmap[rows] = True
+                self.postings[key][value] = bitmap
+
+    @classmethod
+    def from_vector_index(cls, vector_index: Any, keys: Sequence[str] = DEFAULT_INDEXED_KEYS) -> "MetadataIndex":
+        """
+        Build the index from the nodes and embeddings of a VectorStoreIndex.
+
+        :param vector_index: Vector index whose vector store supports `get(node_id)`
+        :param keys: Metadata keys to build inverted indices for
+        :return: MetadataIndex instance
+        """
+        vector_store = vector_index.vector_store
+        if isinstance(vector_store, MmapVectorStore):
+            live = set(vector_store.node_ids[i] for i in vector_store.live_rows())
+            nodes = {n.node_id: n for n in vector_index.docstore.get_nodes(list(live))}
+            metadata = [nodes[i].metadata if i in nodes else {} for i in vector_store.node_ids]
+            return cls(vector_store.node_ids, None, metadata, keys, vector_store=vector_store)
+        node_ids = list(vector_index.index_struct.nodes_dict.values())
+        nodes = vector_index.docstore.get_nodes(node_ids)
+        embeddings = np.array([vector_store.get(node_id) for node_id in node_ids], dtype=np.float32)
+        return cls(node_ids, embeddings, [n.metadata for n in nodes], keys)
+
+    def replace_with(self, other: "MetadataIndex") -> None:
+        """
+        Take over the contents of another index, so retrievers holding this
+        instance see the rebuilt data.
+
+        :param other: Freshly built index
+        """
+        self.node_ids, self.positions, self.embeddings, self.postings, self.vector_store, self.ann = (
+            other.node_ids, other.positions, other.embeddings, other.postings, other.vector_store, other.ann
+        )
+
+    def candidates(self, filters: Optional[Dict[str, Iterable[Any]]] = None) -> Optional[np.ndarray]:
+        """
+        Get the bitmap of nodes matching the filters: any of the values of a
+        key (OR), for every key (AND). Unknown values match nothing.
+
+        :param filters: Allowed values per metadata key
+        :return: Boolean mask over the nodes, or None when nothing is filtered
+        """
+        mask = None
+        for key, values in (filters or {}).items():
+            values = [str(v) for v in values]
+            if not values:
+                continue
+            postings = self.postings.get(key, {})
+            key_mask = np.zeros(len(self.node_ids), dtype=bool)
+            for value in values:
+                if value in postings:
+                    key_mask |= postings[value]
+            mask = key_mask if mask is None else mask & key_mask
+        return mask
+
+    def vectors(self, rows: np.ndarray) -> np.ndarray:
+        """
+        Get the normalized embeddings of the given rows.
+
+        :param rows: Row numbers
+        :return: Matrix of shape (len(rows), dim)
+        """
+        if self.vector_store is not None:
+            return self.vector_store.rows(rows)
+        return self.embeddings[rows]
+
+    def get_embedding(self, node_id: str) -> np.ndarray:
+        return self.vectors(np.array([self.positions[node_id]]))[0]
+
+    def search(self, query_embedding: List[float], top_k: int,
+               filters: Optional[Dict[str, Iterable[Any]]] = None) -> List[Tuple[str, float]]:
+        """
+        Cosine similarity search restricted to the nodes matching the filters.
+        The search is approximate when an IVF index is attached (`ann`).
+
+        :param query_embedding: Query embedding
+        :param top_k: Number of nodes to return
+        :param filters: Allowed values per metadata key
+        :return: List of (node ID, score), best first
+        """
+        mask = self.candidates(filters)
+        if self.ann is not None:
+            query = np.asarray(query_embedding, dtype=np.float32)
+            query = query / (np.linalg.norm(query) or 1)
+            hits = self.ann.search(query, top_k, self.vectors, mask)
+            return [(self.node_ids[row], score) for row, score in hits]
+        if self.vector_store is not None:
+            rows = None if mask is None else np.flatnonzero(mask)
+            hits = self.vector_store.topk(query_embedding, top_k, rows)
+            return [(self.node_ids[row], score) for row, score in hits]
+        query = np.asarray(query_embedding, dtype=np.float32)
+        norm = np.linalg.norm(query)
+        query = query / norm if norm else query
+        rows = np.arange(len(self.node_ids)) if mask is None else np.flatnonzero(mask)
+        if len(rows) == 0:
+            return []
+        scores = self.embeddings[rows] @ query
+        k = min(top_k, len(rows))
+        best = np.argpartition(-scores, k - 1)[:k]
+        best = best[np.argsort(-scores[best])]
+        return [(self.node_ids[rows[i]], float(scores[i])) for i in best]
+
+    def search_batch(self, query_embeddings: Sequence[List[float]], top_k: int,
+                     filters: Optional[Dict[str, Iterable[Any]]] = None,
+                     max_scores: int = 1 << 24) -> List[List[Tuple[str, float]]]:
+        """
+        Cosine similarity search for many queries with the same filters,
+        scored as one matrix product (in chunks of queries bounding the score
+        matrix to `max_scores` entries). With an IVF index or a memory-mapped
+        store, every query is searched on its own.
+
+        :param query_embeddings: Query embeddings
+        :param top_k: Number of nodes to return per query
+        :param filters: Allowed values per metadata key
+        :param max_scores: Maximum number of scores computed at once
+        :return: One list of (node ID, score) per query, best first
+        """
+        if self.ann is not None or self.vector_store is not None:
+            return [self.search(q, top_k, filters) for q in query_embeddings]
+        mask = self.candidates(filters)
+        rows = np.arange(len(self.node_ids)) if mask is None else np.flatnonzero(mask)
+        if len(rows) == 0 or len(query_embeddings) == 0:
+            return [[] for _ in query_embeddings]
+        queries = np.asarray(query_embeddings, dtype=np.float32).reshape(len(query_embeddings), -1)
+        norms = np.linalg.norm(queries, axis=1, keepdims=True)
+        queries = queries / np.where(norms == 0, 1, norms)
+        candidates = self.embeddings if mask is None else self.embeddings[rows]
+        k = min(top_k, len(rows))
+        chunk = max(1, max_scores // len(rows))
+        results: List[List[Tuple[str, float]]] = []
+        for start in range(0, len(queries), chunk):
+            scores = queries[start:start + chunk] @ candidates.T
+            best = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+            best_scores = np.take_along_axis(scores, best, axis=1)
+            order = np.argsort(-best_scores, axis=1)
+            for ids, values in zip(np.take_along_axis(best, order, axis=1), np.take_along_axis(best_scores, order, axis=1)):
+                results.append([(self.node_ids[rows[i]], float(v)) for i, v in zip(ids, values)])
+        return results
+
+
+class MetadataIndexRetriever(BaseRetriever):
+    def __init__(self, metadata_index: MetadataIndex, docstore: Any, embed_model: BaseEmbedding,
+                 similarity_top_k: int = 2, filters: Optional[Dict[str, Iterable[Any]]] = None, **kwargs: Any) -> None:
+        """
+        Initialize the MetadataIndexRetriever class.
+
+        :param metadata_index: Metadata index to search
+        :param docstore: Docstore holding the nodes
+        :param embed_model: Embedding model for the query
+        :param similarity_top_k: Number of nodes to retrieve
+        :param filters: Allowed values per metadata key, e.g. {"page_label": ["1", "2"]}
+        """
+        # BaseRetriever would default to an empty callback manager, hiding retrievals from the metrics
+        kwargs.setdefault("callback_manager", Settings.callback_manager)
+        super().__init__(**kwargs)
+        self.metadata_index = metadata_index
+        self.docstore = docstore
+        self.embed_model = embed_model
+        self.similarity_top_k = similarity_top_k
+        self.filters = filters
+
+    def _search_batch(self, query_bundles: List[QueryBundle], top_k: int) -> List[List[Tuple[str, float]]]:
+        return self.metadata_index.search_batch([q.embedding for q in query_bundles], top_k, self.filters)
+
+    def retrieve_batch(self, query_bundles: List[QueryBundle], top_k: Optional[int] = None) -> List[List[NodeWithScore]]:
+        """
+        Retrieve for many queries at once: the missing query embeddings are
+        computed in batched calls and the dense search is one matrix product
+        over the node embeddings.
+
+        :param query_bundles: Queries (their embeddings are filled in)
+        :param top_k: Number of nodes per query (`similarity_top_k` if not given)
+        :return: One list of nodes per query
+        """
+        missing = [q for q in query_bundles if q.embedding is None]
+        if missing:
+            embeddings = get_query_embeddings(self.embed_model, [q.query_str for q in missing])
+            for query_bundle, embedding in zip(missing, embeddings):
+                query_bundle.embedding = embedding
+        with self.callback_manager.event(CBEventType.RETRIEVE, payload={EventPayload.QUERY_STR: ""}) as event:
+            hits = self._search_batch(query_bundles, top_k or self.similarity_top_k)
+            nodes = [self._to_nodes(h) for h in hits]
+            event.on_end(payload={EventPayload.NODES: [n for batch in nodes for n in batch]})
+        return nodes
+
+    def _to_nodes(self, hits: List[Tuple[str, float]]) -> List[NodeWithScore]:
+        nodes = self.docstore.get_nodes([node_id for node_id, _ in hits])
+        return [NodeWithScore(node=node, score=score) for node, (_, score) in zip(nodes, hits)]
+
+    def _retrieve(self, query_bundle: QueryBundle) -> List[NodeWithScore]:
+        if query_bundle.embedding is None:
+            query_bundle.embedding = self.embed_model.get_query_embedding(query_bundle.query_str)
+        hits = self.metadata_index.search(query_bundle.embedding, self.similarity_top_k, self.filters)
+        return self._to_nodes(hits)
+
+    async def _aretrieve(self, query_bundle: QueryBundle) -> List[NodeWithScore]:
+        if query_bundle.embedding is None:
+            query_bundle.embedding = await self.embed_model.aget_query_embedding(query_bundle.query_str)
+        hits = self.metadata_index.search(query_bundle.embedding, self.similarity_top_k, self.filters)
+        return self._to_nodes(hits)
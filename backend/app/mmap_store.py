@@ -0,0 +1,286 @@
+import json
+import os
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+import fsspec
+import numpy as np
+from llama_index.core.schema import BaseNode
+from llama_index.core.storage.storage_context import DEFAULT_VECTOR_STORE, NAMESPACE_SEP, VECTOR_STORE_FNAME
+from llama_index.core.vector_stores.types import VectorStore, VectorStoreQuery, VectorStoreQueryResult
+
+VECTORS_SUFFIX = ".vectors.f32"
+CODES_SUFFIX = ".codes.i8"
+SCALES_SUFFIX = ".scales.f32"
+QUANTIZATIONS = ("none", "int8")
+
+
+def _unit(vector: Sequence[float]) -> np.ndarray:
+    vector = np.asarray(vector, dtype=np.float32)
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+
+def _quantize(vectors: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    scales = np.abs(vectors).max(axis=1) / 127
+    scales[scales == 0] = 1
+    codes = np.rint(vectors / scales[:, None]).astype(np.int8)
+    return codes, scales.astype(np.float32)
+
+
+def _top(rows: np.ndarray, scores: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+    if len(scores) > k:
+        best = np.argpartition(-scores, k - 1)[:k]
+        rows, scores = rows[best], scores[best]
+    order = np.argsort(-scores)
+    return rows[order], scores[order]
+
+
+class MmapVectorStore(VectorStore):
+    stores_text: bool = False
+    is_embedding_query: bool = True
+    flat_metadata: bool = True
+
+    def __init__(self, quantization: str = "none", rerank_factor: int = 4, chunk_rows: Optional[int] = None) -> None:
+        """
+        Initialize the MmapVectorStore class. Persisted embeddings live in one
+        contiguous, normalized float32 file that is memory-mapped on load, so
+        only the pages a search touches become resident. With int8
+        quantization a second file holds one int8 code row and one scale per
+        vector; a full scan reads the codes (a quarter of the bytes) and the
+        best `rerank_factor * top_k` rows are re-scored at full precision.
+
+        Nodes added since the last persist are kept in memory and deletions
+        are tombstones; `persist` compacts both into fresh files.
+
+        :param quantization: "none" or "int8"
+        :param rerank_factor: Candidates re-scored at full precision per result (int8 only)
+        :param chunk_rows: Rows scored per step of a full scan, bounding temporary memory. int8 chunks
+            are converted to float32 before scoring, so they are smaller by default to stay in cache
+        """
+        if quantization not in QUANTIZATIONS:
+            raise ValueError(f"Unknown quantization {quantization!r}, expected one of {QUANTIZATIONS}")
+        self.quantization = quantization
+        self.rerank_factor = rerank_factor
+        self.chunk_rows = chunk_rows or (8192 if quantization == "int8" else 65536)
+        self.node_ids: List[str] = []
+        self.ref_doc_ids: List[Optional[str]] = []
+        self.positions: Dict[str, int] = {}
+        self.alive = np.zeros(0, dtype=bool)
+        self.vectors: Optional[np.ndarray] = None
+        self.codes: Optional[np.ndarray] = None
+        self.scales: Optional[np.ndarray] = None
+        self._pending: List[np.ndarray] = []
+        self._pending_matrix: Optional[np.ndarray] = None
+
+    @property
+    def client(self) -> None:
+        return None
+
+    @property
+    def base_rows(self) -> int:
+        return 0 if self.vectors is None else len(self.vectors)
+
+    @staticmethod
+    def default_path(persist_dir: str) -> str:
+        return os.path.join(persist_dir, f"{DEFAULT_VECTOR_STORE}{NAMESPACE_SEP}{VECTOR_STORE_FNAME}")
+
+    @classmethod
+    def from_persist_dir(cls, persist_dir: str, **kwargs: Any) -> "MmapVectorStore":
+        """
+        Memory-map the store persisted in a storage context directory.
+
+        :param persist_dir: Storage context directory
+        :return: MmapVectorStore instance
+        """
+        store = cls(**kwargs)
+        store._map(cls.default_path(persist_dir))
+        return store
+
+    def _map(self, persist_path: str) -> None:
+        with open(persist_path) as f:
+            meta = json.load(f)
+        base = os.path.splitext(persist_path)[0]
+        n, dim = len(meta["node_ids"]), meta["dim"]
+        self.node_ids = meta["node_ids"]
+        self.ref_doc_ids = meta["ref_doc_ids"]
+        self.positions = {node_id: i for i, node_id in enumerate(self.node_ids)}
+        self.alive = np.ones(n, dtype=bool)
+        self._pending, self._pending_matrix = [], None
+        self.vectors = self.codes = self.scales = None
+        if n == 0:
+            return
+        self.vectors = np.memmap(base + VECTORS_SUFFIX, dtype=np.float32, mode="r", shape=(n, dim))
+        if self.quantization == "int8":
+            if meta["quantization"] == "int8":
+                self.codes = np.memmap(base + CODES_SUFFIX, dtype=np.int8, mode="r", shape=(n, dim))
+                self.scales = np.fromfile(base + SCALES_SUFFIX, dtype=np.float32)
+            else:
+                self.codes, self.scales = self._quantize_rows(np.arange(n))
+
+    def _quantize_rows(self, rows: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        codes = np.empty((len(rows), self.vectors.shape[1]), dtype=np.int8)
+        scales = np.empty(len(rows), dtype=np.float32)
+        for start in range(0, len(rows), self.chunk_rows):
+            codes[start:start + self.chunk_rows], scales[start:start + self.chunk_rows] = _quantize(
+                self.rows(rows[start:start + self.chunk_rows])
+            )
+        return codes, scales
+
+    def _pending_rows(self) -> np.ndarray:
+        if self._pending_matrix is None:
+            self._pending_matrix = np.vstack(self._pending) if self._pending else np.zeros((0, 0), dtype=np.float32)
+        return self._pending_matrix
+
+    def rows(self, rows: np.ndarray) -> np.ndarray:
+        """
+        Get the normalized float32 vectors of the given rows.
+
+        :param rows: Row numbers
+        :return: Matrix of shape (len(rows), dim)
+        """
+        rows = np.asarray(rows, dtype=np.int64)
+        in_base = rows < self.base_rows
+        if self.vectors is not None and in_base.all():
+            return np.asarray(self.vectors[rows])
+        pending = self._pending_rows()
+        out = np.empty((len(rows), pending.shape[1]), dtype=np.float32)
+        if in_base.any():
+            out[in_base] = self.vectors[rows[in_base]]
+        out[~in_base] = pending[rows[~in_base] - self.base_rows]
+        return out
+
+    def add(self, nodes: List[BaseNode], **add_kwargs: Any) -> List[str]:
+        if not nodes:
+            return []
+        vectors = np.stack([_unit(node.get_embedding()) for node in nodes])
+        self.alive = np.concatenate([self.alive, np.ones(len(nodes), dtype=bool)])
+        for node in nodes:
+            if node.node_id in self.positions:
+                self.alive[self.positions[node.node_id]] = False
+            self.positions[node.node_id] = len(self.node_ids)
+            self.node_ids.append(node.node_id)
+            self.ref_doc_ids.append(node.ref_doc_id)
+        self._pending.append(vectors)
+        self._pending_matrix = None
+        return [node.node_id for node in nodes]
+
+    def delete(self, ref_doc_id: str, **delete_kwargs: Any) -> None:
+        for row, doc_id in enumerate(self.ref_doc_ids):
+            if doc_id == ref_doc_id and self.alive[row]:
+                self.alive[row] = False
+                self.positions.pop(self.node_ids[row], None)
+
+    def get(self, text_id: str) -> List[float]:
+        """
+        Get the (normalized) embedding of a node.
+
+        :param text_id: Node ID
+        :return: Embedding
+        """
+        return self.rows(np.array([self.positions[text_id]]))[0].tolist()
+
+    def live_rows(self) -> np.ndarray:
+        return np.flatnonzero(self.alive)
+
+    def topk(self, query_embedding: Sequence[float], top_k: int,
+             rows: Optional[np.ndarray] = None) -> List[Tuple[int, float]]:
+        """
+        Cosine similarity search over the live rows, or over the given rows only.
+
+        :param query_embedding: Query embedding
+        :param top_k: Number of rows to return
+        :param rows: Candidate rows (e.g. from a metadata filter); scored exactly
+        :return: List of (row, score), best first
+        """
+        query = _unit(query_embedding)
+        if rows is not None:
+            rows = np.asarray(rows, dtype=np.int64)
+            rows = rows[self.alive[rows]]
+            if len(rows) == 0:
+                return []
+            best_rows, best_scores = _top(rows, self.rows(rows) @ query, top_k)
+            return list(zip(best_rows.tolist(), best_scores.tolist()))
+
+        quantized = self.codes is not None
+        keep = top_k * self.rerank_factor if quantized else top_k
+        best_rows = np.zeros(0, dtype=np.int64)
+        best_scores = np.zeros(0, dtype=np.float32)
+        for start in range(0, self.base_rows, self.chunk_rows):
+            end = min(start + self.chunk_rows, self.base_rows)
+            if quantized:
+                scores = (self.codes[start:end] @ query) * self.scales[start:end]
+            else:
+                scores = np.asarray(self.vectors[start:end]) @ query
+            scores[~self.alive[start:end]] = -np.inf
+            chunk_rows, chunk_scores = _top(np.arange(start, end), scores, keep)
+            best_rows, best_scores = _top(
+                np.concatenate([best_rows, chunk_rows]), np.concatenate([best_scores, chunk_scores]), keep
+            )
+        if quantized and len(best_rows):
+            best_scores = self.rows(best_rows) @ query
+        pending = self._pending_rows()
+        if len(pending):
+            pending_rows = np.arange(self.base_rows, self.base_rows + len(pending))
+            pending_scores = pending @ query
+            pending_scores[~self.alive[self.base_rows:]] = -np.inf
+            best_rows = np.concatenate([best_rows, pending_rows])
+            best_scores = np.concatenate([best_scores, pending_scores])
+        best_rows, best_scores = _top(best_rows, best_scores, top_k)
+        finite = np.isfinite(best_scores)
+        return list(zip(best_rows[finite].tolist(), best_scores[finite].tolist()))
+
+    def query(self, query: VectorStoreQuery, **kwargs: Any) -> VectorStoreQueryResult:
+        if query.filters is not None:
+            raise ValueError("MmapVectorStore does not store metadata; filter with MetadataIndex instead")
+        rows = None
+        if query.node_ids is not None:
+            rows = np.array([self.positions[i] for i in query.node_ids if i in self.positions], dtype=np.int64)
+        if query.doc_ids is not None:
+            doc_ids = set(query.doc_ids)
+            doc_rows = np.array([r for r, d in enumerate(self.ref_doc_ids) if d in doc_ids], dtype=np.int64)
+            rows = doc_rows if rows is None else np.intersect1d(rows, doc_rows)
+        hits = self.topk(query.query_embedding, query.similarity_top_k, rows)
+        return VectorStoreQueryResult(
+            similarities=[score for _, score in hits],
+            ids=[self.node_ids[row] for row, _ in hits],
+        )
+
+    def persist(self, persist_path: str, fs: Optional[fsspec.AbstractFileSystem] = None) -> None:
+        """
+        Write the live rows to fresh files next to `persist_path` (streamed in
+        chunks, so the store never needs to fit in memory) and memory-map them.
+
+        :param persist_path: Path of the store's JSON file inside the storage context directory
+        """
+        os.makedirs(os.path.dirname(persist_path) or ".", exist_ok=True)
+        base = os.path.splitext(persist_path)[0]
+        live = self.live_rows()
+        dim = self.vectors.shape[1] if self.vectors is not None else self._pending_rows().shape[1]
+        tmp = f".tmp-{os.getpid()}"
+        if len(live):
+            vectors = np.memmap(base + VECTORS_SUFFIX + tmp, dtype=np.float32, mode="w+", shape=(len(live), dim))
+            codes = scales = None
+            if self.quantization == "int8":
+                codes = np.memmap(base + CODES_SUFFIX + tmp, dtype=np.int8, mode="w+", shape=(len(live), dim))
+                scales = np.empty(len(live), dtype=np.float32)
+            for start in range(0, len(live), self.chunk_rows):
+                chunk = self.rows(live[start:start + self.chunk_rows])
+                vectors[start:start + len(chunk)] = chunk
+                if codes is not None:
+                    codes[start:start + len(chunk)], scales[start:start + len(chunk)] = _quantize(chunk)
+            vectors.flush()
+            del vectors
+            os.replace(base + VECTORS_SUFFIX + tmp, base + VECTORS_SUFFIX)
+            if codes is not None:
+                codes.flush()
+                del codes
+                os.replace(base + CODES_SUFFIX + tmp, base + CODES_SUFFIX)
+                scales.tofile(base + SCALES_SUFFIX)
+        with open(persist_path + tmp, "w") as f:
+            json.dump({
+                "dim": dim,
+                "quantization": self.quantization,
+                "node_ids": [self.node_ids[i] for i in live],
+                "ref_doc_ids": [self.ref_doc_ids[i] for i in live],
+            }, f)
+        os.replace(persist_path + tmp, persist_path)
+        self._map(persist_path)
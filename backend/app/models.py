@@ -0,0 +1,158 @@
+"""
+Factories for the LLM and embedding models shared by the chatbots and tools.
+"""
+import atexit
+from typing import Any, Dict, Optional, Tuple
+import httpx
+from openai import AsyncOpenAI
+from llama_index.core.base.embeddings.base import BaseEmbedding
+from llama_index.core.callbacks import CallbackManager
+from llama_index.core.llms import LLM
+from llama_index.core.bridge.pydantic import PrivateAttr
+from llama_index.embeddings.openai import OpenAIEmbedding
+from llama_index.llms.openai import OpenAI
+from backend.app.config import (
+    LLM_MODEL, EMBED_MODEL, MODEL_PROVIDER, EMBED_CACHE_PATH, EMBED_CACHE_MAX_ENTRIES, EMBED_CONCURRENCY,
+    QUERY_EMBED_BATCHING, QUERY_EMBED_WINDOW_MS, QUERY_EMBED_MAX_BATCH,
+    LOCAL_LLM_LATENCY_MS, LOCAL_LLM_TOKENS_PER_S, LOCAL_LLM_MAX_TOKENS, LOCAL_EMBED_DIM, LOCAL_EMBED_LATENCY_MS,
+)
+from backend.app.embedding_batcher import BatchingEmbedding
+from backend.app.embedding_cache import CachedEmbedding, EmbeddingCache
+from backend.app.http_clients import get_async_http_client, get_http_client
+from backend.app.instrumentation import REGISTRY, metrics_handler
+from backend.app.local_models import LocalEmbedding, LocalLLM
+
+PROVIDERS = ("openai", "local")
+
+_embedding_caches: Dict[str, EmbeddingCache] = {}
+_default_embed_model: Optional[CachedEmbedding] = None
+_llms: Dict[Tuple[str, Optional[float]], LLM] = {}
+# Shared by the models, query engines and retrievers, so their events feed the metrics
+callback_manager = CallbackManager([metrics_handler])
+
+
+class PooledOpenAI(OpenAI):
+    """OpenAI LLM whose sync and async SDK clients use the shared connection pools."""
+
+    _pooled_aclient: Optional[AsyncOpenAI] = PrivateAttr(default=None)
+    _pooled_http: Optional[httpx.AsyncClient] = PrivateAttr(default=None)
+
+    def __init__(self, **kwargs: Any) -> None:
+        super().__init__(http_client=get_http_client(), **kwargs)
+
+    def _get_aclient(self) -> AsyncOpenAI:
+        http_client = get_async_http_client()
+        if self._pooled_http is not http_client:
+            self._pooled_aclient = AsyncOpenAI(**{**self._get_credential_kwargs(), "http_client": http_client})
+            self._pooled_http = http_client
+        return self._pooled_aclient
+
+
+class PooledOpenAIEmbedding(OpenAIEmbedding):
+    """OpenAI embedding model whose sync and async SDK clients use the shared connection pools."""
+
+    _pooled_aclient: Optional[AsyncOpenAI] = PrivateAttr(default=None)
+    _pooled_http: Optional[httpx.AsyncClient] = PrivateAttr(default=None)
+
+    def __init__(self, **kwargs: Any) -> None:
+        super().__init__(http_client=get_http_client(), **kwargs)
+
+    def _get_aclient(self) -> AsyncOpenAI:
+        http_client = get_async_http_client()
+        if self._pooled_http is not http_client:
+            self._pooled_aclient = AsyncOpenAI(**{**self._get_credential_kwargs(), "http_client": http_client})
+            self._pooled_http = http_client
+        return self._pooled_aclient
+
+
+def _check_provider() -> None:
+    if MODEL_PROVIDER not in PROVIDERS:
+        raise ValueError(f"Unknown MODEL_PROVIDER {MODEL_PROVIDER!r}, expected one of {PROVIDERS}")
+
+
+def get_llm(model: str = LLM_MODEL, temperature: Optional[float] = None) -> LLM:
+    """
+    Get the process-wide LLM of the configured provider for the given model
+    and temperature. OpenAI models use the shared connection pools; the local
+    provider returns a deterministic stand-in with simulated latency.
+
+    :param model: Model name
+    :param temperature: Sampling temperature (the client default if not given)
+    :return: LLM instance
+    """
+    _check_provider()
+    key = (model, temperature)
+    if key not in _llms:
+        if MODEL_PROVIDER == "local":
+            _llms[key] = LocalLLM(
+                model=f"local/{model}",
+                latency_ms=LOCAL_LLM_LATENCY_MS,
+                tokens_per_second=LOCAL_LLM_TOKENS_PER_S,
+                max_tokens=LOCAL_LLM_MAX_TOKENS,
+                callback_manager=callback_manager,
+            )
+        else:
+            kwargs = {} if temperature is None else {"temperature": temperature}
+            _llms[key] = PooledOpenAI(model=model, callback_manager=callback_manager, **kwargs)
+    return _llms[key]
+
+
+def create_embed_model() -> BaseEmbedding:
+    """
+    Create the embedding model of the configured provider.
+
+    :return: Embedding model
+    """
+    _check_provider()
+    if MODEL_PROVIDER == "local":
+        return LocalEmbedding(
+            model_name=f"local/hash-{LOCAL_EMBED_DIM}", embed_dim=LOCAL_EMBED_DIM, latency_ms=LOCAL_EMBED_LATENCY_MS
+        )
+    return PooledOpenAIEmbedding(model=EMBED_MODEL)
+
+
+def get_embedding_cache(path: str = EMBED_CACHE_PATH) -> EmbeddingCache:
+    """
+    Get the process-wide embedding cache stored at the given path.
+
+    :param path: Path of the SQLite file
+    :return: EmbeddingCache instance
+    """
+    if path not in _embedding_caches:
+        _embedding_caches[path] = EmbeddingCache(path, max_entries=EMBED_CACHE_MAX_ENTRIES)
+        atexit.register(_embedding_caches[path].flush)
+    return _embedding_caches[path]
+
+
+def get_embed_model(embed_model: Optional[BaseEmbedding] = None) -> BaseEmbedding:
+    """
+    Get an embedding model that goes through the shared embedding cache and,
+    on cache misses, the query embedding batcher: cache -> batcher -> model.
+
+    :param embed_model: Embedding model to wrap (the configured provider's model if not given)
+    :return: Cached embedding model
+    """
+    global _default_embed_model
+    if isinstance(embed_model, CachedEmbedding):
+        return embed_model
+    if embed_model is None and _default_embed_model is not None:
+        return _default_embed_model
+    inner = embed_model or create_embed_model()
+    if QUERY_EMBED_BATCHING:
+        inner = BatchingEmbedding(
+            inner, window_ms=QUERY_EMBED_WINDOW_MS, max_batch_size=QUERY_EMBED_MAX_BATCH, concurrency=EMBED_CONCURRENCY
+        )
+    cached = CachedEmbedding(inner, get_embedding_cache(), callback_manager=callback_manager)
+    if embed_model is None:
+        _default_embed_model = cached
+    return cached
+
+
+def _embedding_stats() -> Dict[str, Any]:
+    stats: Dict[str, Any] = {path: cache.stats() for path, cache in _embedding_caches.items()}
+    if _default_embed_model is not None and isinstance(_default_embed_model.inner, BatchingEmbedding):
+        stats["query_batcher"] = _default_embed_model.inner.stats()
+    return stats
+
+
+REGISTRY.register_collector("embedding", "Embedding cache and query batcher counters", _embedding_stats)
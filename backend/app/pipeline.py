@@ -0,0 +1,202 @@
+import logging
+import multiprocessing
+import time
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Any, Callable, Deque, Dict, Iterable, Iterator, List, Optional, Tuple
+from llama_index.core import SimpleDirectoryReader
+from llama_index.core.base.embeddings.base import BaseEmbedding
+from llama_index.core.schema import BaseNode, MetadataMode
+from backend.app.instrumentation import STAGE_SECONDS
+from backend.app.startup import StartupProgress
+
+logger = logging.getLogger(__name__)
+
+# Pipeline stage -> what its throughput counts
+STAGE_NAMES = {"load": "pages", "split": "nodes", "embed": "embeddings"}
+
+
+def parse_file(path: str) -> Tuple[List[Any], float]:
+    """
+    Parse one file into page documents. Runs in a worker process.
+
+    :param path: File path
+    :return: Tuple of the page documents and the seconds spent parsing
+    """
+    start = time.perf_counter()
+    documents = SimpleDirectoryReader(input_files=[path]).load_data()
+    return documents, time.perf_counter() - start
+
+
+class IngestionStats:
+    def __init__(self) -> None:
+        """
+        Initialize the IngestionStats class. Each stage records how many items
+        it produced and how long it was busy; since the stages overlap, the
+        wall time of the whole run is tracked separately.
+        """
+        self.counts: Dict[str, int] = {stage: 0 for stage in STAGE_NAMES}
+        self.busy: Dict[str, float] = {stage: 0.0 for stage in STAGE_NAMES}
+        self.wall = 0.0
+
+    def add(self, stage: str, count: int, seconds: float) -> None:
+        self.counts[stage] += count
+        self.busy[stage] += seconds
+
+    def report(self) -> Dict[str, Any]:
+        """
+        Get the per-stage throughput.
+
+        :return: Dictionary with counts, per-stage rates (items per busy second) and wall time
+        """
+        counts = {name: self.counts[stage] for stage, name in STAGE_NAMES.items()}
+        rates = {
+            f"{name}_per_s": round(self.counts[stage] / self.busy[stage], 1) if self.busy[stage] else None
+            for stage, name in STAGE_NAMES.items()
+        }
+        return {**counts, **rates, "wall_s": round(self.wall, 3)}
+
+
+class IngestionPipeline:
+    def __init__(self, splitter: Any, embed_model: BaseEmbedding, parse_workers: int = 1,
+                 embed_batch_size: int = 100, embed_concurrency: int = 4,
+                 progress: Optional[StartupProgress] = None) -> None:
+        """
+        Initialize the IngestionPipeline class. Files are parsed in a process
+        pool, pages are split as they arrive and nodes are embedded in batches
+        by a bounded number of concurrent requests. Every stage keeps a bounded
+        number of items in flight, so the pipeline itself never holds more than
+        a few files and batches at once.
+
+        :param splitter: Node parser used to split the pages
+        :param embed_model: Embedding model
+        :param parse_workers: Number of parser processes
+        :param embed_batch_size: Nodes per embedding request
+        :param embed_concurrency: Embedding requests in flight at once
+        :param progress: Receives the progress of the load, split and embed stages
+        """
+        self.splitter = splitter
+        self.embed_model = embed_model
+        self.parse_workers = parse_workers
+        self.embed_batch_size = embed_batch_size
+        self.embed_concurrency = embed_concurrency
+        self.stats = IngestionStats()
+        self.progress = progress or StartupProgress()
+
+    def _record(self, stage: str, count: int, seconds: float) -> None:
+        self.stats.add(stage, count, seconds)
+        STAGE_SECONDS.observe(seconds, stage=f"ingest_{stage}")
+        self.progress.advance(stage, count)
+
+    def iter_documents(self, input_files: List[str]) -> Iterator[Any]:
+        """
+        Parse the input files, in parallel when there are several.
+
+        :param input_files: List of input file paths
+        :return: Iterator over the page documents, in input order
+        """
+        self.progress.start("load")
+        if self.parse_workers <= 1 or len(input_files) <= 1:
+            for path in input_files:
+                documents, seconds = parse_file(path)
+                self._record("load", len(documents), seconds)
+                yield from documents
+            self.progress.finish("load")
+            return
+        # fork is unsafe here (the embedding and server threads are already running), so workers are
+        # forked from a forkserver that imports llama-index once, instead of re-importing it in every worker
+        if "forkserver" in multiprocessing.get_all_start_methods():
+            context = multiprocessing.get_context("forkserver")
+            context.set_forkserver_preload([__name__])
+        else:
+            context = multiprocessing.get_context("spawn")
+        with ProcessPoolExecutor(max_workers=self.parse_workers, mp_context=context) as pool:
+            pending: Deque[Future] = deque()
+            for path in input_files:
+                pending.append(pool.submit(parse_file, path))
+                if len(pending) > self.parse_workers:
+                    yield from self._parsed(pending.popleft())
+            while pending:
+                yield from self._parsed(pending.popleft())
+        self.progress.finish("load")
+
+    def _parsed(self, future: Future) -> List[Any]:
+        documents, seconds = future.result()
+        self._record("load", len(documents), seconds)
+        return documents
+
+    def iter_nodes(self, documents: Iterable[Any]) -> Iterator[BaseNode]:
+        """
+        Split the pages one at a time as they arrive.
+
+        :param documents: Page documents
+        :return: Iterator over the nodes
+        """
+        self.progress.start("split")
+        for document in documents:
+            start = time.perf_counter()
+            nodes = self.splitter.get_nodes_from_documents([document])
+            self._record("split", len(nodes), time.perf_counter() - start)
+            yield from nodes
+        self.progress.finish("split")
+
+    def _batches(self, nodes: Iterable[BaseNode]) -> Iterator[List[BaseNode]]:
+        batch: List[BaseNode] = []
+        for node in nodes:
+            batch.append(node)
+            if len(batch) == self.embed_batch_size:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+
+    def _embed_batch(self, batch: List[BaseNode]) -> List[BaseNode]:
+        start = time.perf_counter()
+        missing = [node for node in batch if node.embedding is None]
+        texts = [node.get_content(metadata_mode=MetadataMode.EMBED) for node in missing]
+        for node, embedding in zip(missing, self.embed_model.get_text_embedding_batch(texts)):
+            node.embedding = embedding
+        self._record("embed", len(missing), time.perf_counter() - start)
+        return batch
+
+    def embed(self, nodes: Iterable[BaseNode]) -> Iterator[BaseNode]:
+        """
+        Embed nodes in batches with at most `embed_concurrency` requests in flight.
+        Nodes that already carry an embedding are passed through.
+
+        :param nodes: Nodes to embed
+        :return: Iterator over the embedded nodes, in input order
+        """
+        self.progress.start("embed")
+        with ThreadPoolExecutor(max_workers=self.embed_concurrency) as pool:
+            pending: Deque[Future] = deque()
+            for batch in self._batches(nodes):
+                pending.append(pool.submit(self._embed_batch, batch))
+                if len(pending) > self.embed_concurrency:
+                    yield from pending.popleft().result()
+            while pending:
+                yield from pending.popleft().result()
+        self.progress.finish("embed")
+
+    def run(self, input_files: List[str], on_page: Optional[Callable[[Any], None]] = None) -> Iterator[BaseNode]:
+        """
+        Parse, split and embed the input files as one streaming pipeline. The
+        nodes are yielded as their batch is embedded, so the caller can index
+        them batch by batch instead of holding all of them (and their
+        embeddings) in memory.
+
+        :param input_files: List of input file paths
+        :param on_page: Called with every page document as it is parsed
+        :return: Iterator over the embedded nodes
+        """
+        start = time.perf_counter()
+
+        def pages(stream: Iterator[Any]) -> Iterator[Any]:
+            for document in stream:
+                if on_page is not None:
+                    on_page(document)
+                yield document
+
+        yield from self.embed(self.iter_nodes(pages(self.iter_documents(input_files))))
+        self.stats.wall += time.perf_counter() - start
+        logger.info("Ingested %s", self.stats.report())
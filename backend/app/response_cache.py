@@ -0,0 +1,210 @@
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional
+import numpy as np
+from llama_index.core.base.embeddings.base import BaseEmbedding
+
+
+@dataclass
+class CacheEntry:
+    query: str
+    response: Any
+    embedding: np.ndarray
+    version: str
+    created_at: float = field(default_factory=time.time)
+    hits: int = 0
+    last_hit: Optional[float] = None
+
+
+class SemanticResponseCache:
+    def __init__(self, embed_model: BaseEmbedding, similarity_threshold: float = 0.95,
+                 ttl: float = 3600, max_entries: int = 1024) -> None:
+        """
+        Initialize the SemanticResponseCache class. Responses are looked up by
+        the normalized query first, then by the nearest cached query embedding.
+
+        :param embed_model: Embedding model used for the query embeddings
+        :param similarity_threshold: Minimum cosine similarity for a nearest-neighbour hit
+        :param ttl: Seconds a cached response stays valid
+        :param max_entries: Maximum number of cached responses before the least recently used one is evicted
+        """
+        self.embed_model = embed_model
+        self.similarity_threshold = similarity_threshold
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.exact_hits = 0
+        self.semantic_hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[str, CacheEntry]" = OrderedDict()
+        self._matrix: Optional[np.ndarray] = None
+        self._matrix_keys: List[str] = []
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def normalize(query: str) -> str:
+        return " ".join(query.lower().split())
+
+    @staticmethod
+    def _unit(embedding: List[float]) -> np.ndarray:
+        vector = np.asarray(embedding, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def _expired(self, entry: CacheEntry, version: str) -> bool:
+        return entry.version != version or time.time() - entry.created_at > self.ttl
+
+    def _drop(self, key: str) -> None:
+        del self._entries[key]
+        self._matrix = None
+
+    def _hit(self, key: str) -> Any:
+        entry = self._entries[key]
+        entry.hits += 1
+        entry.last_hit = time.time()
+        self._entries.move_to_end(key)
+        return entry.response
+
+    def _lookup_exact(self, key: str, version: str) -> Optional[Any]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if self._expired(entry, version):
+            self._drop(key)
+            return None
+        self.exact_hits += 1
+        return self._hit(key)
+
+    def _lookup_nearest(self, embedding: np.ndarray, version: str) -> Optional[Any]:
+        if not self._entries:
+            return None
+        if self._matrix is None:
+            self._matrix_keys = list(self._entries)
+            self._matrix = np.stack([self._entries[k].embedding for k in self._matrix_keys])
+        similarities = self._matrix @ embedding
+        for i in np.argsort(-similarities):
+            if similarities[i] < self.similarity_threshold:
+                break
+            key = self._matrix_keys[i]
+            if key in self._entries and not self._expired(self._entries[key], version):
+                self.semantic_hits += 1
+                return self._hit(key)
+        return None
+
+    def lookup(self, query: str, version: str) -> Optional[Any]:
+        """
+        Look up a cached response for the query.
+
+        :param query: User query
+        :param version: Current index version; entries cached for another version never match
+        :return: Cached response, or None on a miss
+        """
+        key = self.normalize(query)
+        with self._lock:
+            response = self._lookup_exact(key, version)
+        if response is not None:
+            return response
+        embedding = self._unit(self.embed_model.get_query_embedding(query))
+        with self._lock:
+            response = self._lookup_nearest(embedding, version)
+            if response is None:
+                self.misses += 1
+        return response
+
+    async def alookup(self, query: str, version: str) -> Optional[Any]:
+        """
+        Look up a cached response for the query without blocking on the embedding call.
+
+        :param query: User query
+        :param version: Current index version
+        :return: Cached response, or None on a miss
+        """
+        key = self.normalize(query)
+        with self._lock:
+            response = self._lookup_exact(key, version)
+        if response is not None:
+            return response
+        embedding = self._unit(await self.embed_model.aget_query_embedding(query))
+        with self._lock:
+            response = self._lookup_nearest(embedding, version)
+            if response is None:
+                self.misses += 1
+        return response
+
+    def store(self, query: str, response: Any, version: str, embedding: Optional[List[float]] = None) -> None:
+        """
+        Cache a response. Storing a response for a new index version drops
+        every entry of the previous versions.
+
+        :param query: User query
+        :param response: Response to cache (an Answer, with its sources)
+        :param version: Index version the response was produced with
+        :param embedding: Query embedding, if already computed
+        """
+        if embedding is None:
+            embedding = self.embed_model.get_query_embedding(query)
+        self._store(query, response, version, self._unit(embedding))
+
+    async def astore(self, query: str, response: Any, version: str, embedding: Optional[List[float]] = None) -> None:
+        """
+        Cache a response without blocking on the embedding call.
+
+        :param query: User query
+        :param response: Response to cache
+        :param version: Index version the response was produced with
+        :param embedding: Query embedding, if already computed
+        """
+        if embedding is None:
+            embedding = await self.embed_model.aget_query_embedding(query)
+        self._store(query, response, version, self._unit(embedding))
+
+    def _store(self, query: str, response: Any, version: str, embedding: np.ndarray) -> None:
+        with self._lock:
+            self._invalidate(keep_version=version)
+            key = self.normalize(query)
+            if key in self._entries:
+                self._drop(key)
+            self._entries[key] = CacheEntry(query=query, response=response, embedding=embedding, version=version)
+            self._matrix = None
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, keep_version: Optional[str] = None) -> None:
+        """
+        Drop cached entries.
+
+        :param keep_version: Keep the entries of this index version (drop everything if not given)
+        """
+        with self._lock:
+            self._invalidate(keep_version)
+
+    def _invalidate(self, keep_version: Optional[str]) -> None:
+        stale = [k for k, e in self._entries.items() if e.version != keep_version]
+        for key in stale:
+            del self._entries[key]
+        if stale:
+            self._matrix = None
+
+    def stats(self, top: int = 10) -> Dict[str, Any]:
+        """
+        Get the cache counters and the most hit entries.
+
+        :param top: Number of entries to report
+        :return: Dictionary of statistics
+        """
+        lookups = self.exact_hits + self.semantic_hits + self.misses
+        with self._lock:
+            entries = sorted(self._entries.values(), key=lambda e: e.hits, reverse=True)[:top]
+            size = len(self._entries)
+        return {
+            "exact_hits": self.exact_hits,
+            "semantic_hits": self.semantic_hits,
+            "misses": self.misses,
+            "hit_rate": (self.exact_hits + self.semantic_hits) / lookups if lookups else 0.0,
+            "size": size,
+            "entries": [
+                {"query": e.query, "hits": e.hits, "last_hit": e.last_hit, "created_at": e.created_at}
+                for e in entries
+            ],
+        }
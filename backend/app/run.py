@@ -1,4 +1,8 @@
-from fastapi import FastAPI
+from contextlib import asynccontextmanager
+from dataclasses import asdict
+from typing import AsyncIterator, List, Optional
+from fastapi import FastAPI, HTTPException
+from fastapi.responses import JSONResponse, StreamingResponse
 from pydantic import BaseModel
 from backend.app.chatbot import LlamaIndexChatbot
 import sys
@@ -8,37 +12,127 @@ sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../.
 
 from backend.app.bot import *
 
-app = FastAPI()
+from backend.app.concurrency import QueryLimiter, QueueFullError
+from backend.app.streaming import ClosingStreamingResponse, ndjson_stream
+from backend.app.corpus import resolve_corpus_files
+from backend.app.startup import StartupProgress
+from backend.app.config import MAX_CONCURRENT_QUERIES, MAX_QUEUED_QUERIES, QUERY_QUEUE_TIMEOUT, RETRY_AFTER_SECONDS, CORPUS_FILES
+
+limiter = QueryLimiter(MAX_CONCURRENT_QUERIES, MAX_QUEUED_QUERIES, QUERY_QUEUE_TIMEOUT, RETRY_AFTER_SECONDS)
 # chatbot = LlamaIndexChatbot(input_files=["transformers.pdf"])
 
-input_files = ["transformers.pdf"]
-chatbot = Chat(input_files=input_files)
+input_files = resolve_corpus_files(CORPUS_FILES)
+progress = StartupProgress()
+
+def create_chatbot(progress: StartupProgress) -> Chat:
+    """
+    Build the chat agent over the configured corpus. Its tools index the
+    files in one go, so only the index stage is reported.
+
+    :param progress: Receives the progress of the index stage
+    :return: Chat instance
+    """
+    progress.start("index")
+    chatbot = Chat(input_files=input_files)
+    progress.finish("index")
+    return chatbot
+
+@asynccontextmanager
+async def lifespan(app: FastAPI) -> AsyncIterator[None]:
+    """
+    Start building the chat agent in the background, so the server binds
+    its port and answers health probes right away.
+    """
+    progress.run_in_background(create_chatbot)
+    yield
+
+app = FastAPI(lifespan=lifespan)
+
+def get_chatbot() -> Chat:
+    """
+    Get the chat agent, or answer 503 while it is still warming up.
+
+    :return: Chat instance
+    """
+    if not progress.ready:
+        raise HTTPException(
+            status_code=503,
+            detail=f"Chatbot is not ready ({progress.state})",
+            headers={"Retry-After": str(RETRY_AFTER_SECONDS)},
+        )
+    return progress.result
 
 class ChatRequest(BaseModel):
     user_input: str
 
+class SourceInfo(BaseModel):
+    node_id: str
+    score: Optional[float] = None
+    page_label: Optional[str] = None
+    file_name: Optional[str] = None
+
 class ChatResponse(BaseModel):
     bot_response: str
-
-class DocMetadata(BaseModel):
-    doc_metadata: str
+    tool: Optional[str] = None
+    sources: List[SourceInfo] = []
 
 @app.get("/")
+@app.get("/health/live")
 def healthy_check() -> dict:
     """
-    Health check endpoint.
+    Liveness endpoint: the process is up and serving, whether or not the
+    chat agent is ready yet.
 
     :return: Dictionary indicating the health status
     """
-    return {'status': 'healthy'}
+    return {'status': 'healthy', 'ready': progress.ready}
+
+@app.get("/health/ready")
+def readiness_check() -> JSONResponse:
+    """
+    Readiness endpoint: 200 once the chat agent can answer, 503 before that
+    (or if warm-up failed), with the progress of each startup stage.
+
+    :return: JSONResponse with the warm-up state and per-stage progress
+    """
+    return JSONResponse(progress.report(), status_code=200 if progress.ready else 503)
 
 @app.post("/chat", response_model=ChatResponse)
-def chat(request: ChatRequest) -> ChatResponse:
+async def chat(request: ChatRequest) -> ChatResponse:
     """
-    Chat endpoint to get a response from the chatbot.
+    Chat endpoint to get a response from the chatbot. Queries beyond the
+    concurrency limit are queued; once the queue is full the endpoint
+    answers 429 with a Retry-After header. Until the chat agent is ready it
+    answers 503.
 
     :param request: ChatRequest containing the user input
     :return: ChatResponse containing the bot's response
     """
-    response = chatbot.process_query(request.user_input)
-    return ChatResponse(bot_response=response)
+    chatbot = get_chatbot()
+    try:
+        async with limiter.slot():
+            answer = await chatbot.aprocess_query(request.user_input)
+    except QueueFullError as e:
+        raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": str(e.retry_after)})
+    return ChatResponse(
+        bot_response=answer.response,
+        tool=answer.tool,
+        sources=[SourceInfo(**asdict(source)) for source in answer.sources],
+    )
+
+@app.post("/chat/stream")
+async def chat_stream(request: ChatRequest) -> StreamingResponse:
+    """
+    Chat endpoint that streams the bot's response as newline-delimited JSON:
+    one {"token": ...} line per token, then {"done": true}.
+
+    :param request: ChatRequest containing the user input
+    :return: StreamingResponse of NDJSON lines
+    """
+    chatbot = get_chatbot()
+    try:
+        await limiter.acquire()
+    except QueueFullError as e:
+        raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": str(e.retry_after)})
+    tokens = chatbot.stream_query(request.user_input)
+    return ClosingStreamingResponse(ndjson_stream(tokens), on_close=limiter.release, media_type="application/x-ndjson")
@@ -0,0 +1,94 @@
+import logging
+import threading
+import time
+from typing import Any, Callable, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+STAGES = ("load", "split", "embed", "index")
+
+
+class StartupProgress:
+    def __init__(self) -> None:
+        """
+        Initialize the StartupProgress class. It tracks the state of the
+        background warm-up ("starting", "ready" or "failed") and, per stage,
+        whether it is pending, running, done or skipped (served from the
+        persisted indices), how many items it processed and how long it took.
+        """
+        self.state = "starting"
+        self.error: Optional[str] = None
+        self.result: Any = None
+        self.started_at = time.time()
+        self.ready_at: Optional[float] = None
+        self.stages: Dict[str, Dict[str, Any]] = {
+            stage: {"status": "pending", "count": 0, "seconds": None} for stage in STAGES
+        }
+        self._stage_started: Dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    @property
+    def ready(self) -> bool:
+        return self.state == "ready"
+
+    def start(self, stage: str) -> None:
+        with self._lock:
+            if self.stages[stage]["status"] == "pending":
+                self.stages[stage]["status"] = "running"
+                self._stage_started[stage] = time.perf_counter()
+
+    def advance(self, stage: str, count: int = 1) -> None:
+        with self._lock:
+            self.stages[stage]["count"] += count
+
+    def finish(self, stage: str) -> None:
+        with self._lock:
+            if self.stages[stage]["status"] == "running":
+                self.stages[stage]["status"] = "done"
+                self.stages[stage]["seconds"] = round(time.perf_counter() - self._stage_started[stage], 3)
+
+    def skip(self, *stages: str) -> None:
+        with self._lock:
+            for stage in stages:
+                if self.stages[stage]["status"] == "pending":
+                    self.stages[stage]["status"] = "skipped"
+
+    def run_in_background(self, factory: Callable[["StartupProgress"], Any]) -> threading.Thread:
+        """
+        Build the result (the chatbot) in a daemon thread, so the server can
+        answer liveness and readiness probes while the indices are loaded.
+
+        :param factory: Builds the result, reporting its stages to this progress
+        :return: The started thread
+        """
+        def build() -> None:
+            try:
+                self.result = factory(self)
+            except Exception as e:
+                logger.exception("Warm-up failed")
+                self.error = f"{type(e).__name__}: {e}"
+                self.state = "failed"
+                return
+            self.ready_at = time.time()
+            self.state = "ready"
+            logger.info("Ready after %.1fs", self.ready_at - self.started_at)
+
+        thread = threading.Thread(target=build, name="warm-up", daemon=True)
+        thread.start()
+        return thread
+
+    def report(self) -> Dict[str, Any]:
+        """
+        Get the warm-up state for the readiness endpoint.
+
+        :return: Dictionary with the state, per-stage progress and timings
+        """
+        with self._lock:
+            stages = {stage: dict(info) for stage, info in self.stages.items()}
+        end = self.ready_at or time.time()
+        return {
+            "status": self.state,
+            "error": self.error,
+            "elapsed_s": round(end - self.started_at, 3),
+            "stages": stages,
+        }
@@ -0,0 +1,70 @@
+import json
+from typing import Any, AsyncIterator, Callable, Iterator
+from starlette.concurrency import iterate_in_threadpool
+from starlette.responses import StreamingResponse
+from starlette.types import Receive, Scope, Send
+
+
+def response_tokens(response) -> Iterator[str]:
+    """
+    Yield the tokens of a query engine response, whether it streams or not.
+
+    :param response: Response or StreamingResponse
+    :return: Iterator over the response tokens
+    """
+    response_gen = getattr(response, "response_gen", None)
+    if response_gen is not None:
+        yield from response_gen
+    else:
+        yield str(response)
+
+
+class ClosingStreamingResponse(StreamingResponse):
+    """
+    StreamingResponse that calls `on_close` once the response is over, however
+    it ended. Cleanup in the body generator is not enough: a generator that
+    never started (the client went away before the first chunk) never runs it.
+    """
+
+    def __init__(self, content: Any, on_close: Callable[[], None], **kwargs: Any) -> None:
+        super().__init__(content, **kwargs)
+        self.on_close = on_close
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            self.on_close()
+
+
+async def ndjson_stream(tokens: Iterator[str]) -> AsyncIterator[str]:
+    """
+    Forward tokens as newline-delimited JSON: one {"token": ...} line per token
+    and a final {"done": true} (or {"error": ...}) line. The token iterator is
+    blocking, so it is driven from the threadpool.
+
+    :param tokens: Blocking iterator over the response tokens
+    :return: Async iterator over NDJSON lines
+    """
+    try:
+        async for token in iterate_in_threadpool(tokens):
+            yield json.dumps({"token": token}) + "\n"
+        yield json.dumps({"done": True}) + "\n"
+    except Exception as e:
+        yield json.dumps({"error": str(e)}) + "\n"
+
+
+async def ndjson_results(results: AsyncIterator[dict]) -> AsyncIterator[str]:
+    """
+    Forward results as newline-delimited JSON as they arrive: one line per
+    result and a final {"done": true} (or {"error": ...}) line.
+
+    :param results: Async iterator over JSON-serializable results
+    :return: Async iterator over NDJSON lines
+    """
+    try:
+        async for result in results:
+            yield json.dumps(result) + "\n"
+        yield json.dumps({"done": True}) + "\n"
+    except Exception as e:
+        yield json.dumps({"error": str(e)}) + "\n"
@@ -0,0 +1,258 @@
+import hashlib
+import re
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from llama_index.core import Settings
+from llama_index.core.base.response.schema import StreamingResponse
+from llama_index.core.bridge.pydantic import Field
+from llama_index.core.query_engine import CustomQueryEngine
+
+PAGE_PROMPT = (
+    "Summarize the following page of a document in a few sentences. "
+    "Keep names, numbers and key terms.\n\n{text}\n\nSummary:"
+)
+SECTION_PROMPT = (
+    "The following are summaries of consecutive pages of a document. "
+    "Combine them into one concise summary of this section.\n\n{text}\n\nSummary:"
+)
+DOCUMENT_PROMPT = (
+    "The following are summaries of the sections of a document, in order. "
+    "Write a concise summary of the whole document.\n\n{text}\n\nSummary:"
+)
+ANSWER_PROMPT = (
+    "Summaries of the document at several levels of detail are below.\n"
+    "---------------------\n{context}\n---------------------\n"
+    "Using only these summaries, answer the query.\nQuery: {query}\nAnswer: "
+)
+
+
+def _hash(text: str) -> str:
+    return hashlib.sha256(text.encode()).hexdigest()
+
+
+class SummaryTree:
+    def __init__(self, files: Optional[Dict[str, Any]] = None, summaries: Optional[Dict[str, str]] = None,
+                 section_size: int = 4, concurrency: int = 8, max_input_tokens: int = 3000,
+                 tokenizer: Optional[Callable[[str], List[Any]]] = None) -> None:
+        """
+        Initialize the SummaryTree class. For every file it holds a summary per
+        page, per section (a run of `section_size` pages), per run of sections
+        (as many levels as needed for the top one to fit `max_input_tokens`)
+        and for the whole document. Summaries are stored by the hash of their
+        input, so an update only re-summarizes the pages that changed and
+        their ancestors.
+
+        :param files: Tree structure per file
+        :param summaries: Summaries keyed by the hash of their input
+        :param section_size: Number of pages per section
+        :param concurrency: Number of summaries requested from the LLM at once
+        :param max_input_tokens: Maximum tokens of summaries combined into one prompt, or used as answer context
+        :param tokenizer: Tokenizer used to count tokens (Settings.tokenizer if not given)
+        """
+        self.files: Dict[str, Any] = files or {}
+        self.summaries: Dict[str, str] = summaries or {}
+        self.section_size = section_size
+        self.concurrency = concurrency
+        self.max_input_tokens = max_input_tokens
+        self.tokenizer = tokenizer
+        self._token_counts: Dict[str, int] = {}
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"files": self.files, "summaries": self.summaries}
+
+    @classmethod
+    def from_dict(cls, data: Optional[Dict[str, Any]], **kwargs: Any) -> "SummaryTree":
+        data = data or {}
+        return cls(data.get("files"), data.get("summaries"), **kwargs)
+
+    @staticmethod
+    def group_pages(nodes: List[Any]) -> Dict[str, List[Tuple[str, str]]]:
+        """
+        Rebuild the page texts of every file from its nodes.
+
+        :param nodes: List of nodes
+        :return: Dictionary of file path and (page label, page text) tuples in page order
+        """
+        files: Dict[str, "OrderedDict[str, List[Any]]"] = {}
+        for node in nodes:
+            pages = files.setdefault(node.metadata.get("file_path", ""), OrderedDict())
+            pages.setdefault(node.ref_doc_id or node.node_id, []).append(node)
+
+        def order(item: Tuple[int, List[Any]]) -> Tuple[int, Any]:
+            label = item[1][0].metadata.get("page_label", "")
+            return (0, int(label)) if str(label).isdigit() else (1, item[0])
+
+        grouped = {}
+        for path, pages in files.items():
+            ordered = sorted(enumerate(pages.values()), key=order)
+            grouped[path] = [
+                (page[0].metadata.get("page_label", str(i + 1)), "\n".join(n.get_content() for n in page))
+                for i, page in ordered
+            ]
+        return grouped
+
+    def _tokens(self, line: str) -> int:
+        if line not in self._token_counts:
+            self._token_counts[line] = len((self.tokenizer or Settings.tokenizer)(line))
+        return self._token_counts[line]
+
+    def _lines(self, level: List[Dict[str, Any]]) -> List[str]:
+        return [f"Pages {entry['pages'][0]}-{entry['pages'][-1]}: {self.summaries[entry['key']]}" for entry in level]
+
+    def _group(self, level: List[Dict[str, Any]]) -> List[List[Dict[str, Any]]]:
+        """
+        Split a level into runs of consecutive entries whose summaries fit
+        `max_input_tokens` together. Every run holds at least two entries, so
+        the level above is always smaller.
+
+        :param level: Entries of a level
+        :return: List of runs
+        """
+        groups: List[List[Dict[str, Any]]] = []
+        tokens = 0
+        for entry, line in zip(level, self._lines(level)):
+            if groups and (len(groups[-1]) < 2 or tokens + self._tokens(line) <= self.max_input_tokens):
+                groups[-1].append(entry)
+                tokens += self._tokens(line)
+            else:
+                groups.append([entry])
+                tokens = self._tokens(line)
+        if len(groups) > 1 and len(groups[-1]) < 2:
+            groups[-2].extend(groups.pop())
+        return groups
+
+    def _summarize(self, llm: Any, jobs: Dict[str, str]) -> None:
+        jobs = {key: prompt for key, prompt in jobs.items() if key not in self.summaries}
+        if not jobs:
+            return
+        with ThreadPoolExecutor(max_workers=self.concurrency) as pool:
+            results = pool.map(lambda prompt: llm.complete(prompt).text.strip(), jobs.values())
+            self.summaries.update(zip(jobs.keys(), results))
+
+    def update(self, nodes: List[Any], llm: Any = None) -> bool:
+        """
+        Bring the tree up to date with the given nodes, level by level.
+
+        :param nodes: All nodes of the index
+        :param llm: LLM used to summarize (Settings.llm if not given)
+        :return: True if anything was re-summarized or removed
+        """
+        llm = llm or Settings.llm
+        before = set(self.summaries)
+        pages = self.group_pages(nodes)
+
+        page_keys = {path: [(label, _hash(PAGE_PROMPT + text)) for label, text in file_pages]
+                     for path, file_pages in pages.items()}
+        self._summarize(llm, {
+            key: PAGE_PROMPT.format(text=text)
+            for path, file_pages in pages.items()
+            for (label, text), (_, key) in zip(file_pages, page_keys[path])
+        })
+
+        sections: Dict[str, List[Dict[str, Any]]] = {}
+        section_jobs = {}
+        for path, keys in page_keys.items():
+            sections[path] = []
+            for start in range(0, len(keys), self.section_size):
+                chunk = keys[start:start + self.section_size]
+                text = "\n\n".join(f"Page {label}: {self.summaries[key]}" for label, key in chunk)
+                key = _hash(SECTION_PROMPT + text)
+                sections[path].append({"pages": [label for label, _ in chunk], "key": key})
+                section_jobs[key] = SECTION_PROMPT.format(text=text)
+        self._summarize(llm, section_jobs)
+
+        levels = {path: [file_sections] for path, file_sections in sections.items()}
+        while True:
+            level_jobs = {}
+            for path, file_levels in levels.items():
+                top = file_levels[-1]
+                if len(top) < 2 or sum(self._tokens(line) for line in self._lines(top)) <= self.max_input_tokens:
+                    continue
+                level = []
+                for group in self._group(top):
+                    text = "\n\n".join(self._lines(group))
+                    key = _hash(SECTION_PROMPT + text)
+                    level.append({"pages": [group[0]["pages"][0], group[-1]["pages"][-1]], "key": key})
+                    level_jobs[key] = SECTION_PROMPT.format(text=text)
+                file_levels.append(level)
+            if not level_jobs:
+                break
+            self._summarize(llm, level_jobs)
+
+        document_jobs = {}
+        files = {}
+        for path, file_levels in levels.items():
+            text = "\n\n".join(self._lines(file_levels[-1]))
+            key = _hash(DOCUMENT_PROMPT + text)
+            document_jobs[key] = DOCUMENT_PROMPT.format(text=text)
+            files[path] = {
+                "key": key,
+                "pages": [{"page_label": label, "key": k} for label, k in page_keys[path]],
+                "levels": file_levels,
+            }
+        self._summarize(llm, document_jobs)
+
+        used = {f["key"] for f in files.values()}
+        used |= {p["key"] for f in files.values() for p in f["pages"]}
+        used |= {entry["key"] for f in files.values() for level in f["levels"] for entry in level}
+        self.summaries = {k: v for k, v in self.summaries.items() if k in used}
+        changed = self.files != files or set(self.summaries) != before
+        self.files = files
+        self._token_counts.clear()
+        return changed
+
+    def context(self, query: str) -> str:
+        """
+        Assemble the summaries relevant to a query within `max_input_tokens`:
+        the document summaries, then for every file the most detailed level
+        of sections that still fits, then the page summaries of the pages the
+        query mentions while they fit.
+
+        :param query: User query
+        :return: Context text
+        """
+        mentioned = set(re.findall(r"\bpages?\s+(\w+)", query, flags=re.IGNORECASE))
+        parts = [f"Document {path}: {self.summaries[tree['key']]}" for path, tree in self.files.items()]
+        remaining = self.max_input_tokens - sum(self._tokens(part) for part in parts)
+        for tree in self.files.values():
+            # trees persisted before levels were added have a single level of sections
+            for level in tree.get("levels") or [tree["sections"]]:
+                lines = self._lines(level)
+                tokens = sum(self._tokens(line) for line in lines)
+                if tokens <= remaining:
+                    parts.extend(lines)
+                    remaining -= tokens
+                    break
+        for tree in self.files.values():
+            for page in tree["pages"]:
+                if page["page_label"] in mentioned:
+                    line = f"Page {page['page_label']}: {self.summaries[page['key']]}"
+                    if self._tokens(line) <= remaining:
+                        parts.append(line)
+                        remaining -= self._tokens(line)
+        return "\n\n".join(parts)
+
+
+class SummaryTreeQueryEngine(CustomQueryEngine):
+    """Answers summary questions from a precomputed SummaryTree with a single LLM call."""
+
+    tree: Any = Field(description="Precomputed summary tree")
+    llm: Any = Field(default=None, description="LLM (Settings.llm if not given)")
+    streaming: bool = Field(default=False, description="Whether to stream the answer")
+
+    def _prompt(self, query_str: str) -> str:
+        return ANSWER_PROMPT.format(context=self.tree.context(query_str), query=query_str)
+
+    def custom_query(self, query_str: str):
+        llm = self.llm or Settings.llm
+        if self.streaming:
+            completion = llm.stream_complete(self._prompt(query_str))
+            return StreamingResponse(response_gen=(r.delta or "" for r in completion))
+        return llm.complete(self._prompt(query_str)).text
+
+    async def acustom_query(self, query_str: str):
+        if self.streaming:
+            return self.custom_query(query_str)
+        llm = self.llm or Settings.llm
+        return (await llm.acomplete(self._prompt(query_str))).text
@@ -43,8 +43,9 @@ nodes = splitter.get_nodes_from_documents(documents)
 # ------------------------------------------------
 
 from llama_index.core import VectorStoreIndex
+from backend.app.models import get_embed_model, get_llm
 
-vector_index = VectorStoreIndex(nodes)
+vector_index = VectorStoreIndex(nodes, embed_model=get_embed_model())
 query_engine = vector_index.as_query_engine(similarity_top_k=2)
 
 # 7. Query the RAG pipeline via metadata filters
@@ -77,7 +78,23 @@ for n in response.source_nodes:
 from typing import List
 from llama_index.core.vector_stores import FilterCondition
 from llama_index.core.tools import FunctionTool
-from llama_index.llms.openai import OpenAI
+from backend.app.engine_pool import QueryEnginePool
+
+def build_query_engine(top_k: int, page_numbers, streaming: bool = False):
+    metadata_dicts = [
+        {"key": "page_label", "value": p} for p in page_numbers
+    ]
+    
+    return vector_index.as_query_engine(
+        similarity_top_k=top_k,
+        filters=MetadataFilters.from_dicts(
+            metadata_dicts,
+            condition=FilterCondition.OR
+        ),
+        streaming=streaming,
+    )
+
+engine_pool = QueryEnginePool(build_query_engine)
 
 def vector_query(
     query: str, 
@@ -91,17 +108,7 @@ def vector_query(
     
     """
 
-    metadata_dicts = [
-        {"key": "page_label", "value": p} for p in page_numbers
-    ]
-    
-    query_engine = vector_index.as_query_engine(
-        similarity_top_k=2,
-        filters=MetadataFilters.from_dicts(
-            metadata_dicts,
-            condition=FilterCondition.OR
-        )
-    )
+    query_engine = engine_pool.get(2, page_numbers)
     response = query_engine.query(query)
     return response
 
@@ -110,7 +117,7 @@ vector_query_tool = FunctionTool.from_defaults(
     fn=vector_query
 )
 
-llm = OpenAI(model="gpt-3.5-turbo", temperature=0)
+llm = get_llm("gpt-3.5-turbo", temperature=0)
 response = llm.predict_and_call(
     [vector_query_tool], 
     "What doest the abstract section include in the first page.", 
@@ -1,39 +1,53 @@
 from llama_index.core import SimpleDirectoryReader
-from llama_index.core.node_parser import SentenceSplitter
 from llama_index.core import Settings
-from llama_index.llms.openai import OpenAI
-from llama_index.embeddings.openai import OpenAIEmbedding
 from llama_index.core import SummaryIndex, VectorStoreIndex
 from llama_index.core.tools import QueryEngineTool
 from llama_index.core.query_engine.router_query_engine import RouterQueryEngine
 from llama_index.core.selectors import LLMSingleSelector
+from backend.app.models import get_embed_model, get_llm
+from backend.app.config import (
+    ROUTER_MODE, ROUTER_MARGIN_THRESHOLD, ROUTER_KEYWORD_BONUS, SUMMARY_MODE, SUMMARY_SECTION_SIZE,
+    SUMMARY_MAX_INPUT_TOKENS,
+)
+from backend.app.chunking import get_context_postprocessor, get_node_parser
+from backend.app.summary_tree import SummaryTree, SummaryTreeQueryEngine
+from backend.app.fast_selector import FastSelector, SUMMARY_KEYWORDS
 
 
 
 
 def get_router_query_engine(file_path: str, llm = None, embed_model = None):
     """Get router query engine."""
-    llm = llm or OpenAI(model="gpt-3.5-turbo")
-    embed_model = embed_model or OpenAIEmbedding(model="text-embedding-ada-002")
+    llm = llm or get_llm("gpt-3.5-turbo")
+    embed_model = get_embed_model(embed_model)
     
     # load documents
     documents = SimpleDirectoryReader(input_files=[file_path]).load_data()
     
-    splitter = SentenceSplitter(chunk_size=1024)
+    splitter = get_node_parser()
     nodes = splitter.get_nodes_from_documents(documents)
     
     summary_index = SummaryIndex(nodes)
     vector_index = VectorStoreIndex(nodes, embed_model=embed_model)
     
-    summary_query_engine = summary_index.as_query_engine(
-        response_mode="tree_summarize",
-        use_async=True,
-        llm=llm
+    if SUMMARY_MODE == "tree":
+        summary_tree = SummaryTree(section_size=SUMMARY_SECTION_SIZE, max_input_tokens=SUMMARY_MAX_INPUT_TOKENS)
+        summary_tree.update(nodes, llm=llm)
+        summary_query_engine = SummaryTreeQueryEngine(tree=summary_tree, llm=llm)
+    else:
+        summary_query_engine = summary_index.as_query_engine(
+            response_mode="tree_summarize",
+            use_async=True,
+            llm=llm
+        )
+    context_postprocessor = get_context_postprocessor()
+    vector_query_engine = vector_index.as_query_engine(
+        llm=llm, node_postprocessors=[context_postprocessor] if context_postprocessor is not None else []
     )
-    vector_query_engine = vector_index.as_query_engine(llm=llm)
     
     summary_tool = QueryEngineTool.from_defaults(
         query_engine=summary_query_engine,
+        name="summary_tool",
         description=(
             "Useful for summarization questions related to MetaGPT"
         ),
@@ -41,13 +55,24 @@ def get_router_query_engine(file_path: str, llm = None, embed_model = None):
     
     vector_tool = QueryEngineTool.from_defaults(
         query_engine=vector_query_engine,
+        name="vector_tool",
         description=(
             "Useful for retrieving specific context from the MetaGPT paper."
         ),
     )
     
+    selector = LLMSingleSelector.from_defaults(llm=llm)
+    if ROUTER_MODE == "fast":
+        selector = FastSelector(
+            embed_model,
+            fallback=selector,
+            keyword_rules={"summary_tool": SUMMARY_KEYWORDS},
+            margin_threshold=ROUTER_MARGIN_THRESHOLD,
+            keyword_bonus=ROUTER_KEYWORD_BONUS,
+        )
+    
     query_engine = RouterQueryEngine(
-        selector=LLMSingleSelector.from_defaults(),
+        selector=selector,
         query_engine_tools=[
             summary_tool,
             vector_tool,
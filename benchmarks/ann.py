@@ -0,0 +1,100 @@
+"""
+Recall vs latency of the IVF index against the exact scan on a synthetic
+corpus (a Gaussian mixture, so that it has cluster structure like real
+embeddings), with and without a metadata filter.
+
+Run from the repository root:
+
+    python -m benchmarks.ann --vectors 1000000 --dim 128
+"""
+import argparse
+import json
+import time
+from typing import Callable, List
+import numpy as np
+from backend.app.ann import IVFIndex
+
+
+def normalize(matrix: np.ndarray) -> np.ndarray:
+    return matrix / np.linalg.norm(matrix, axis=-1, keepdims=True)
+
+
+def synthetic_corpus(n: int, dim: int, clusters: int, seed: int) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((clusters, dim)).astype(np.float32)
+    vectors = np.empty((n, dim), dtype=np.float32)
+    for start in range(0, n, 100000):
+        end = min(start + 100000, n)
+        vectors[start:end] = centers[rng.integers(clusters, size=end - start)]
+        vectors[start:end] += 0.9 * rng.standard_normal((end - start, dim)).astype(np.float32)
+    return normalize(vectors)
+
+
+def exact_search(matrix: np.ndarray, query: np.ndarray, top_k: int, mask: np.ndarray = None) -> List[int]:
+    rows = np.arange(len(matrix)) if mask is None else np.flatnonzero(mask)
+    scores = matrix[rows] @ query if mask is not None else matrix @ query
+    best = np.argpartition(-scores, top_k - 1)[:top_k]
+    return rows[best[np.argsort(-scores[best])]].tolist()
+
+
+def timed(fn: Callable[[np.ndarray], List[int]], queries: np.ndarray) -> dict:
+    results, timings = [], []
+    for query in queries:
+        start = time.perf_counter()
+        results.append(fn(query))
+        timings.append((time.perf_counter() - start) * 1000)
+    timings.sort()
+    return {
+        "results": results,
+        "p50_ms": round(timings[len(timings) // 2], 3),
+        "p99_ms": round(timings[max(0, int(len(timings) * 0.99) - 1)], 3),
+    }
+
+
+def recall(results: List[List[int]], truth: List[List[int]]) -> float:
+    return round(float(np.mean([len(set(r) & set(t)) / len(t) for r, t in zip(results, truth)])), 4)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--vectors", type=int, default=1_000_000)
+    parser.add_argument("--dim", type=int, default=128)
+    parser.add_argument("--clusters", type=int, default=2000, help="mixture components of the synthetic corpus")
+    parser.add_argument("--lists", type=int, default=0, help="IVF clusters (4 * sqrt(n) if 0)")
+    parser.add_argument("--probes", default="1,2,4,8,16,32,64")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--top-k", type=int, default=10)
+    parser.add_argument("--filter-fraction", type=float, default=0.2, help="share of rows matching the filter")
+    args = parser.parse_args()
+
+    matrix = synthetic_corpus(args.vectors, args.dim, args.clusters, seed=0)
+    rng = np.random.default_rng(1)
+    queries = normalize(matrix[rng.integers(len(matrix), size=args.queries)]
+                        + 0.5 * rng.standard_normal((args.queries, args.dim)).astype(np.float32) / np.sqrt(args.dim))
+    mask = rng.random(len(matrix)) < args.filter_fraction
+
+    def vectors(rows: np.ndarray) -> np.ndarray:
+        return matrix[rows]
+
+    start = time.perf_counter()
+    index = IVFIndex.train(vectors, len(matrix), n_lists=args.lists)
+    build_s = round(time.perf_counter() - start, 1)
+
+    report = {"vectors": args.vectors, "dim": args.dim, "lists": index.n_lists, "build_s": build_s, "top_k": args.top_k}
+    for name, query_mask in (("unfiltered", None), ("filtered", mask)):
+        exact = timed(lambda q: exact_search(matrix, q, args.top_k, query_mask), queries)
+        runs = {"exact": {"recall": 1.0, "p50_ms": exact["p50_ms"], "p99_ms": exact["p99_ms"]}}
+        for n_probe in (int(p) for p in args.probes.split(",")):
+            index.n_probe = n_probe
+            ivf = timed(lambda q: [r for r, _ in index.search(q, args.top_k, vectors, query_mask)], queries)
+            runs[f"ivf_probe_{n_probe}"] = {
+                "recall": recall(ivf["results"], exact["results"]),
+                "p50_ms": ivf["p50_ms"],
+                "p99_ms": ivf["p99_ms"],
+            }
+        report[name] = runs
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
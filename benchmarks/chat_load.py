@@ -0,0 +1,175 @@
+"""
+Load test of POST /chat at a fixed concurrency. The backend is started with
+uvicorn on the local model stand-ins (or an already running one is used
+with --url), and every worker sends its next question as soon as the
+previous answer arrives.
+
+Run from the repository root (local model stand-ins, no API key needed):
+
+    python -m benchmarks.chat_load --concurrency 16 --requests 400
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from collections import Counter
+from typing import Any, Dict, Optional
+import httpx
+from benchmarks.common import VOCABULARY, latency_stats, use_local_environment, write_synthetic_pdf
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_server(port: int, workdir: str, input_file: str, timeout: float) -> subprocess.Popen:
+    """
+    Start the backend with uvicorn and wait until /health/ready answers 200.
+
+    :param port: Port to bind
+    :param workdir: Scratch directory (server log, indices and caches)
+    :param input_file: PDF to serve
+    :param timeout: Seconds to wait for readiness
+    :return: Server process
+    """
+    env = {**os.environ, "CORPUS_FILES": input_file}
+    log = open(os.path.join(workdir, "server.log"), "w")
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "backend.app.main:app", "--host", "127.0.0.1", "--port", str(port),
+         "--log-level", "warning"],
+        env=env, stdout=log, stderr=subprocess.STDOUT,
+    )
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if server.poll() is not None:
+            raise RuntimeError(f"Server exited with {server.returncode}, see {log.name}")
+        try:
+            if httpx.get(f"http://127.0.0.1:{port}/health/ready", timeout=1).status_code == 200:
+                return server
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.2)
+    server.terminate()
+    raise TimeoutError(f"Server not ready after {timeout}s, see {log.name}")
+
+
+async def load(url: str, concurrency: int, requests: int, seed: int = 0) -> Dict[str, Any]:
+    """
+    Send `requests` questions to /chat from `concurrency` workers.
+
+    :param url: Base URL of the backend
+    :param concurrency: Requests in flight at once
+    :param requests: Total number of requests
+    :param seed: Random seed of the questions
+    :return: Dictionary with throughput, status codes and latency statistics
+    """
+    rng = random.Random(seed)
+    questions = [
+        ("Summarize " if rng.random() < 0.2 else "What does the paper say about ")
+        + " ".join(rng.choice(VOCABULARY) for _ in range(4))
+        for _ in range(requests)
+    ]
+    remaining = iter(questions)
+    timings, statuses = [], Counter()
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+
+    async with httpx.AsyncClient(base_url=url, timeout=300, limits=limits) as client:
+        async def worker() -> None:
+            for question in remaining:
+                start = time.perf_counter()
+                try:
+                    response = await client.post("/chat", json={"user_input": question})
+                    statuses[str(response.status_code)] += 1
+                except httpx.HTTPError as e:
+                    statuses[type(e).__name__] += 1
+                timings.append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        wall = time.perf_counter() - start
+    return {
+        "concurrency": concurrency,
+        "requests": requests,
+        "wall_s": round(wall, 3),
+        "throughput_rps": round(requests / wall, 2),
+        "status": dict(statuses),
+        "latency": latency_stats(timings),
+    }
+
+
+def run(concurrency: int, requests: int, warmup: int, workdir: str, pages: int,
+        input_file: str = "", url: Optional[str] = None, ready_timeout: float = 600) -> Dict[str, Any]:
+    """
+    Start the backend (unless `url` is given), warm it up and load-test /chat.
+
+    :param concurrency: Requests in flight at once
+    :param requests: Timed requests
+    :param warmup: Untimed requests sent first
+    :param workdir: Scratch directory
+    :param pages: Pages of the synthetic PDF (if no input file is given)
+    :param input_file: PDF to serve instead of a synthetic one
+    :param url: Base URL of an already running backend
+    :param ready_timeout: Seconds to wait for the backend to be ready
+    :return: Load test results
+    """
+    server = None
+    if url is None:
+        input_file = input_file or write_synthetic_pdf(os.path.join(workdir, f"synthetic-{pages}.pdf"), pages)
+        port = free_port()
+        server = start_server(port, workdir, os.path.abspath(input_file), ready_timeout)
+        url = f"http://127.0.0.1:{port}"
+    try:
+        if warmup:
+            asyncio.run(load(url, concurrency, warmup, seed=1))
+        result = asyncio.run(load(url, concurrency, requests))
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait(timeout=30)
+    result["model_latency"] = {
+        key: os.environ.get(key) for key in ("LOCAL_LLM_LATENCY_MS", "LOCAL_LLM_TOKENS_PER_S", "LOCAL_EMBED_LATENCY_MS")
+    }
+    return result
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--requests", type=int, default=400)
+    parser.add_argument("--warmup", type=int, default=32)
+    parser.add_argument("--pages", type=int, default=50, help="pages of the synthetic PDF")
+    parser.add_argument("--input-file", default="", help="serve this PDF instead of a synthetic one")
+    parser.add_argument("--url", default=None, help="load-test a running backend instead of starting one")
+    parser.add_argument("--llm-latency-ms", default="50", help="time to first token of the local LLM")
+    parser.add_argument("--llm-tokens-per-s", default="200", help="generation rate of the local LLM")
+    parser.add_argument("--embed-latency-ms", default="5", help="latency of every local embedding call")
+    parser.add_argument("--workdir", default="")
+    parser.add_argument("--output", default="", help="JSON output file (stdout if not given)")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        workdir = args.workdir or tmp
+        use_local_environment(
+            workdir,
+            LOCAL_LLM_LATENCY_MS=args.llm_latency_ms,
+            LOCAL_LLM_TOKENS_PER_S=args.llm_tokens_per_s,
+            LOCAL_EMBED_LATENCY_MS=args.embed_latency_ms,
+        )
+        result = run(args.concurrency, args.requests, args.warmup, workdir, args.pages, args.input_file, args.url)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(result, f, indent=2)
+    else:
+        print(json.dumps(result, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,202 @@
+"""
+Compare chunking strategies on one document: it is parsed once, then
+re-chunked, embedded and indexed under every strategy of the grid, and
+each index answers a labelled question set on the local model stand-ins.
+Per strategy the result has the number of nodes, the size of the persisted
+index, the build time, the retrieval latency, the prompt tokens per answer
+and the hit rate (share of questions whose labelled page is among the
+retrieved nodes, and among the nodes the LLM reads).
+
+Strategies are written `sentence:<chunk size>:<overlap>`,
+`sentence_window:<window size>` or `hierarchical:<size>+<size>[+...]`
+(largest first). Run from the repository root (no API key needed):
+
+    python -m benchmarks.chunking --pages 50 --questions 200
+    python -m benchmarks.chunking --input-file paper.pdf --questions-file labelled.jsonl
+
+A questions file has one {"question": ..., "page_label": ...} object per line.
+"""
+import argparse
+import json
+import os
+import tempfile
+import time
+from typing import Any, Dict, List, Tuple
+from benchmarks.common import latency_stats, synthetic_questions, use_local_environment, write_synthetic_pdf
+
+DEFAULT_STRATEGIES = (
+    "sentence:1024:200,sentence:512:100,sentence:256:20,"
+    "sentence_window:3,sentence_window:1,hierarchical:1024+256,hierarchical:2048+512+128"
+)
+
+
+def parse_strategy(spec: str) -> Tuple[str, Dict[str, Any]]:
+    """
+    Parse a strategy of the grid into the arguments of `get_node_parser`.
+
+    :param spec: Strategy, e.g. "sentence:512:100"
+    :return: Tuple of the strategy and its keyword arguments
+    """
+    name, *params = spec.split(":")
+    if name == "sentence":
+        return name, {"chunk_size": int(params[0]), "chunk_overlap": int(params[1]) if len(params) > 1 else 0}
+    if name == "sentence_window":
+        return name, {"window_size": int(params[0])}
+    if name == "hierarchical":
+        return name, {"chunk_sizes": [int(size) for size in params[0].split("+")]}
+    raise ValueError(f"Unknown chunking strategy: {spec}")
+
+
+def directory_size(path: str) -> int:
+    return sum(os.path.getsize(os.path.join(root, f)) for root, _, files in os.walk(path) for f in files)
+
+
+def run_strategy(spec: str, documents: List[Any], questions: List[Dict[str, str]], workdir: str) -> Dict[str, Any]:
+    """
+    Chunk, embed and index the documents under one strategy and answer the questions.
+
+    :param spec: Strategy of the grid
+    :param documents: Parsed page documents
+    :param questions: Labelled questions
+    :param workdir: Scratch directory
+    :return: Dictionary of index size, build time, latency, tokens and hit rates
+    """
+    from llama_index.core import VectorStoreIndex
+    from llama_index.core.query_engine import RetrieverQueryEngine
+    from backend.app.chunking import get_context_postprocessor, get_node_parser
+    from backend.app.config import (
+        EMBED_BATCH_SIZE, EMBED_CONCURRENCY, RETRIEVAL_MODE, HYBRID_CANDIDATES, RRF_K, BM25_K1, BM25_B,
+        CONTEXT_BUDGET_ENABLED, CONTEXT_CANDIDATES, CONTEXT_MIN_NODES, CONTEXT_MAX_NODES,
+        CONTEXT_SCORE_GAP, CONTEXT_DEDUP_THRESHOLD, CONTEXT_MMR_LAMBDA, CONTEXT_TOKEN_BUDGET,
+    )
+    from backend.app.context_budget import ContextBudgeter
+    from backend.app.hybrid import BM25Index, HybridRetriever
+    from backend.app.instrumentation import LLM_TOKENS
+    from backend.app.metadata_index import MetadataIndex, MetadataIndexRetriever
+    from backend.app.models import create_embed_model
+    from backend.app.pipeline import IngestionPipeline
+
+    strategy, params = parse_strategy(spec)
+    embed_model = create_embed_model()
+    pipeline = IngestionPipeline(
+        get_node_parser(strategy, **params), embed_model,
+        embed_batch_size=EMBED_BATCH_SIZE, embed_concurrency=EMBED_CONCURRENCY,
+    )
+    start = time.perf_counter()
+    nodes = list(pipeline.embed(pipeline.iter_nodes(documents)))
+    vector_index = VectorStoreIndex(nodes, embed_model=embed_model)
+    metadata_index = MetadataIndex.from_vector_index(vector_index)
+    if RETRIEVAL_MODE == "hybrid":
+        bm25_index = BM25Index.from_docstore(metadata_index.node_ids, vector_index.docstore, k1=BM25_K1, b=BM25_B)
+    build_s = time.perf_counter() - start
+    persist_dir = os.path.join(workdir, spec.replace(":", "-").replace("+", "-"))
+    vector_index.storage_context.persist(persist_dir)
+
+    postprocessors: List[Any] = [p for p in (get_context_postprocessor(strategy),) if p is not None]
+    top_k = 2
+    if CONTEXT_BUDGET_ENABLED:
+        top_k = max(2, CONTEXT_CANDIDATES)
+        postprocessors.append(ContextBudgeter(
+            metadata_index, min_nodes=CONTEXT_MIN_NODES, max_nodes=CONTEXT_MAX_NODES,
+            score_gap=CONTEXT_SCORE_GAP, dedup_threshold=CONTEXT_DEDUP_THRESHOLD,
+            mmr_lambda=CONTEXT_MMR_LAMBDA, token_budget=CONTEXT_TOKEN_BUDGET, baseline_k=2,
+        ))
+    if RETRIEVAL_MODE == "hybrid":
+        retriever = HybridRetriever(metadata_index, bm25_index, vector_index.docstore, embed_model,
+                                    similarity_top_k=top_k, candidate_k=HYBRID_CANDIDATES, rrf_k=RRF_K)
+    else:
+        retriever = MetadataIndexRetriever(metadata_index, vector_index.docstore, embed_model, similarity_top_k=top_k)
+    query_engine = RetrieverQueryEngine.from_args(retriever, node_postprocessors=postprocessors)
+
+    timings, hits = [], 0
+    for item in questions:
+        start = time.perf_counter()
+        retrieved = retriever.retrieve(item["question"])
+        timings.append(time.perf_counter() - start)
+        hits += any(n.node.metadata.get("page_label") == item["page_label"] for n in retrieved)
+
+    prompt_tokens = LLM_TOKENS.values.get(("prompt",), 0.0)
+    context_hits, context_nodes = 0, 0
+    for item in questions:
+        response = query_engine.query(item["question"])
+        context_nodes += len(response.source_nodes)
+        context_hits += any(n.node.metadata.get("page_label") == item["page_label"] for n in response.source_nodes)
+    prompt_tokens = LLM_TOKENS.values.get(("prompt",), 0.0) - prompt_tokens
+
+    return {
+        "strategy": strategy,
+        **params,
+        "nodes": len(nodes),
+        "index_bytes": directory_size(persist_dir),
+        "build_s": round(build_s, 3),
+        "retrieve": latency_stats(timings),
+        "hit_rate": round(hits / len(questions), 3),
+        "context_hit_rate": round(context_hits / len(questions), 3),
+        "context_nodes_per_answer": round(context_nodes / len(questions), 2),
+        "prompt_tokens_per_answer": round(prompt_tokens / len(questions), 1),
+    }
+
+
+def run(strategies: List[str], pages: int, count: int, workdir: str, input_file: str = "",
+        questions_file: str = "") -> Dict[str, Any]:
+    """
+    Parse the document once and compare the chunking strategies on it.
+
+    :param strategies: Strategies of the grid
+    :param pages: Pages of the synthetic PDF (if no input file is given)
+    :param count: Questions generated for the synthetic PDF
+    :param workdir: Scratch directory
+    :param input_file: PDF to chunk instead of a synthetic one
+    :param questions_file: Labelled questions of the input file (JSON lines)
+    :return: Dictionary of results per strategy
+    """
+    from llama_index.core import Settings
+    from backend.app.models import callback_manager, get_llm
+    from backend.app.pipeline import IngestionPipeline
+
+    Settings.llm = get_llm()
+    Settings.callback_manager = callback_manager
+    if input_file:
+        with open(questions_file) as f:
+            questions = [json.loads(line) for line in f if line.strip()]
+    else:
+        input_file = write_synthetic_pdf(os.path.join(workdir, f"synthetic-{pages}.pdf"), pages)
+        questions = synthetic_questions(pages, count)
+    start = time.perf_counter()
+    documents = list(IngestionPipeline(None, None).iter_documents([input_file]))
+    parse_s = time.perf_counter() - start
+    return {
+        "pages": len(documents),
+        "questions": len(questions),
+        "parse_s": round(parse_s, 3),
+        "strategies": {spec: run_strategy(spec, documents, questions, workdir) for spec in strategies},
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--strategies", default=DEFAULT_STRATEGIES, help="comma separated strategies")
+    parser.add_argument("--pages", type=int, default=50, help="pages of the synthetic PDF")
+    parser.add_argument("--questions", type=int, default=200, help="questions generated for the synthetic PDF")
+    parser.add_argument("--input-file", default="", help="chunk this PDF instead of a synthetic one")
+    parser.add_argument("--questions-file", default="", help="labelled questions of --input-file (JSON lines)")
+    parser.add_argument("--workdir", default="")
+    parser.add_argument("--output", default="", help="JSON output file (stdout if not given)")
+    args = parser.parse_args()
+    if args.input_file and not args.questions_file:
+        parser.error("--input-file needs --questions-file")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        workdir = args.workdir or tmp
+        use_local_environment(workdir, LOCAL_LLM_LATENCY_MS="0", LOCAL_LLM_TOKENS_PER_S="0")
+        result = run(args.strategies.split(","), args.pages, args.questions, workdir, args.input_file,
+                     args.questions_file)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(result, f, indent=2)
+    else:
+        print(json.dumps(result, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+"""
+Cold start of LlamaIndexChatbot and Chat: import plus construction time,
+measured in a fresh process for every scenario.
+
+- cold: no persisted indices and an empty embedding cache
+- embeddings_cached: no persisted indices, embeddings already cached
+- warm: persisted indices reused (LlamaIndexChatbot only)
+
+Run from the repository root (local model stand-ins, no API key needed):
+
+    python -m benchmarks.cold_start --pages 50 --output cold_start.json
+"""
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Any, Dict
+from benchmarks.common import use_local_environment, write_synthetic_pdf
+
+SCENARIOS = {
+    "chatbot": ("cold", "embeddings_cached", "warm"),
+    "chat": ("cold", "embeddings_cached"),
+}
+
+
+def child(kind: str, input_file: str, workdir: str) -> Dict[str, float]:
+    """
+    Import the backend and build one chatbot, in this (fresh) process.
+
+    :param kind: "chatbot" (LlamaIndexChatbot) or "chat" (Chat)
+    :param input_file: PDF to index
+    :param workdir: Scratch directory of the scenario
+    :return: Dictionary with import, build and total seconds
+    """
+    start = time.perf_counter()
+    use_local_environment(workdir)
+    if kind == "chatbot":
+        from backend.app.chatbot import LlamaIndexChatbot
+        imported = time.perf_counter()
+        LlamaIndexChatbot([input_file])
+    else:
+        from backend.app.bot import Chat
+        imported = time.perf_counter()
+        Chat([input_file])
+    end = time.perf_counter()
+    return {"import_s": round(imported - start, 3), "build_s": round(end - imported, 3), "total_s": round(end - start, 3)}
+
+
+def measure(kind: str, input_file: str, workdir: str) -> Dict[str, Any]:
+    with tempfile.NamedTemporaryFile(suffix=".json") as out:
+        subprocess.run(
+            [sys.executable, "-m", "benchmarks.cold_start", "--child", kind,
+             "--input-file", input_file, "--workdir", workdir, "--output", out.name],
+            check=True, stdout=subprocess.DEVNULL,
+        )
+        with open(out.name) as f:
+            return json.load(f)
+
+
+def run(pages: int, workdir: str, input_file: str = "") -> Dict[str, Any]:
+    """
+    Measure every scenario of both chatbots.
+
+    :param pages: Pages of the synthetic PDF (if no input file is given)
+    :param workdir: Scratch directory
+    :param input_file: PDF to index instead of a synthetic one
+    :return: Dictionary of chatbot kinds, scenarios and timings
+    """
+    input_file = input_file or write_synthetic_pdf(os.path.join(workdir, f"synthetic-{pages}.pdf"), pages)
+    results: Dict[str, Any] = {"input_file": os.path.basename(input_file)}
+    for kind, scenarios in SCENARIOS.items():
+        scenario_dir = os.path.join(workdir, kind)
+        shutil.rmtree(scenario_dir, ignore_errors=True)
+        results[kind] = {}
+        for scenario in scenarios:
+            if scenario == "embeddings_cached":
+                shutil.rmtree(os.path.join(scenario_dir, "storage"), ignore_errors=True)
+            results[kind][scenario] = measure(kind, os.path.abspath(input_file), scenario_dir)
+    return results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pages", type=int, default=50, help="pages of the synthetic PDF")
+    parser.add_argument("--input-file", default="", help="index this PDF instead of a synthetic one")
+    parser.add_argument("--workdir", default="")
+    parser.add_argument("--output", default="", help="JSON output file (stdout if not given)")
+    parser.add_argument("--child", choices=sorted(SCENARIOS), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        result = child(args.child, args.input_file, args.workdir)
+    else:
+        with tempfile.TemporaryDirectory() as tmp:
+            result = run(args.pages, args.workdir or tmp, args.input_file)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(result, f, indent=2)
+    else:
+        print(json.dumps(result, indent=2))
+
+
+if __name__ == "__main__":
+    main()
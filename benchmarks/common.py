@@ -0,0 +1,162 @@
+"""
+Helpers shared by the benchmarks: the offline environment, synthetic PDFs,
+latency statistics and run metadata.
+"""
+import os
+import platform
+import random
+import subprocess
+import sys
+import time
+from typing import Dict, List, Optional
+
+VOCABULARY = (
+    "attention encoder decoder layer head query key value softmax embedding position token sequence "
+    "translation model training batch gradient optimizer learning rate dropout residual normalization "
+    "feed forward network parameter beam search score result table figure section dataset corpus "
+    "english german french vocabulary length complexity recurrent convolution parallel hardware step"
+).split()
+
+
+def use_local_environment(workdir: str, **overrides: str) -> None:
+    """
+    Point the backend at local model stand-ins and a scratch storage
+    directory. The backend reads its configuration on import, so this must
+    run before any `backend.app` module is imported.
+
+    :param workdir: Scratch directory for indices and caches
+    :param overrides: Further environment variables
+    """
+    os.makedirs(workdir, exist_ok=True)
+    defaults = {
+        "MODEL_PROVIDER": "local",
+        "INDEX_PERSIST_DIR": os.path.join(workdir, "storage"),
+        "EMBED_CACHE_PATH": os.path.join(workdir, "embeddings.sqlite3"),
+        "RESPONSE_CACHE_ENABLED": "false",
+    }
+    for key, value in {**defaults, **overrides}.items():
+        os.environ.setdefault(key, value)
+
+
+def synthetic_page(rng: random.Random, page: int, lines: int = 45, words_per_line: int = 12) -> List[str]:
+    text = [f"Section {page}. {' '.join(rng.choice(VOCABULARY) for _ in range(4)).capitalize()}"]
+    for _ in range(lines):
+        text.append(" ".join(rng.choice(VOCABULARY) for _ in range(words_per_line)) + ".")
+    return text
+
+
+def synthetic_pages(pages: int, seed: int = 0) -> List[List[str]]:
+    rng = random.Random(seed)
+    return [synthetic_page(rng, page + 1) for page in range(pages)]
+
+
+def synthetic_questions(pages: int, count: int, seed: int = 0, words: int = 8) -> List[Dict[str, str]]:
+    """
+    Build a labelled question set for the PDF `write_synthetic_pdf` writes
+    with the same pages and seed: every question quotes `words` consecutive
+    words of one sentence and is labelled with the page it comes from.
+
+    :param pages: Number of pages of the PDF
+    :param count: Number of questions
+    :param seed: Random seed the PDF was written with
+    :param words: Words quoted per question
+    :return: List of {"question", "page_label"} dictionaries
+    """
+    texts = synthetic_pages(pages, seed)
+    rng = random.Random(seed + 1)
+    questions = []
+    for _ in range(count):
+        page = rng.randrange(pages)
+        sentence = rng.choice(texts[page][1:]).rstrip(".").split()
+        start = rng.randrange(len(sentence) - words + 1)
+        questions.append({
+            "question": "What does the paper say about " + " ".join(sentence[start:start + words]) + "?",
+            "page_label": str(page + 1),
+        })
+    return questions
+
+
+def write_synthetic_pdf(path: str, pages: int, seed: int = 0) -> str:
+    """
+    Write a text-only PDF of random sentences over a fixed vocabulary,
+    without any PDF library.
+
+    :param path: Output path
+    :param pages: Number of pages
+    :param seed: Random seed
+    :return: The output path
+    """
+    objects: Dict[int, bytes] = {3: b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>"}
+    kids = []
+    for page, lines in enumerate(synthetic_pages(pages, seed)):
+        page_id, content_id = 4 + 2 * page, 5 + 2 * page
+        escaped = (line.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)") for line in lines)
+        stream = "BT /F1 10 Tf 14 TL 50 750 Td " + " ".join(f"({line}) Tj T*" for line in escaped) + " ET"
+        data = stream.encode("latin-1")
+        objects[content_id] = b"<< /Length %d >>\nstream\n%s\nendstream" % (len(data), data)
+        objects[page_id] = (
+            b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] "
+            b"/Resources << /Font << /F1 3 0 R >> >> /Contents %d 0 R >>" % content_id
+        )
+        kids.append(b"%d 0 R" % page_id)
+    objects[1] = b"<< /Type /Catalog /Pages 2 0 R >>"
+    objects[2] = b"<< /Type /Pages /Kids [%s] /Count %d >>" % (b" ".join(kids), pages)
+
+    out = bytearray(b"%PDF-1.4\n")
+    offsets = {}
+    for obj_id in sorted(objects):
+        offsets[obj_id] = len(out)
+        out += b"%d 0 obj\n%s\nendobj\n" % (obj_id, objects[obj_id])
+    xref = len(out)
+    out += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    out += b"".join(b"%010d 00000 n \n" % offsets[obj_id] for obj_id in sorted(objects))
+    out += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref)
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path, "wb") as f:
+        f.write(out)
+    return path
+
+
+def latency_stats(timings: List[float]) -> Dict[str, Optional[float]]:
+    """
+    Summarize latencies.
+
+    :param timings: Latencies in seconds
+    :return: Dictionary with count, mean, p50, p90, p99 and max in milliseconds
+    """
+    if not timings:
+        return {"count": 0, "mean_ms": None, "p50_ms": None, "p90_ms": None, "p99_ms": None, "max_ms": None}
+    ordered = sorted(t * 1000 for t in timings)
+
+    def percentile(p: float) -> float:
+        return round(ordered[min(len(ordered) - 1, int(p * len(ordered)))], 3)
+
+    return {
+        "count": len(ordered),
+        "mean_ms": round(sum(ordered) / len(ordered), 3),
+        "p50_ms": percentile(0.5),
+        "p90_ms": percentile(0.9),
+        "p99_ms": percentile(0.99),
+        "max_ms": round(ordered[-1], 3),
+    }
+
+
+def run_metadata() -> Dict[str, str]:
+    """
+    Describe the run, so results can be compared between commits.
+
+    :return: Dictionary with the commit, timestamp, Python version and machine
+    """
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = "unknown"
+    return {
+        "commit": commit,
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "python": sys.version.split()[0],
+        "platform": platform.platform(),
+        "cpus": str(os.cpu_count()),
+    }
@@ -0,0 +1,64 @@
+"""
+Micro-benchmark of the per-call overhead of VectorQueryTool.vector_query
+with and without the query engine pool.
+
+Run from the repository root (no API key needed, local mock models are used):
+
+    python -m benchmarks.engine_pool --calls 2000
+"""
+import argparse
+import random
+import time
+from statistics import mean, median
+from llama_index.core import MockEmbedding, Settings
+from llama_index.core.llms import MockLLM
+from backend.app.call_tools import VectorQueryTool
+
+
+def bench(fn, calls: int) -> dict:
+    timings = []
+    for _ in range(calls):
+        start = time.perf_counter()
+        fn()
+        timings.append((time.perf_counter() - start) * 1e6)
+    timings.sort()
+    return {
+        "mean_us": round(mean(timings), 1),
+        "p50_us": round(median(timings), 1),
+        "p99_us": round(timings[int(len(timings) * 0.99) - 1], 1),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--input-file", default="transformers.pdf")
+    parser.add_argument("--calls", type=int, default=2000)
+    parser.add_argument("--filter-sets", type=int, default=8, help="distinct page filter combinations")
+    args = parser.parse_args()
+
+    Settings.llm = MockLLM(max_tokens=1)
+    tool = VectorQueryTool(input_files=[args.input_file], embed_model=MockEmbedding(embed_dim=1536))
+    labels = sorted({n.metadata["page_label"] for n in tool.nodes})
+    rng = random.Random(0)
+    filter_sets = [rng.sample(labels, k=rng.randint(0, min(3, len(labels)))) for _ in range(args.filter_sets)]
+
+    def pick():
+        return filter_sets[rng.randrange(len(filter_sets))]
+
+    results = {
+        "engine_only": {
+            "rebuild": bench(lambda: tool.build_query_engine(tool.similarity_top_k, tuple(pick())), args.calls),
+            "pooled": bench(lambda: tool.get_query_engine(pick()), args.calls),
+        },
+        "retrieve": {
+            "rebuild": bench(lambda: tool.build_query_engine(tool.similarity_top_k, tuple(pick())).retrieve("attention heads"), args.calls),
+            "pooled": bench(lambda: tool.get_query_engine(pick()).retrieve("attention heads"), args.calls),
+        },
+        "pool": tool.engine_pool.stats(),
+    }
+    for name, result in results.items():
+        print(name, result)
+
+
+if __name__ == "__main__":
+    main()
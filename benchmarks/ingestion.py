@@ -0,0 +1,68 @@
+"""
+Ingestion throughput (parse, split, embed) on synthetic PDFs of increasing
+size, with an empty embedding cache for every size.
+
+Run from the repository root (local model stand-ins, no API key needed):
+
+    python -m benchmarks.ingestion --pages 10,100,1000 --embed-latency-ms 20
+"""
+import argparse
+import json
+import os
+import tempfile
+from typing import Any, Dict, List
+from benchmarks.common import use_local_environment, write_synthetic_pdf
+
+
+def run(sizes: List[int], workdir: str) -> Dict[str, Any]:
+    """
+    Ingest one synthetic PDF per size through the chatbot's pipeline settings.
+
+    :param sizes: Page counts
+    :param workdir: Scratch directory
+    :return: Dictionary of page counts and pipeline reports
+    """
+    from backend.app.chunking import get_node_parser
+    from backend.app.config import PARSE_WORKERS, EMBED_BATCH_SIZE, EMBED_CONCURRENCY
+    from backend.app.embedding_cache import CachedEmbedding, EmbeddingCache
+    from backend.app.models import create_embed_model
+    from backend.app.pipeline import IngestionPipeline
+
+    results: Dict[str, Any] = {}
+    for pages in sizes:
+        path = write_synthetic_pdf(os.path.join(workdir, f"synthetic-{pages}.pdf"), pages, seed=pages)
+        cache = EmbeddingCache(os.path.join(workdir, f"embeddings-{pages}.sqlite3"))
+        pipeline = IngestionPipeline(
+            get_node_parser(),
+            CachedEmbedding(create_embed_model(), cache),
+            parse_workers=PARSE_WORKERS,
+            embed_batch_size=EMBED_BATCH_SIZE,
+            embed_concurrency=EMBED_CONCURRENCY,
+        )
+        for _ in pipeline.run([path]):
+            pass
+        results[str(pages)] = {"bytes": os.path.getsize(path), **pipeline.stats.report()}
+    return results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pages", default="10,100,1000", help="comma separated page counts")
+    parser.add_argument("--embed-latency-ms", type=float, default=20.0, help="simulated latency of every embedding call")
+    parser.add_argument("--workdir", default="")
+    parser.add_argument("--output", default="", help="JSON output file (stdout if not given)")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        workdir = args.workdir or tmp
+        use_local_environment(workdir, LOCAL_EMBED_LATENCY_MS=str(args.embed_latency_ms))
+        result = run([int(p) for p in args.pages.split(",")], workdir)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(result, f, indent=2)
+    else:
+        print(json.dumps(result, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+"""
+Per-query latency of VectorQueryTool.vector_query with and without page
+filters: retrieval only, and the full query with an instant local LLM (so
+only the backend's own overhead is measured). Batch retrieval of the same
+number of queries (one embedding call, one matrix product) is timed too.
+
+Run from the repository root (local model stand-ins, no API key needed):
+
+    python -m benchmarks.retrieval --pages 200 --queries 500
+"""
+import argparse
+import json
+import os
+import random
+import tempfile
+import time
+from typing import Any, Callable, Dict, List
+from benchmarks.common import VOCABULARY, latency_stats, use_local_environment, write_synthetic_pdf
+
+
+def timed(fn: Callable[[str, List[str]], Any], calls: List[tuple]) -> Dict[str, Any]:
+    timings = []
+    for query, pages in calls:
+        start = time.perf_counter()
+        fn(query, pages)
+        timings.append(time.perf_counter() - start)
+    return latency_stats(timings)
+
+
+def run(pages: int, queries: int, workdir: str, input_file: str = "") -> Dict[str, Any]:
+    """
+    Build a VectorQueryTool and time its queries.
+
+    :param pages: Pages of the synthetic PDF (if no input file is given)
+    :param queries: Timed queries per variant
+    :param workdir: Scratch directory
+    :param input_file: PDF to index instead of a synthetic one
+    :return: Dictionary of variants and latency statistics
+    """
+    from llama_index.core import Settings
+    from llama_index.core.schema import QueryBundle
+    from backend.app.call_tools import VectorQueryTool
+    from backend.app.models import get_llm
+
+    Settings.llm = get_llm()
+    input_file = input_file or write_synthetic_pdf(os.path.join(workdir, f"synthetic-{pages}.pdf"), pages)
+    start = time.perf_counter()
+    tool = VectorQueryTool(input_files=[input_file])
+    build_s = time.perf_counter() - start
+
+    labels = sorted({n.metadata["page_label"] for n in tool.nodes})
+    rng = random.Random(0)
+
+    def calls(filtered: bool) -> List[tuple]:
+        return [
+            (" ".join(rng.choice(VOCABULARY) for _ in range(6)),
+             rng.sample(labels, k=rng.randint(1, min(3, len(labels)))) if filtered else [])
+            for _ in range(queries)
+        ]
+
+    def retrieve(query: str, page_numbers: List[str]) -> Any:
+        return tool.get_query_engine(page_numbers).retrieve(QueryBundle(query))
+
+    def retrieve_batch(batch: List[tuple]) -> Dict[str, Any]:
+        start = time.perf_counter()
+        tool.get_query_engine([]).retriever.retrieve_batch([QueryBundle(query) for query, _ in batch])
+        total = time.perf_counter() - start
+        return {"queries": len(batch), "total_ms": round(total * 1000, 3), "per_query_ms": round(total * 1000 / len(batch), 3)}
+
+    for query, page_numbers in calls(True)[:20] + calls(False)[:20]:
+        tool.vector_query(query, page_numbers)
+    return {
+        "nodes": len(tool.nodes),
+        "build_s": round(build_s, 3),
+        "retrieve": {"unfiltered": timed(retrieve, calls(False)), "filtered": timed(retrieve, calls(True))},
+        "retrieve_batch": retrieve_batch(calls(False)),
+        "vector_query": {
+            "unfiltered": timed(tool.vector_query, calls(False)),
+            "filtered": timed(tool.vector_query, calls(True)),
+        },
+        "engine_pool": tool.engine_pool.stats(),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pages", type=int, default=200, help="pages of the synthetic PDF")
+    parser.add_argument("--input-file", default="", help="index this PDF instead of a synthetic one")
+    parser.add_argument("--queries", type=int, default=500, help="timed queries per variant")
+    parser.add_argument("--workdir", default="")
+    parser.add_argument("--output", default="", help="JSON output file (stdout if not given)")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        workdir = args.workdir or tmp
+        use_local_environment(workdir, LOCAL_LLM_LATENCY_MS="0", LOCAL_LLM_TOKENS_PER_S="0")
+        result = run(args.pages, args.queries, workdir, args.input_file)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(result, f, indent=2)
+    else:
+        print(json.dumps(result, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+"""
+Run the benchmark suite (cold start, ingestion, retrieval, chunking
+strategies and the /chat load test) on the local model stand-ins and write
+one JSON document with the results and the commit they were measured on. Every benchmark runs in
+its own process, since the backend reads its configuration on import.
+
+Run from the repository root (no API key or network needed):
+
+    python -m benchmarks.run --output results.json
+    python -m benchmarks.run --quick --baseline results.json
+
+With --baseline, timings (keys ending in _s or _ms) that got more than
+--tolerance slower, and rates (_per_s, _rps) that dropped by more than it,
+are listed, and the exit status is 1 if there are any.
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+from typing import Any, Dict, Iterator, List, Tuple
+from benchmarks.common import run_metadata
+
+SUITE = {
+    "cold_start": (["--pages", "50"], ["--pages", "10"]),
+    "ingestion": (["--pages", "10,100,1000"], ["--pages", "10,100"]),
+    "retrieval": (["--pages", "200", "--queries", "500"], ["--pages", "50", "--queries", "100"]),
+    "chunking": (["--pages", "50", "--questions", "200"], ["--pages", "10", "--questions", "40"]),
+    "chat_load": (["--concurrency", "16", "--requests", "400"], ["--concurrency", "8", "--requests", "80", "--pages", "10"]),
+}
+
+
+def run_benchmark(name: str, args: List[str]) -> Dict[str, Any]:
+    with tempfile.TemporaryDirectory() as tmp:
+        output = os.path.join(tmp, f"{name}.json")
+        subprocess.run(
+            [sys.executable, "-m", f"benchmarks.{name}", *args, "--workdir", tmp, "--output", output],
+            check=True, stdout=subprocess.DEVNULL,
+        )
+        with open(output) as f:
+            return json.load(f)
+
+
+def flatten(result: Any, prefix: str = "") -> Iterator[Tuple[str, float]]:
+    if isinstance(result, dict):
+        for key, value in result.items():
+            yield from flatten(value, f"{prefix}.{key}" if prefix else key)
+    elif isinstance(result, (int, float)) and not isinstance(result, bool):
+        yield prefix, float(result)
+
+
+def regressions(results: Dict[str, Any], baseline: Dict[str, Any], tolerance: float) -> List[Dict[str, Any]]:
+    """
+    Compare the results with a baseline run.
+
+    :param results: Results of this run
+    :param baseline: Results of the baseline run
+    :param tolerance: Allowed relative change, e.g. 0.2 for 20%
+    :return: List of the metrics that regressed, with both values
+    """
+    before = dict(flatten(baseline))
+    found = []
+    for key, value in flatten(results):
+        old = before.get(key)
+        if key.startswith("meta.") or not old:
+            continue
+        higher_is_better = key.endswith(("_per_s", "_rps"))
+        if higher_is_better:
+            regressed = value < old * (1 - tolerance)
+        elif key.endswith(("_s", "_ms")):
+            regressed = value > old * (1 + tolerance)
+        else:
+            continue
+        if regressed:
+            found.append({"metric": key, "baseline": old, "current": value, "change": round(value / old - 1, 3)})
+    return found
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--only", default=",".join(SUITE), help="comma separated benchmarks to run")
+    parser.add_argument("--quick", action="store_true", help="smaller inputs, for CI")
+    parser.add_argument("--output", default="", help="JSON output file (stdout if not given)")
+    parser.add_argument("--baseline", default="", help="results of an earlier run to compare with")
+    parser.add_argument("--tolerance", type=float, default=0.2)
+    args = parser.parse_args()
+
+    results: Dict[str, Any] = {"meta": {**run_metadata(), "quick": args.quick}}
+    for name in args.only.split(","):
+        full, quick = SUITE[name]
+        print(f"Running {name}...", file=sys.stderr)
+        results[name] = run_benchmark(name, quick if args.quick else full)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        results["regressions"] = regressions(results, baseline, args.tolerance)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+    else:
+        print(json.dumps(results, indent=2))
+    if results.get("regressions"):
+        for regression in results["regressions"]:
+            print(f"Regression: {regression}", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
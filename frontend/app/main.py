@@ -1,4 +1,5 @@
 import streamlit as st
+import json
 import requests
 from streamlit_chat import message
 from streamlit_extras.colored_header import colored_header
@@ -44,6 +45,7 @@ with input_container:
     user_input = get_text()
 
 backend_url = "http://localhost:8000/chat"  # Assuming both are running on localhost (Can be adjusted)
+backend_stream_url = "http://localhost:8000/chat/stream"
 
 def generate_response(user_input: str) -> str:
     """
@@ -58,9 +60,35 @@ def generate_response(user_input: str) -> str:
     response = requests.post(backend_url, json={"user_input": user_input})
     return response.json()["bot_response"]
 
+def stream_response(user_input: str):
+    """
+    Stream a response from the backend token by token.
+    
+    Args:
+        user_input (str): The user input.
+
+    Yields:
+        str: The response tokens as the backend produces them.
+    """
+    with requests.post(backend_stream_url, json={"user_input": user_input}, stream=True) as response:
+        response.raise_for_status()
+        for line in response.iter_lines():
+            if not line:
+                continue
+            event = json.loads(line)
+            if "token" in event:
+                yield event["token"]
+            elif "error" in event:
+                raise RuntimeError(event["error"])
+
 with response_container:
     if user_input:
-        response = generate_response(user_input)
+        placeholder = st.empty()
+        response = ""
+        for token in stream_response(user_input):
+            response += token
+            placeholder.markdown(response)
+        placeholder.empty()
         st.session_state.past.append(user_input)
         st.session_state.generated.append(response)
         